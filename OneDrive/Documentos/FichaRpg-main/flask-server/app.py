@@ -1,28 +1,181 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-from cs50 import SQL
-from back_end import Ficha, Molodoy, Atributo, Dados
+from back_end import Ficha, Atributo, Dados
+from arquivo import Arquivo
+from bestiario import Bestiario, TipoDesconhecido
+from estado_batalhas import BatalhaStore, Conflito, EstadoBatalha, ler_batalhas, ler_eventos, reconstruir
+from simulador import simular, MAX_SIMULACOES
+from probabilidades import Probabilidades
+from ranking import Ranking, resumo
+from combate import rolar_iniciativa, ataque_jogador, ataque_monstro, jogar
+from fichas import nova_ficha, inserir, inserir_lote
+from schema import migrar
+from shards import Shards
+from banco import Banco
+from cache import LRUCache
+from senhas import PoolSenhas, SenhasOcupadas, CUSTO_PADRAO
+from transmissao import Hub, formatar
+from metricas import Metricas, linhas_caches
+import atexit
+import hashlib
+import json
+import os
 import random
+import secrets
+import sqlite3
 import time 
 import datetime
 
 app = Flask(__name__)
-db = SQL("sqlite:///app.db")
+db = Banco("app.db")
 CORS(app, origins=["/*"])
+migrar(db)
+
+# fichas e batalhas divididas por usuário em SHARDS arquivos em SHARDS_PASTA (shards.py);
+# sem SHARDS tudo fica no app.db. users e monstros ficam sempre no app.db
+shards = Shards(db, int(os.environ.get("SHARDS", "0")), os.environ.get("SHARDS_PASTA", "shards"))
+
+# bônus, dano e regeneração de cada tipo de monstro (tabela monstro_tipos), compilados uma vez;
+# a tabela é relida a cada BESTIARIO_INTERVALO segundos (0 = só quando aparece um tipo novo)
+bestiario = Bestiario(db)
+if float(os.environ.get("BESTIARIO_INTERVALO", "5")) > 0:
+    bestiario.iniciar(float(os.environ.get("BESTIARIO_INTERVALO", "5")))
+
+# Estado das batalhas em memória com gravação em lote (BATALHA_STORE=1).
+# BATALHA_STORE_JANELA é quantos segundos uma mudança pode ficar sem ir para o banco.
+# Com o store ligado rode um worker só: com mais de um, turnos que já responderam 200 podem
+# ser descartados no flush (ficharpg_turnos_descartados_total no /metrics).
+store = BatalhaStore(
+    shards,
+    bestiario,
+    ativo=os.environ.get("BATALHA_STORE", "0") == "1",
+    janela=float(os.environ.get("BATALHA_STORE_JANELA", "2.0")),
+    logger=app.logger,
+)
+atexit.register(store.flush)
+
+# vitórias e derrotas por usuário, em memória e ordenadas para o /ranking; o store avisa
+# cada batalha que termina aqui, e as dos outros workers chegam relendo a tabela a cada
+# RANKING_INTERVALO segundos
+ranking = Ranking(shards.bancos)
+store.ao_terminar = ranking.atualizar
+if float(os.environ.get("RANKING_INTERVALO", "30")) > 0:
+    ranking.iniciar(float(os.environ.get("RANKING_INTERVALO", "30")))
+RANKING_MAX = 100
+
+# tabelas exatas de vitória por confronto, reaproveitadas entre requisições
+probabilidades = Probabilidades()
+
+# batalhas terminadas há mais de ARQUIVO_IDADE_H horas vão para o arquivo.db; com ARQUIVO=1
+# este processo arquiva numa thread a cada ARQUIVO_INTERVALO segundos (ou rode arquivo.py por cron)
+arquivo = Arquivo(
+    shards.bancos,
+    os.environ.get("ARQUIVO_CAMINHO", "arquivo.db"),
+    idade_min=float(os.environ.get("ARQUIVO_IDADE_H", "24")) * 3600,
+)
+if os.environ.get("ARQUIVO", "0") == "1":
+    arquivo.iniciar(float(os.environ.get("ARQUIVO_INTERVALO", "300")))
+HISTORICO_POR_PAGINA = 50
+
+# assinantes do /batalha/<id>/stream; as rotas de turno publicam cada fase jogada
+hub = Hub()
+STREAM_PING = 15   # segundos entre comentários de keep-alive no SSE
+
+# /batalha/lote: ação -> (fase em que a batalha precisa estar, mensagem quando não está)
+ACOES_TURNO = {
+    "initiative": ("initiative", "Fase inválida"),
+    "player_attack": ("player", "Não é a vez do jogador"),
+    "monster_attack": ("monster", "Não é a vez do monstro"),
+}
+ACAO_DA_FASE = {fase: acao for acao, (fase, _) in ACOES_TURNO.items()}
+MAX_LOTE = 500
+
+# hash das senhas fora das threads do Flask; SENHA_CUSTO = iterações do PBKDF2
+senhas = PoolSenhas(
+    custo=int(os.environ.get("SENHA_CUSTO", CUSTO_PADRAO)),
+    timeout=float(os.environ.get("SENHA_TIMEOUT", "5.0")),
+)
+
+# usuários por userName e por email (id, nomes e hash da senha); cada worker tem o seu,
+# então o TTL limita quanto tempo uma mudança feita em outro processo demora a aparecer
+cache_usuarios = LRUCache(max_itens=10000, ttl=300)
+
+# JSON pronto do GET /ficha, por (usuário, id da ficha, updated_at): uma ficha alterada ganha outra chave
+cache_fichas = LRUCache(max_itens=4096)
+
+# páginas de /monstros já serializadas; a chave inclui a versão da tabela
+cache_monstros = LRUCache(max_itens=512)
+MONSTROS_POR_PAGINA = 50
+MONSTROS_POR_PAGINA_MAX = 200
+
+# /metrics: latência por rota e consultas ao banco de cada requisição. METRICAS=0 desliga;
+# METRICAS_LENTO_MS loga as requisições mais lentas que isso, com as consultas que elas fizeram
+metricas = None
+if os.environ.get("METRICAS", "1") == "1":
+    lento_ms = os.environ.get("METRICAS_LENTO_MS")
+    metricas = Metricas(lento_ms=float(lento_ms) if lento_ms else None, logger=app.logger)
+    for banco in shards.todos():
+        banco.observador = metricas.consulta
+
+    @app.before_request
+    def metricas_inicio():
+        metricas.inicio()
+
+    @app.after_request
+    def metricas_status(resp):
+        g.status = resp.status_code
+        return resp
+
+    @app.teardown_request
+    def metricas_fim(exc):
+        # 404 de rota inexistente fica numa rota só, para não criar uma série por URL
+        rota = request.url_rule.rule if request.url_rule else "desconhecida"
+        metricas.fim(rota, request.method, g.get("status", 500))
+
+    @metricas.registrar
+    def metricas_estado():
+        store_stats = store.estatisticas()
+        return linhas_caches({"usuarios": cache_usuarios, "fichas": cache_fichas, "monstros": cache_monstros}) + [
+            "# HELP ficharpg_batalhas_em_memoria Batalhas guardadas no BatalhaStore.",
+            "# TYPE ficharpg_batalhas_em_memoria gauge",
+            f"ficharpg_batalhas_em_memoria {store_stats['estados']}",
+            "# HELP ficharpg_batalhas_pendentes Batalhas com mudanças ainda não gravadas no banco.",
+            "# TYPE ficharpg_batalhas_pendentes gauge",
+            f"ficharpg_batalhas_pendentes {store_stats['pendentes']}",
+            "# HELP ficharpg_turnos_descartados_total Turnos já respondidos que o flush descartou por conflito.",
+            "# TYPE ficharpg_turnos_descartados_total counter",
+            f"ficharpg_turnos_descartados_total {store_stats['turnos_descartados']}",
+            "# HELP ficharpg_stream_assinantes Conexões abertas no /batalha/<id>/stream.",
+            "# TYPE ficharpg_stream_assinantes gauge",
+            f"ficharpg_stream_assinantes {hub.total_assinantes()}",
+        ]
 
 ALLOWED_CLASSES = {"Ladino", "Guerreiro", "Bárbaro"}
 ALLOWED_RACES = {"Humano", "Elfo", "Anão", "Halfling", "Meio-Orc"}
 POOL = [15, 14, 13, 12, 10, 8]
 
 def get_user_or_email(user_or_email: str):
+    """Busca o usuário pelo userName ou pelo email. O dict devolvido vem do cache: não altere."""
+    user = cache_usuarios.get(user_or_email)
+    if user is not None:
+        return user
     rows = db.execute(
-        "SELECT id, userName, email FROM users WHERE userName = ? OR email = ? LIMIT 1",
+        "SELECT id, userName, email, password_hash FROM users WHERE userName = ? OR email = ? LIMIT 1",
         user_or_email, user_or_email
     )
-    return rows[0] if rows else None
+    if not rows:
+        return None
+    user = rows[0]
+    cache_usuarios.set(user["userName"], user)
+    cache_usuarios.set(user["email"], user)
+    return user
+
+def invalidar_usuario(*chaves):
+    """Tira do cache o usuário pelos seus userName/email; chamar sempre que a tabela users mudar."""
+    cache_usuarios.invalidar(*chaves)
 
 def definir_modificador(atributo_data):
-    atributo = Atributo(atributo_data)
+    atributo = Atributo.de_pontos(int(atributo_data))
     return atributo, atributo.modificador
 
 def row_to_ficha_json(row):
@@ -46,6 +199,44 @@ def row_to_ficha_json(row):
         "carisma": {"pontos": carisma.ponto_atributo, "modificador": carisma_mod},
     }
 
+MENSAGEM_BANCO_OCUPADO = "Banco de dados ocupado, tente de novo"
+
+@app.errorhandler(sqlite3.OperationalError)
+def banco_ocupado(e):
+    # lock que passou do busy_timeout: 503 para o cliente poder tentar de novo (e a carga poder contar)
+    if "locked" in str(e) or "busy" in str(e):
+        return jsonify(success=False, message=MENSAGEM_BANCO_OCUPADO), 503
+    app.logger.exception("erro no banco")
+    return jsonify(success=False, message="Erro no banco de dados"), 500
+
+@app.errorhandler(Conflito)
+def batalha_conflito(e):
+    return resposta_conflito(e.battle_id)
+
+@app.errorhandler(TipoDesconhecido)
+def monstro_sem_tipo(e):
+    app.logger.error(str(e))
+    return jsonify(success=False, message=f"Monstro de tipo desconhecido: {e.tipo}"), 500
+
+def resposta_conflito(battle_id):
+    """409 com a batalha como ficou, para o cliente recarregar e decidir de novo."""
+    b = get_battle(battle_id) if battle_id else None
+    return jsonify(success=False, message="A batalha mudou enquanto o turno era jogado; recarregue",
+                   battle=trim_battle(b) if b else None), 409
+
+def turno_confere(data: dict, b: dict) -> bool:
+    """Se o cliente mandou o turno que está vendo, ele tem que ser o atual (clique duplo, aba velha)."""
+    turno = data.get("turno")
+    return turno is None or turno == b["turno"]
+
+def preparar_chances(fichas: list):
+    """Prepara as tabelas de vitória das fichas novas contra cada tipo e CA de monstro (com o maior hp)."""
+    tipos = bestiario.tipos()
+    monstros = [bestiario.montar(r) for r in db.execute("SELECT tipo, ca, MAX(hp) AS hp FROM monstros GROUP BY tipo, ca")
+                if r["tipo"] in tipos]
+    for row in fichas:
+        probabilidades.preparar(Ficha.from_db_row(row), monstros)
+
 def validate_pool(attrs: dict) -> bool:
     try:
         values = sorted([int(attrs[k]) for k in ("forca","constituicao","destreza","inteligencia","sabedoria","carisma")])
@@ -53,6 +244,20 @@ def validate_pool(attrs: dict) -> bool:
         return False
     return values == sorted(POOL)
 
+def ler_ficha_nova(data: dict):
+    """(campos, None) de uma ficha nova válida, ou (None, mensagem de erro)."""
+    campos = {k: (data.get(k) or "").strip() for k in ("userName", "nome", "raca", "classe")}
+    attrs = data.get("atributos") or {}
+    if not all(campos.values()) or not attrs:
+        return None, "Campos obrigatórios ausentes"
+    if campos["classe"] not in ALLOWED_CLASSES:
+        return None, "Classe inválida"
+    if campos["raca"] not in ALLOWED_RACES:
+        return None, "Raça inválida"
+    if not validate_pool(attrs):
+        return None, "Atributos inválidos; use o pool [15,14,13,12,10,8] sem repetição"
+    return {**campos, "atributos": attrs}, None
+
 
 @app.post("/cadastro")
 def cadastrar():
@@ -70,7 +275,13 @@ def cadastrar():
     if exists:
         return jsonify(success=False, message="Usuário ou email já existe"), 409
 
-    db.execute("INSERT INTO users (userName, email, password_hash) VALUES (?, ?, ?)", userName, email, senha)
+    try:
+        password_hash = senhas.gerar_hash(senha)
+    except SenhasOcupadas:
+        return jsonify(success=False, message="Servidor ocupado, tente de novo"), 503
+
+    db.execute("INSERT INTO users (userName, email, password_hash) VALUES (?, ?, ?)", userName, email, password_hash)
+    invalidar_usuario(userName, email)
     return jsonify(success=True, message="Conta criada"), 201
 
 @app.post("/login")
@@ -85,9 +296,15 @@ def login():
     if not user:
         return jsonify(success=False, message="Credenciais inválidas"), 401
 
-    row = db.execute("SELECT password_hash FROM users WHERE id = ?", user["id"])
-    if row[0]["password_hash"] != senha:
-        return jsonify(success=False, message="Credenciais inválidas"), 401
+    try:
+        if not senhas.conferir(senha, user["password_hash"]):
+            return jsonify(success=False, message="Credenciais inválidas"), 401
+        # senha ainda em texto puro (ou com custo antigo): troca pelo hash atual
+        if senhas.precisa_rehash(user["password_hash"]):
+            db.execute("UPDATE users SET password_hash = ? WHERE id = ?", senhas.gerar_hash(senha), user["id"])
+            invalidar_usuario(user["userName"], user["email"])
+    except SenhasOcupadas:
+        return jsonify(success=False, message="Servidor ocupado, tente de novo"), 503
 
     return jsonify(success=True, user={"id": user["id"], "userName": user["userName"], "email": user["email"]}), 200
 
@@ -102,11 +319,28 @@ def get_ficha():
     if not user:
         return jsonify(success=False, message="Usuário não encontrado"), 404
 
-    rows = db.execute("SELECT * FROM fichas WHERE user_id = ? LIMIT 1", user["id"])
+    # só a versão da ficha; a linha inteira só é lida quando o JSON dela ainda não está no cache
+    banco = shards.do_usuario(user["id"])
+    rows = banco.execute("SELECT id, updated_at FROM fichas WHERE user_id = ? LIMIT 1", user["id"])
     if not rows:
         return jsonify(success=False, message="Ficha não encontrada"), 404
+    # o id da ficha só é único dentro do shard
+    chave = (user["id"], rows[0]["id"], rows[0]["updated_at"])
+    etag = hashlib.md5(repr(chave).encode()).hexdigest()
 
-    return jsonify(success=True, ficha=row_to_ficha_json(rows[0])), 200
+    if etag in request.if_none_match:
+        resp = app.response_class(status=304)
+    else:
+        corpo = cache_fichas.get(chave)
+        if corpo is None:
+            row = banco.execute("SELECT * FROM fichas WHERE id = ?", chave[1])[0]
+            corpo = json.dumps({"success": True, "ficha": row_to_ficha_json(row)}, ensure_ascii=False,
+                               separators=(",", ":")).encode()
+            cache_fichas.set(chave, corpo)
+        resp = app.response_class(corpo, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp
     
 
 @app.post("/ficha/roll/vida")
@@ -131,7 +365,7 @@ def ficha_roll_vida():
     if not user:
         return jsonify(success=False, message="Usuário não encontrado"), 404
 
-    exists = db.execute("SELECT id FROM fichas WHERE user_id = ? LIMIT 1", user["id"])
+    exists = shards.do_usuario(user["id"]).execute("SELECT id FROM fichas WHERE user_id = ? LIMIT 1", user["id"])
     if exists:
         return jsonify(success=False, message="Usuário já possui ficha"), 409
 
@@ -169,14 +403,15 @@ def ficha_roll_ca():
     if not user:
         return jsonify(success=False, message="Usuário não encontrado"), 404
     print('passo  do users')
-    exists = db.execute("SELECT id FROM fichas WHERE user_id = ? LIMIT 1", user["id"])
+    exists = shards.do_usuario(user["id"]).execute("SELECT id FROM fichas WHERE user_id = ? LIMIT 1", user["id"])
     if exists:
         return jsonify(success=False, message="Usuário já possui ficha"), 409
     print('passou do existis')
     destreza, dex_mod = definir_modificador(int(attrs["destreza"]))
     ca = 10 + dex_mod
     print('passou do ca')
-    db.execute("""
+    banco = shards.do_usuario(user["id"])
+    banco.execute("""
         INSERT INTO fichas (
           user_id, nome, raca, classe,
           forca, constituicao, destreza, inteligencia, sabedoria, carisma,
@@ -188,15 +423,121 @@ def ficha_roll_ca():
     int(attrs["inteligencia"]), int(attrs["sabedoria"]), int(attrs["carisma"]),
     int(vida), int(ca))
     print('passou do banco de dados')
-    row = db.execute("SELECT * FROM fichas WHERE user_id = ? LIMIT 1", user["id"])[0]
+    row = banco.execute("SELECT * FROM fichas WHERE user_id = ? LIMIT 1", user["id"])[0]
+    preparar_chances([row])
     return jsonify(success=True, ca=ca, dexMod=dex_mod, ficha=row_to_ficha_json(row)), 201
 
+@app.post("/ficha")
+def ficha_criar():
+    """Rola a vida, calcula a CA e grava a ficha numa chamada só (o /ficha/roll/vida + /ficha/roll/ca)."""
+    campos, erro = ler_ficha_nova(request.get_json(silent=True) or {})
+    if erro:
+        return jsonify(success=False, message=erro), 400
+
+    user = get_user_or_email(campos["userName"])
+    if not user:
+        return jsonify(success=False, message="Usuário não encontrado"), 404
+
+    valores, rolagens = nova_ficha(user["id"], campos["nome"], campos["raca"], campos["classe"],
+                                   campos["atributos"], Dados())
+    row = inserir(shards.do_usuario(user["id"]), valores)
+    if row is None:
+        return jsonify(success=False, message="Usuário já possui ficha"), 409
+    preparar_chances([row])
+    return jsonify(success=True, **rolagens, ficha=row_to_ficha_json(row)), 201
+
+@app.post("/ficha/lote")
+def ficha_lote():
+    """
+    Várias fichas de uma vez: {"fichas": [{userName, nome, raca, classe, atributos}, ...]}.
+    Cada item é validado sozinho; as válidas são gravadas numa transação por shard.
+    """
+    data = request.get_json(silent=True) or {}
+    itens = data.get("fichas")
+    if not isinstance(itens, list) or not itens:
+        return jsonify(success=False, message="Informe fichas (lista)"), 400
+    if len(itens) > MAX_LOTE:
+        return jsonify(success=False, message=f"No máximo {MAX_LOTE} itens por lote"), 400
+
+    inicio = time.perf_counter()
+    resultados = [None] * len(itens)
+    por_shard = {}   # banco -> [(índice, user_id, valores, rolagens)]
+    dados = Dados()
+    for i, item in enumerate(itens):
+        campos, erro = ler_ficha_nova(item if isinstance(item, dict) else {})
+        if erro:
+            resultados[i] = {"success": False, "message": erro}
+            continue
+        user = get_user_or_email(campos["userName"])
+        if not user:
+            resultados[i] = {"success": False, "message": "Usuário não encontrado"}
+            continue
+        valores, rolagens = nova_ficha(user["id"], campos["nome"], campos["raca"], campos["classe"],
+                                       campos["atributos"], dados)
+        por_shard.setdefault(shards.do_usuario(user["id"]), []).append((i, user["id"], valores, rolagens))
+
+    novas = []
+    for banco, fichas in por_shard.items():
+        gravadas = inserir_lote(banco, [valores for _, _, valores, _ in fichas])
+        for i, user_id, _, rolagens in fichas:
+            row = gravadas.pop(user_id, None)
+            if row is None:
+                # já tinha ficha, ou o mesmo usuário apareceu antes neste lote
+                resultados[i] = {"success": False, "message": "Usuário já possui ficha"}
+            else:
+                resultados[i] = {"success": True, **rolagens, "ficha": row_to_ficha_json(row)}
+                novas.append(row)
+    duracao = time.perf_counter() - inicio
+    preparar_chances(novas)
+    criadas = len(novas)
+    return jsonify(success=True, resultados=resultados, criadas=criadas,
+                   fichas_por_segundo=round(criadas / duracao, 1) if duracao else None), 200
+
 
 
 @app.get("/monstros")
 def list_monstros():
-    rows = db.execute("SELECT id, nome, tipo, hp, ca FROM monstros ORDER BY id DESC")
-    return jsonify(success=True, monstros=rows), 200
+    """
+    Lista os monstros do mais novo para o mais antigo, paginando pelo id (cursor = último id da página anterior).
+    Filtros opcionais: tipo, hp_min, hp_max, ca_min, ca_max. Responde 304 se o If-None-Match bater com o ETag.
+    """
+    try:
+        cursor = int(request.args.get("cursor") or 0)
+        limite = int(request.args.get("limite") or MONSTROS_POR_PAGINA)
+        faixas = {k: int(request.args[k]) for k in ("hp_min", "hp_max", "ca_min", "ca_max") if request.args.get(k)}
+    except ValueError:
+        return jsonify(success=False, message="Parâmetros inválidos"), 400
+    limite = max(1, min(limite, MONSTROS_POR_PAGINA_MAX))
+    tipo = (request.args.get("tipo") or "").strip()
+
+    # o seq do AUTOINCREMENT muda a cada monstro inserido, inclusive pelo manipule.py em outro processo
+    versao = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'monstros'")
+    versao = versao[0]["seq"] if versao else 0
+    chave = (versao, cursor, limite, tipo, tuple(sorted(faixas.items())))
+
+    pagina = cache_monstros.get(chave)
+    if pagina is None:
+        filtros, args = [], []
+        if cursor:
+            filtros.append("id < ?"); args.append(cursor)
+        if tipo:
+            filtros.append("tipo = ?"); args.append(tipo)
+        for campo, operador in (("hp_min", "hp >= ?"), ("hp_max", "hp <= ?"), ("ca_min", "ca >= ?"), ("ca_max", "ca <= ?")):
+            if campo in faixas:
+                filtros.append(operador); args.append(faixas[campo])
+        where = ("WHERE " + " AND ".join(filtros)) if filtros else ""
+        rows = db.execute(f"SELECT id, nome, tipo, hp, ca FROM monstros {where} ORDER BY id DESC LIMIT ?", *args, limite)
+        proximo = rows[-1]["id"] if len(rows) == limite else None
+
+        corpo = json.dumps({"success": True, "monstros": rows, "proximo": proximo}, ensure_ascii=False).encode()
+        pagina = (corpo, hashlib.md5(corpo).hexdigest())
+        cache_monstros.set(chave, pagina)
+
+    corpo, etag = pagina
+    resp = app.response_class(corpo, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "no-cache"
+    return resp.make_conditional(request)
 
 
 @app.post("/batalha/iniciar")
@@ -210,7 +551,7 @@ def batalha_iniciar():
     user = get_user_or_email(userName)
     if not user:
         return jsonify(success=False, message="Usuário não encontrado"), 404
-    ficha_rows = db.execute("SELECT * FROM fichas WHERE user_id = ? LIMIT 1", user["id"])
+    ficha_rows = shards.do_usuario(user["id"]).execute("SELECT * FROM fichas WHERE user_id = ? LIMIT 1", user["id"])
     if not ficha_rows:
         return jsonify(success=False, message="Ficha não encontrada"), 404
     ficha = ficha_rows[0]
@@ -221,11 +562,17 @@ def batalha_iniciar():
     monstro = monstro_rows[0]
 
     # Guardando o historico das batalhas, para nao perder o estado da vida dos personagens, tanto do jogador quanto do mmonstro
-    db.execute("""
-      INSERT INTO batalhas (user_id, monstro_id, j_vida, m_hp, fase, turno)
-      VALUES (?, ?, ?, ?, 'initiative', 1)
-    """, user["id"], monstro_id, int(ficha["vida"]), int(monstro["hp"]))
-    b = db.execute("SELECT * FROM batalhas WHERE rowid = last_insert_rowid()")[0]
+    # cada batalha tem a sua semente, assim qualquer batalha pode ser repetida rolagem a rolagem
+    battle_id = shards.inserir_batalha(user["id"], monstro_id, int(ficha["vida"]), int(monstro["hp"]),
+                                       secrets.randbits(63))
+    b = get_battle(battle_id)
+
+    # resolver=true joga a batalha inteira já aqui, sem o cliente chamar cada fase
+    if data.get("resolver"):
+        estado = EstadoBatalha(b, ficha, monstro, bestiario.modelo(monstro["tipo"]))
+        log = resolver_batalha(estado)
+        return jsonify(success=True, battle=trim_battle(estado.batalha), log=log), 201
+    probabilidades.preparar(Ficha.from_db_row(ficha), [bestiario.montar(monstro)])
     return jsonify(success=True, battle=trim_battle(b)), 201
 
 @app.post("/batalha/roll/initiative")
@@ -235,25 +582,17 @@ def batalha_roll_initiative():
     data = request.get_json(silent=True) or {}
     battle_id = int(data.get("battle_id") or 0)
     if not battle_id: return jsonify(success=False, message="battle_id é obrigatório"), 400
-    b = get_battle(battle_id)
-    if not b: return jsonify(success=False, message="Batalha não encontrada"), 404
-    if b["fase"] != "initiative": return jsonify(success=False, message="Fase inválida"), 400
-
-    # carrega ficha para pegar destreza, atributo necessário para o cálculo da iniciativa do jogador
-    ficha = db.execute("SELECT * FROM fichas WHERE user_id = ? LIMIT 1", b["user_id"])[0]
-    destreza, dex_mod = definir_modificador(ficha["destreza"])
-    d20=Dados()
-    d20_player = d20.d20()
-    d20_monstro = d20.d20()
-
-    if d20_player + dex_mod >= d20_monstro:
-        fase = "player"
-    else:
-        fase = "monster"
-
-    db.execute("UPDATE batalhas SET fase = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?", fase, battle_id)
-    b = get_battle(battle_id)
-    return jsonify(success=True, d20_player=d20_player, dexMod=dex_mod, d20_monstro=d20_monstro, battle=trim_battle(b)), 200
+    estado = store.carregar(battle_id)
+    if not estado: return jsonify(success=False, message="Batalha não encontrada"), 404
+    with estado.lock:
+        if estado.batalha["fase"] != "initiative": return jsonify(success=False, message="Fase inválida"), 400
+        if not turno_confere(data, estado.batalha): return resposta_conflito(battle_id)
+
+        # a ficha já vem montada com a destreza, atributo necessário para o cálculo da iniciativa do jogador
+        resposta, mudancas = rolar_iniciativa(estado.ficha, estado.dados)
+        store.salvar(estado, "initiative", resposta, **mudancas)
+        publicar_fase(estado.batalha, "initiative", resposta)
+        return jsonify(success=True, **resposta, battle=trim_battle(estado.batalha)), 200
 
 @app.post("/batalha/roll/player_attack")
 def batalha_player_attack():
@@ -262,65 +601,26 @@ def batalha_player_attack():
     if not battle_id:
         return jsonify(success=False, message="battle_id é obrigatório"), 400
 
-    b = get_battle(battle_id)
-    if not b:
+    estado = store.carregar(battle_id)
+    if not estado:
         return jsonify(success=False, message="Batalha não encontrada"), 404
 
-    if b["fase"] != "player":
-        return jsonify(success=False, message="Não é a vez do jogador"), 400
-    # ficha do jogador
-    ficha_row = db.execute("SELECT * FROM fichas WHERE user_id = ? LIMIT 1",b["user_id"],)[0]
-    # monstro da batalha
-    monstro_row = db.execute("SELECT * FROM monstros WHERE id = ? LIMIT 1",b["monstro_id"],)[0]
+    with estado.lock:
+        b = estado.batalha
+        if b["fase"] != "player":
+            return jsonify(success=False, message="Não é a vez do jogador"), 400
+        if not turno_confere(data, b):
+            return resposta_conflito(battle_id)
 
-    ficha = Ficha.from_db_row(ficha_row)
-    monstro = Molodoy.from_db_row(monstro_row)
-    # usar HP atual da batalha
-    monstro.hp = b["m_hp"]
-    # ataque
-    resultado = ficha.atacar(monstro)  # <- nome certo
-    d20 = resultado["d20"]
-    ataque_total = d20 + ficha.forca.modificador  # se quiser exibir o total
-
-    if resultado["tipo"] in ("errou", "falha"):
-        hit = False
-        critico = False
-        dano = 0
-    else:
-        hit = True
-        critico = resultado["critico"]
-        dano = resultado["dano"]
-
-    new_m_hp = resultado["hp_alvo"]
-
-    vencedor = None
-    fase = "monster"
-    if new_m_hp <= 0:
-        new_m_hp = 0
-        fase = "ended"
-        vencedor = "player"
-
-    db.execute(
-        """
-        UPDATE batalhas
-        SET m_hp = ?, fase = ?, vencedor = COALESCE(vencedor, ?), updated_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-        """,
-        new_m_hp, fase, vencedor, battle_id
-    )
+        ficha = estado.ficha
+        monstro = estado.monstro
+        # usar HP atual da batalha
+        monstro.hp = b["m_hp"]
+        resposta, mudancas = ataque_jogador(ficha, monstro)
+        store.salvar(estado, "player", resposta, **mudancas)
+        publicar_fase(b, "player", resposta)
 
-    b = get_battle(battle_id)
-
-    return jsonify(
-        success=True,
-        d20=d20,
-        ataque=ataque_total,
-        dano=dano,
-        hit=hit,
-        critico=critico,
-        ca_monstro=monstro.ca,   # <- objeto, não dict
-        battle=trim_battle(b),
-    ), 200
+        return jsonify(success=True, **resposta, battle=trim_battle(estado.batalha)), 200
 
 
 @app.post("/batalha/roll/monster_attack")
@@ -331,85 +631,371 @@ def batalha_monstro_attack():
     if not battle_id:
         return jsonify(success=False, message="battle_id é obrigatório"), 400
 
-    b = get_battle(battle_id)
-    if not b:
+    estado = store.carregar(battle_id)
+    if not estado:
         return jsonify(success=False, message="Batalha não encontrada"), 404
 
-    if b["fase"] != "monster":
-        return jsonify(success=False, message="Não é a vez do monstro"), 400
+    with estado.lock:
+        b = estado.batalha
+        if b["fase"] != "monster":
+            return jsonify(success=False, message="Não é a vez do monstro"), 400
+        if not turno_confere(data, b):
+            return resposta_conflito(battle_id)
 
-    # pega ficha e monstro do banco
-    ficha_row = db.execute(
-        "SELECT * FROM fichas WHERE user_id = ? LIMIT 1",
-        b["user_id"],
-    )[0]
+        ficha = estado.ficha
+        monstro = estado.monstro
 
-    monstro_row = db.execute(
-        "SELECT * FROM monstros WHERE id = ? LIMIT 1",
-        b["monstro_id"],
-    )[0]
+        # sobrescreve com os valores da batalha
+        ficha.vida = b["j_vida"]   # vida atual do jogador na batalha
+        monstro.hp = b["m_hp"]     # vida atual do monstro na batalha (se quiser usar depois)
 
-    ficha = Ficha.from_db_row(ficha_row)
-    monstro = Molodoy.from_db_row(monstro_row)  # por enquanto só Molodoy mesmo
+        # ataque do monstro contra a ficha
+        resposta, mudancas = ataque_monstro(ficha, monstro)
+        store.salvar(estado, "monster", resposta, **mudancas)
+        publicar_fase(b, "monster", resposta)
+
+        return jsonify(success=True, **resposta, battle=trim_battle(estado.batalha)), 200
+
+
+@app.post("/batalha/simular")
+def batalha_simular():
+    """Simula várias batalhas entre a ficha do usuário e o monstro, sem gravar nada, para estimar a chance de vitória."""
+    data = request.get_json(silent=True) or {}
+    userName = (data.get("userName") or "").strip()
+    monstro_id = int(data.get("monstro_id") or 0)
+    n = int(data.get("n") or 10000)
+    seed = data.get("seed")
+    if not userName or not monstro_id:
+        return jsonify(success=False, message="Informe userName e monstro_id"), 400
+    if not 1 <= n <= MAX_SIMULACOES:
+        return jsonify(success=False, message=f"n deve estar entre 1 e {MAX_SIMULACOES}"), 400
+    if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool) or seed < 0):
+        return jsonify(success=False, message="seed deve ser um inteiro não negativo"), 400
+
+    user = get_user_or_email(userName)
+    if not user:
+        return jsonify(success=False, message="Usuário não encontrado"), 404
+    ficha_rows = shards.do_usuario(user["id"]).execute("SELECT * FROM fichas WHERE user_id = ? LIMIT 1", user["id"])
+    if not ficha_rows:
+        return jsonify(success=False, message="Ficha não encontrada"), 404
+    monstro_rows = db.execute("SELECT * FROM monstros WHERE id = ? LIMIT 1", monstro_id)
+    if not monstro_rows:
+        return jsonify(success=False, message="Monstro não encontrado"), 404
 
-    # sobrescreve com os valores da batalha
-    ficha.vida = b["j_vida"]   # vida atual do jogador na batalha
-    monstro.hp = b["m_hp"]     # vida atual do monstro na batalha (se quiser usar depois)
+    ficha = Ficha.from_db_row(ficha_rows[0])
+    monstro = bestiario.montar(monstro_rows[0])
+    resultado = simular(ficha, monstro, n=n, seed=seed)
+    return jsonify(success=True, simulacao=resultado), 200
 
-    # ataque do monstro contra a ficha
-    resultado = monstro.atacar(ficha)
 
-    d20 = resultado["d20"]
-    ataque_total = d20 + monstro.bonus_ataque  # total da rolagem do monstro
+@app.post("/batalha/chance")
+def batalha_chance():
+    """
+    Chance exata de vitória do jogador. Com battle_id usa a vida, o hp e a vez da batalha
+    em andamento; com userName e monstro_id calcula para uma batalha nova.
+    """
+    data = request.get_json(silent=True) or {}
+    battle_id = int(data.get("battle_id") or 0)
 
-    # interpreta o resultado
-    if resultado["tipo"] in ("errou", "falha"):
-        hit = False
-        critico = False
-        dano = 0
+    if battle_id:
+        estado = store.carregar(battle_id)
+        if not estado:
+            return jsonify(success=False, message="Batalha não encontrada"), 404
+        # a ficha e o monstro do estado são compartilhados: só lê a batalha, com o lock dela
+        with estado.lock:
+            vida, hp, fase = estado.batalha["j_vida"], estado.batalha["m_hp"], estado.batalha["fase"]
+        if fase == "ended":
+            return jsonify(success=False, message="Batalha já terminou"), 400
+        ficha, monstro = estado.ficha, estado.monstro
+        vez = fase if fase in ("player", "monster") else None
     else:
-        hit = True
-        critico = resultado["critico"]
-        dano = resultado["dano"]
-
-    new_j_vida = resultado["hp_alvo"]  # vida do jogador depois do ataque
-
-    vencedor = None
-    fase = "player"
-    if new_j_vida <= 0:
-        new_j_vida = 0
-        fase = "ended"
-        vencedor = "monster"
-
-    db.execute(
-        """
-        UPDATE batalhas
-        SET j_vida = ?, fase = ?, vencedor = COALESCE(vencedor, ?),
-            updated_at = CURRENT_TIMESTAMP
-        WHERE id = ?
-        """,
-        new_j_vida, fase, vencedor, battle_id
-    )
+        userName = (data.get("userName") or "").strip()
+        monstro_id = int(data.get("monstro_id") or 0)
+        if not userName or not monstro_id:
+            return jsonify(success=False, message="Informe battle_id ou userName e monstro_id"), 400
+        user = get_user_or_email(userName)
+        if not user:
+            return jsonify(success=False, message="Usuário não encontrado"), 404
+        ficha_rows = shards.do_usuario(user["id"]).execute("SELECT * FROM fichas WHERE user_id = ? LIMIT 1",
+                                                           user["id"])
+        if not ficha_rows:
+            return jsonify(success=False, message="Ficha não encontrada"), 404
+        monstro_rows = db.execute("SELECT * FROM monstros WHERE id = ? LIMIT 1", monstro_id)
+        if not monstro_rows:
+            return jsonify(success=False, message="Monstro não encontrado"), 404
+        ficha = Ficha.from_db_row(ficha_rows[0])
+        monstro = bestiario.montar(monstro_rows[0])
+        vez = vida = hp = None
+
+    return jsonify(success=True, chance=probabilidades.calcular(ficha, monstro, vez, vida, hp)), 200
+
+
+@app.post("/batalha/lote")
+def batalha_lote():
+    """
+    Joga um turno em várias batalhas de uma vez: {"itens": [{"battle_id": 1, "acao": "player_attack"}, ...]}.
+    Sem acao, joga a fase em que a batalha está. Erros de validação voltam no item, sem derrubar o lote,
+    e todas as batalhas alteradas são gravadas na mesma transação; com "turno" no item, ele tem que ser o atual.
+    """
+    data = request.get_json(silent=True) or {}
+    itens = data.get("itens")
+    if not isinstance(itens, list) or not itens:
+        return jsonify(success=False, message="Informe a lista itens"), 400
+    if len(itens) > MAX_LOTE:
+        return jsonify(success=False, message=f"No máximo {MAX_LOTE} itens por lote"), 400
+
+    ids = []
+    for item in itens:
+        try:
+            ids.append(int((item or {}).get("battle_id") or 0))
+        except (TypeError, ValueError, AttributeError):
+            ids.append(0)
+    estados = store.carregar_varios([i for i in ids if i])
+
+    resultados, alterados, publicar = [], [], []
+    for battle_id, item in zip(ids, itens):
+        estado = estados.get(battle_id)
+        if not estado:
+            resultados.append({"battle_id": battle_id, "success": False, "message": "Batalha não encontrada"})
+            continue
+        item = item if isinstance(item, dict) else {}
+        with estado.lock:
+            b = estado.batalha
+            acao = item.get("acao") or ACAO_DA_FASE.get(b["fase"])
+            if b["fase"] == "ended":
+                resultados.append({"battle_id": battle_id, "success": False, "message": "Batalha já terminou"})
+                continue
+            if acao not in ACOES_TURNO:
+                resultados.append({"battle_id": battle_id, "success": False, "message": "Ação inválida"})
+                continue
+            fase, mensagem = ACOES_TURNO[acao]
+            if b["fase"] != fase:
+                resultados.append({"battle_id": battle_id, "success": False, "message": mensagem})
+                continue
+            if not turno_confere(item, b):
+                resultados.append({"battle_id": battle_id, "success": False, "message": "Turno já jogado",
+                                   "battle": trim_battle(b)})
+                continue
+
+            ficha, monstro = estado.ficha, estado.monstro
+            ficha.vida, monstro.hp = b["j_vida"], b["m_hp"]
+            if acao == "initiative":
+                resposta, mudancas = rolar_iniciativa(ficha, estado.dados)
+            elif acao == "player_attack":
+                resposta, mudancas = ataque_jogador(ficha, monstro)
+            else:
+                resposta, mudancas = ataque_monstro(ficha, monstro)
+            store.aplicar(estado, fase, resposta, **mudancas)
+            alterados.append(estado)
+            publicar.append((b, fase, resposta, trim_battle(b)))
+            resultados.append({"battle_id": battle_id, "success": True, **resposta, "battle": trim_battle(b)})
+
+    # batalha que outro processo jogou antes: nenhum turno dela neste lote foi gravado
+    conflitos = store.salvar_lote(alterados)
+    for i, r in enumerate(resultados):
+        if r["success"] and r["battle_id"] in conflitos:
+            resultados[i] = {"battle_id": r["battle_id"], "success": False,
+                             "message": "A batalha mudou enquanto o turno era jogado; recarregue"}
+    for b, fase, resposta, resumo in publicar:
+        if b["id"] not in conflitos:
+            hub.publicar(b["id"], "fase", {"acao": fase, **resposta, "battle": resumo}, final=resumo["fase"] == "ended")
+    return jsonify(success=True, resultados=resultados), 200
+
+
+@app.post("/batalha/resolver")
+def batalha_resolver():
+    """Joga o resto da batalha de uma vez, da fase em que ela está até o fim, e devolve o log de cada fase."""
+    data = request.get_json(silent=True) or {}
+    battle_id = int(data.get("battle_id") or 0)
+    if not battle_id:
+        return jsonify(success=False, message="battle_id é obrigatório"), 400
 
-    b = get_battle(battle_id)
+    estado = store.carregar(battle_id)
+    if not estado:
+        return jsonify(success=False, message="Batalha não encontrada"), 404
+    with estado.lock:
+        if estado.batalha["fase"] == "ended":
+            return jsonify(success=False, message="Batalha já terminou"), 400
+        if not turno_confere(data, estado.batalha):
+            return resposta_conflito(battle_id)
+
+        log = resolver_batalha(estado)
+        return jsonify(success=True, battle=trim_battle(estado.batalha), log=log), 200
+
+
+@app.get("/batalha/<int:battle_id>/stream")
+def batalha_stream(battle_id):
+    """
+    Server-Sent Events com as mudanças da batalha: primeiro um evento "estado" com a batalha
+    como está, depois um evento "fase" a cada fase jogada, até ela terminar.
+    No modo ASGI esta rota é atendida direto no event loop (asgi.py).
+    """
+    assinatura = hub.assinar(battle_id)
+    estado = store.carregar(battle_id)
+    if not estado:
+        hub.cancelar(assinatura)
+        return jsonify(success=False, message="Batalha não encontrada"), 404
+    inicial = trim_battle(estado.batalha)
+
+    def gerar():
+        try:
+            yield formatar("estado", {"battle": inicial})
+            if inicial["fase"] == "ended":
+                return
+            while True:
+                mensagem = assinatura.proxima(timeout=STREAM_PING)
+                if mensagem is None:
+                    yield b": ping\n\n"
+                    continue
+                corpo, final = mensagem
+                yield corpo
+                if final:
+                    return
+        finally:
+            hub.cancelar(assinatura)
+
+    return Response(gerar(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/batalhas/historico")
+def batalhas_historico():
+    """
+    Batalhas do usuário, da mais nova para a mais antiga, juntando as em andamento/recentes
+    com as do arquivo frio. Paginação por cursor: ?antes=<proximo> da página anterior.
+    """
+    userName = (request.args.get("userName") or "").strip()
+    if not userName:
+        return jsonify(success=False, message="Informe userName"), 400
+    try:
+        antes = int(request.args["antes"]) if request.args.get("antes") else None
+        limite = min(max(int(request.args.get("limite", HISTORICO_POR_PAGINA)), 1), HISTORICO_POR_PAGINA)
+    except ValueError:
+        return jsonify(success=False, message="antes e limite devem ser inteiros"), 400
 
-    return jsonify(
-        success=True,
-        d20=d20,
-        ataque=ataque_total,
-        dano=dano,
-        hit=hit,
-        critico=critico,
-        ca_jogador=ficha.ca,
-        battle=trim_battle(b),
-    ), 200
+    user = get_user_or_email(userName)
+    if not user:
+        return jsonify(success=False, message="Usuário não encontrado"), 404
+
+    store.flush()
+    banco = shards.do_usuario(user["id"])
+    if antes is None:
+        ids = banco.execute("SELECT id FROM batalhas WHERE user_id = ? ORDER BY id DESC LIMIT ?", user["id"], limite)
+    else:
+        ids = banco.execute("SELECT id FROM batalhas WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+                            user["id"], antes, limite)
+    quentes = ler_batalhas(banco, [r["id"] for r in ids]).values()
+    frias = arquivo.do_usuario(user["id"], antes, limite)
+    batalhas = sorted([*quentes, *frias], key=lambda b: b["id"], reverse=True)[:limite]
+
+    proximo = batalhas[-1]["id"] if len(batalhas) == limite else None
+    return jsonify(success=True, batalhas=[
+        {**trim_battle(b), "monstro_id": b["monstro_id"], "arquivada": "arquivada_em" in b,
+         "created_at": b["created_at"], "updated_at": b["updated_at"]}
+        for b in batalhas
+    ], proximo=proximo), 200
+
+
+@app.get("/ranking")
+def get_ranking():
+    """Os ?limite= (padrão 10) jogadores com mais vitórias; empate: menos derrotas, depois quem chegou antes."""
+    try:
+        limite = min(max(int(request.args.get("limite", 10)), 1), RANKING_MAX)
+    except ValueError:
+        return jsonify(success=False, message="limite deve ser inteiro"), 400
+    linhas = ranking.top(limite)
+    nomes = {}
+    if linhas:
+        ids = [linha["user_id"] for linha in linhas]
+        nomes = {r["id"]: r["userName"] for r in db.execute(
+            f"SELECT id, userName FROM users WHERE id IN ({','.join('?' * len(ids))})", *ids)}
+    return jsonify(success=True, total=len(ranking), ranking=[
+        {"posicao": linha["posicao"], "userName": nomes.get(linha["user_id"]), **resumo(linha)}
+        for linha in linhas
+    ]), 200
+
+@app.get("/usuario/<int:user_id>/estatisticas")
+def usuario_estatisticas(user_id):
+    """Vitórias, derrotas, batalhas terminadas e posição no ranking do usuário."""
+    rows = db.execute("SELECT id, userName FROM users WHERE id = ? LIMIT 1", user_id)
+    if not rows:
+        return jsonify(success=False, message="Usuário não encontrado"), 404
+    linha = shards.do_usuario(user_id).execute("SELECT * FROM estatisticas_usuarios WHERE user_id = ?", user_id)
+    linha = linha[0] if linha else {"user_id": user_id, "vitorias": 0, "derrotas": 0, "batalhas": 0,
+                                    "turnos": 0, "ultima_batalha": None}
+    return jsonify(success=True, estatisticas={
+        "userName": rows[0]["userName"], "posicao": ranking.posicao(user_id), **resumo(linha),
+    }), 200
+
+
+@app.get("/metrics")
+def exportar_metricas():
+    if metricas is None:
+        return jsonify(success=False, message="Métricas desligadas"), 404
+    return Response(metricas.exportar(), mimetype="text/plain; version=0.0.4")
+
+
+@app.get("/batalha/<int:battle_id>/replay")
+def batalha_replay(battle_id):
+    """
+    Refaz a batalha a partir dos eventos gravados de cada fase; ?ate=<seq> para no evento dado.
+    Batalhas de antes dos eventos são repetidas pela semente, com a ficha e o monstro como estão hoje.
+    """
+    store.flush()
+    b = get_battle(battle_id)
+    if b:
+        eventos = ler_eventos(shards.da_batalha(battle_id), battle_id)
+    else:
+        b = arquivo.batalha(battle_id)
+        if not b:
+            return jsonify(success=False, message="Batalha não encontrada"), 404
+        eventos = arquivo.eventos(battle_id)
+
+    if eventos:
+        ate = request.args.get("ate", type=int)
+        if ate is not None:
+            if ate < 1:
+                return jsonify(success=False, message="ate deve ser pelo menos 1"), 400
+            eventos = [e for e in eventos if e["seq"] <= ate]
+        battle = trim_battle(reconstruir(b, eventos))
+        return jsonify(success=True, fonte="eventos", battle=battle, seed=b["seed"], log=eventos), 200
+
+    if b["seed"] is None:
+        return jsonify(success=False, message="Batalha sem semente, não pode ser repetida"), 400
+
+    ficha_row = shards.do_usuario(b["user_id"]).execute("SELECT * FROM fichas WHERE user_id = ? LIMIT 1",
+                                                        b["user_id"])[0]
+    monstro_row = db.execute("SELECT * FROM monstros WHERE id = ? LIMIT 1", b["monstro_id"])[0]
+    ficha = Ficha.from_db_row(ficha_row)
+    monstro = bestiario.montar(monstro_row)
+    log = jogar(ficha, monstro, Dados(seed=b["seed"]), ate_rolagem=b["rolagens"])
+    return jsonify(success=True, fonte="semente", battle=trim_battle(b), seed=b["seed"], log=log), 200
 
 
 # ---------------------- utils batalha ----------------------
 def get_battle(battle_id: int):
-    """Retorna a batalha com o ID especificado, ou None se não existir."""
-    rows = db.execute("SELECT * FROM batalhas WHERE id = ? LIMIT 1", battle_id)
-    return rows[0] if rows else None
+    """Retorna a batalha com o ID especificado (no estado do último evento), ou None se não existir."""
+    return ler_batalhas(shards.da_batalha(battle_id), [battle_id]).get(battle_id)
+
+def resolver_batalha(estado):
+    """Joga a batalha até o fim e grava o resultado e o log numa transação só."""
+    b = estado.batalha
+    ficha, monstro = estado.ficha, estado.monstro
+    ficha.vida, monstro.hp = b["j_vida"], b["m_hp"]
+    log = jogar(ficha, monstro, estado.dados, fase=b["fase"], turno=b["turno"])
+    store.salvar_com_log(
+        estado, log,
+        j_vida=ficha.vida, m_hp=monstro.hp,
+        fase=log[-1]["fase"], vencedor=log[-1]["vencedor"], turno=log[-1]["turno"],
+    )
+    for evento in log:
+        battle = {**trim_battle(b), **{k: evento[k] for k in ("fase", "j_vida", "m_hp", "vencedor")}}
+        hub.publicar(b["id"], "fase", {**evento, "battle": battle}, final=evento["fase"] == "ended")
+    return log
+
+def publicar_fase(b, acao, resposta):
+    """Avisa quem está assistindo a batalha pelo stream; a última fase fecha o stream."""
+    hub.publicar(b["id"], "fase", {"acao": acao, **resposta, "battle": trim_battle(b)}, final=b["fase"] == "ended")
 
 def trim_battle(b):
     return {
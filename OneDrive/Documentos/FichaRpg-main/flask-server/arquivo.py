@@ -0,0 +1,188 @@
+"""
+Arquivo frio das batalhas terminadas.
+
+As rotas de turno só mexem em batalhas em andamento, mas toda batalha terminada
+ficava para sempre em batalhas/batalha_eventos. O Arquivo move as que terminaram
+há mais de idade_min segundos para outro arquivo SQLite (arquivo.db):
+
+    batalhas_arquivadas   resumo de cada batalha (a linha de batalhas), indexado por usuário
+    eventos_arquivados    os eventos da batalha num blob só, NDJSON comprimido com zlib
+
+Primeiro grava no arquivo, depois apaga do banco quente; se cair no meio, a próxima
+rodada grava de novo por cima (INSERT OR REPLACE) e apaga. As páginas liberadas no
+app.db são reaproveitadas pelas batalhas novas, então as tabelas quentes e os índices
+delas ficam do tamanho das batalhas recentes.
+
+Com shards (shards.py), arquiva as batalhas de cada shard no mesmo arquivo.db: os ids
+das batalhas não se repetem entre shards.
+
+Roda numa thread (ARQUIVO=1 no app) ou de fora, por cron:
+
+    python arquivo.py [--banco app.db] [--arquivo arquivo.db] [--idade-horas 24] [--shards N]
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+import zlib
+
+from banco import Banco
+from estado_batalhas import ler_eventos_varios
+from schema import migrar
+from shards import Shards
+
+logger = logging.getLogger(__name__)
+COLUNAS_RESUMO = (
+    "id", "user_id", "monstro_id", "j_vida", "m_hp", "fase", "turno", "vencedor",
+    "seed", "rolagens", "evento_seq", "created_at", "updated_at",
+)
+
+
+def comprimir(eventos: list) -> bytes:
+    texto = "\n".join(json.dumps(e, separators=(",", ":"), ensure_ascii=False) for e in eventos)
+    return zlib.compress(texto.encode("utf-8"), 6)
+
+
+def descomprimir(blob: bytes) -> list:
+    texto = zlib.decompress(blob).decode("utf-8")
+    return [json.loads(linha) for linha in texto.split("\n") if linha]
+
+
+class Arquivo:
+    def __init__(self, bancos, caminho: str = "arquivo.db", idade_min: float = 86400, lote: int = 500):
+        self.bancos = list(bancos)    # onde estão as batalhas quentes: o app.db ou os shards
+        self.frio = Banco(caminho, tamanho_pool=2)
+        self.idade_min = idade_min    # segundos desde que a batalha terminou
+        self.lote = lote              # batalhas por transação
+        self.arquivadas = 0
+        self._thread = None
+        self._criar()
+
+    def _criar(self):
+        self.frio.execute("""
+            CREATE TABLE IF NOT EXISTS batalhas_arquivadas (
+              id          INTEGER PRIMARY KEY,
+              user_id     INTEGER NOT NULL,
+              monstro_id  INTEGER NOT NULL,
+              j_vida      INTEGER NOT NULL,
+              m_hp        INTEGER NOT NULL,
+              fase        TEXT NOT NULL,
+              turno       INTEGER NOT NULL,
+              vencedor    TEXT,
+              seed        INTEGER,
+              rolagens    INTEGER NOT NULL DEFAULT 0,
+              evento_seq  INTEGER NOT NULL DEFAULT 0,
+              created_at  TIMESTAMP,
+              updated_at  TIMESTAMP,
+              arquivada_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        self.frio.execute("CREATE INDEX IF NOT EXISTS idx_arquivadas_usuario ON batalhas_arquivadas (user_id, id)")
+        self.frio.execute("""
+            CREATE TABLE IF NOT EXISTS eventos_arquivados (
+              batalha_id  INTEGER PRIMARY KEY,
+              eventos     BLOB NOT NULL
+            )
+        """)
+
+    # ---------------------- arquivamento ----------------------
+    def arquivar_lote(self, db) -> int:
+        """Move até `lote` batalhas terminadas há mais de idade_min do banco db; retorna quantas moveu."""
+        batalhas = db.execute(
+            "SELECT * FROM batalhas WHERE fase = 'ended' AND updated_at < datetime('now', ?) "
+            "ORDER BY updated_at LIMIT ?",
+            f"-{int(self.idade_min)} seconds", self.lote,
+        )
+        if not batalhas:
+            return 0
+        ids = [b["id"] for b in batalhas]
+        eventos = ler_eventos_varios(db, ids)
+
+        with self.frio.transacao():
+            self.frio.executemany(
+                f"INSERT OR REPLACE INTO batalhas_arquivadas ({', '.join(COLUNAS_RESUMO)}) "
+                f"VALUES ({', '.join('?' * len(COLUNAS_RESUMO))})",
+                [tuple(b.get(c) for c in COLUNAS_RESUMO) for b in batalhas],
+            )
+            self.frio.executemany(
+                "INSERT OR REPLACE INTO eventos_arquivados (batalha_id, eventos) VALUES (?, ?)",
+                [(battle_id, comprimir(evs)) for battle_id, evs in eventos.items()],
+            )
+
+        marcas = ",".join("?" * len(ids))
+        with db.transacao():
+            db.execute(f"DELETE FROM batalha_eventos WHERE batalha_id IN ({marcas})", *ids)
+            db.execute(f"DELETE FROM batalhas WHERE id IN ({marcas}) AND fase = 'ended'", *ids)
+        self.arquivadas += len(ids)
+        return len(ids)
+
+    def arquivar(self) -> int:
+        """Arquiva em lotes até não sobrar batalha velha o bastante em nenhum banco."""
+        total = 0
+        for db in self.bancos:
+            while True:
+                n = self.arquivar_lote(db)
+                total += n
+                if n < self.lote:
+                    break
+        return total
+
+    def iniciar(self, intervalo: float = 300):
+        """Arquiva numa thread a cada `intervalo` segundos."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, args=(intervalo,), name="arquivo", daemon=True)
+        self._thread.start()
+
+    def _loop(self, intervalo: float):
+        while True:
+            try:
+                self.arquivar()
+            except Exception:
+                logger.exception("falha ao arquivar batalhas")
+            time.sleep(intervalo)
+
+    # ---------------------- consulta ----------------------
+    def batalha(self, battle_id: int):
+        """Resumo da batalha arquivada (mesmas colunas de batalhas), ou None."""
+        rows = self.frio.execute("SELECT * FROM batalhas_arquivadas WHERE id = ?", battle_id)
+        return rows[0] if rows else None
+
+    def eventos(self, battle_id: int) -> list:
+        rows = self.frio.execute("SELECT eventos FROM eventos_arquivados WHERE batalha_id = ?", battle_id)
+        return descomprimir(rows[0]["eventos"]) if rows else []
+
+    def do_usuario(self, user_id: int, antes: int = None, limite: int = 50) -> list:
+        """Resumos das batalhas arquivadas do usuário, da mais nova para a mais antiga, com id < antes."""
+        if antes is None:
+            return self.frio.execute(
+                "SELECT * FROM batalhas_arquivadas WHERE user_id = ? ORDER BY id DESC LIMIT ?", user_id, limite
+            )
+        return self.frio.execute(
+            "SELECT * FROM batalhas_arquivadas WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?",
+            user_id, antes, limite,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move as batalhas terminadas para o arquivo frio")
+    parser.add_argument("--banco", default="app.db")
+    parser.add_argument("--arquivo", default="arquivo.db")
+    parser.add_argument("--idade-horas", type=float, default=24, help="arquiva as terminadas há mais que isso")
+    parser.add_argument("--lote", type=int, default=500)
+    parser.add_argument("--shards", type=int, default=0, help="o SHARDS do servidor")
+    parser.add_argument("--pasta-shards", default="shards")
+    args = parser.parse_args()
+
+    db = Banco(args.banco)
+    migrar(db)
+    shards = Shards(db, args.shards, args.pasta_shards)
+    arquivo = Arquivo(shards.bancos, args.arquivo, idade_min=args.idade_horas * 3600, lote=args.lote)
+    inicio = time.perf_counter()
+    total = arquivo.arquivar()
+    print(f"{total} batalhas arquivadas em {time.perf_counter() - inicio:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Modo ASGI das mesmas rotas do app.py.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+As conexões (inclusive clientes lentos e keep-alive parados) ficam no event loop, e só
+o tempo do handler ocupa uma thread: cada requisição roda a rota do Flask num pool de
+ASGI_WORKERS threads, junto com as consultas ao SQLite, fora do loop. Assim o número de
+requisições em andamento não fica preso ao número de threads, e as threads ficam
+limitadas ao que o SQLite aguenta de acesso ao mesmo tempo.
+
+As rotas, o back_end, o cache e o store são os mesmos do modo com threads. A exceção
+é o /batalha/<id>/stream: o SSE é atendido aqui mesmo, no loop, com uma fila do asyncio
+por assinante, para milhares de espectadores parados não ocuparem uma thread cada.
+"""
+import asyncio
+import io
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app, hub, store, trim_battle, STREAM_PING
+from transmissao import formatar
+
+ASGI_WORKERS = int(os.environ.get("ASGI_WORKERS", "16"))
+ROTA_STREAM = re.compile(r"^/batalha/(\d+)/stream$")
+
+
+class AppAsgi:
+    def __init__(self, wsgi_app, workers: int = ASGI_WORKERS):
+        self.wsgi_app = wsgi_app
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="asgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        rota = ROTA_STREAM.match(scope["path"])
+        if rota and scope["method"] == "GET":
+            await self._stream(int(rota.group(1)), receive, send)
+            return
+
+        corpo = bytearray()
+        while True:
+            mensagem = await receive()
+            if mensagem["type"] == "http.disconnect":
+                return
+            corpo += mensagem.get("body", b"")
+            if not mensagem.get("more_body"):
+                break
+
+        loop = asyncio.get_running_loop()
+        status, headers, saida = await loop.run_in_executor(self._executor, self._rodar, scope, bytes(corpo))
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": saida})
+
+    async def _stream(self, battle_id: int, receive, send):
+        loop = asyncio.get_running_loop()
+        assinatura = hub.assinar(battle_id, loop)
+        try:
+            estado = await loop.run_in_executor(self._executor, store.carregar, battle_id)
+            if not estado:
+                corpo = json.dumps({"success": False, "message": "Batalha não encontrada"}).encode()
+                await send({"type": "http.response.start", "status": 404,
+                            "headers": [(b"content-type", b"application/json")]})
+                await send({"type": "http.response.body", "body": corpo})
+                return
+
+            inicial = trim_battle(estado.batalha)
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ]})
+            await send({"type": "http.response.body", "body": formatar("estado", {"battle": inicial}), "more_body": True})
+            if inicial["fase"] == "ended":
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+            desconectou = asyncio.ensure_future(_esperar_desconexao(receive))
+            try:
+                while True:
+                    proxima = asyncio.ensure_future(assinatura.proxima(STREAM_PING))
+                    await asyncio.wait({proxima, desconectou}, return_when=asyncio.FIRST_COMPLETED)
+                    if desconectou.done():
+                        proxima.cancel()
+                        return
+                    mensagem = proxima.result()
+                    if mensagem is None:
+                        await send({"type": "http.response.body", "body": b": ping\n\n", "more_body": True})
+                        continue
+                    corpo, final = mensagem
+                    await send({"type": "http.response.body", "body": corpo, "more_body": not final})
+                    if final:
+                        return
+            finally:
+                desconectou.cancel()
+        finally:
+            hub.cancelar(assinatura)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            mensagem = await receive()
+            if mensagem["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif mensagem["type"] == "lifespan.shutdown":
+                self._executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def _rodar(self, scope, corpo: bytes):
+        """Roda a rota do Flask na thread do pool e devolve status, headers e corpo prontos."""
+        resposta = {}
+
+        def start_response(status, headers, exc_info=None):
+            resposta["status"] = int(status.split(" ", 1)[0])
+            resposta["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+        iteravel = self.wsgi_app(_environ(scope, corpo), start_response)
+        try:
+            saida = b"".join(iteravel)
+        finally:
+            if hasattr(iteravel, "close"):
+                iteravel.close()
+        return resposta["status"], resposta["headers"], saida
+
+
+async def _esperar_desconexao(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def _environ(scope, corpo: bytes) -> dict:
+    servidor = scope.get("server") or ("localhost", 80)
+    cliente = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": servidor[0],
+        "SERVER_PORT": str(servidor[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": cliente[0],
+        "CONTENT_LENGTH": str(len(corpo)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(corpo),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for nome, valor in scope.get("headers", []):
+        nome = nome.decode("latin-1").upper().replace("-", "_")
+        valor = valor.decode("latin-1")
+        if nome == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = valor
+        elif nome != "CONTENT_LENGTH":
+            chave = "HTTP_" + nome
+            environ[chave] = f"{environ[chave]},{valor}" if chave in environ else valor
+    return environ
+
+
+app = AppAsgi(flask_app)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", "5000")))
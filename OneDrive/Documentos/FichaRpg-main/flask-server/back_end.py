@@ -1,14 +1,70 @@
-import random
 import datetime
+import itertools
+import threading
 from abc import ABC, abstractmethod
+from typing import NamedTuple
+
+import numpy as np
+
+
+class _Fluxo:
+    """
+    Sequência de números de 32 bits de um PCG64, pré-gerada em blocos.
+    Cada número consumido é exatamente um passo do gerador, então a posição
+    de um fluxo com semente pode ser retomada com advance().
+    """
+
+    def __init__(self, seed=None, posicao: int = 0, bloco: int = 64, bloco_max: int = 4096):
+        self._bits = np.random.PCG64(seed)
+        if posicao:
+            self._bits.advance(posicao)
+        self._bloco = bloco
+        self._bloco_max = bloco_max
+        self._gerador = self._gerar()
+        self.proximo = self._gerador.__next__
+
+    def _gerar(self):
+        while True:
+            yield from (self._bits.random_raw(self._bloco) >> np.uint64(32)).tolist()
+            self._bloco = min(self._bloco * 2, self._bloco_max)
+
+    def proximos(self, n: int) -> list:
+        return list(itertools.islice(self._gerador, n))
+
+
+_por_thread = threading.local()
+
+
+def _fluxo_da_thread() -> _Fluxo:
+    # sem semente cada thread tem o seu fluxo, para as requisições não disputarem o mesmo gerador
+    fluxo = getattr(_por_thread, "fluxo", None)
+    if fluxo is None:
+        fluxo = _por_thread.fluxo = _Fluxo(bloco=4096)
+    return fluxo
 
 
 class Dados:
-    def __init__(self):
-        self._rng = random
+    """
+    Rolagens de dados. Sem semente usa o fluxo da thread; com semente tem o seu
+    próprio fluxo, reproduzível, e rolagens conta quantos números já consumiu
+    (é o que se grava para continuar ou repetir a batalha depois).
+    """
+
+    def __init__(self, seed=None, rolagens: int = 0):
+        self.seed = seed
+        self.rolagens = rolagens
+        self._fluxo = _fluxo_da_thread() if seed is None else _Fluxo(seed, rolagens)
+        self._proximo = self._fluxo.proximo
 
     def rolar(self, faces: int) -> int:
-        return self._rng.randint(1, faces)
+        # multiplica e desloca em vez de usar módulo; o viés é da ordem de faces / 2**32
+        self.rolagens += 1
+        return 1 + (self._proximo() * faces >> 32)
+
+    def rolar_lote(self, faces: int, n: int) -> list:
+        """Rola n dados de faces lados de uma vez."""
+        self.rolagens += n
+        return [1 + (x * faces >> 32) for x in self._fluxo.proximos(n)]
 
     def d4(self) -> int:
         return self.rolar(4)
@@ -30,29 +86,57 @@ class Dados:
 
 
 class Atributo:
+    __slots__ = ("ponto_atributo", "modificador")
+
     def __init__(self, ponto_atributo: int = 10):
         self.ponto_atributo: int = int(ponto_atributo)
         self.modificador: int = self.calcular_modificador()
 
+    @classmethod
+    def de_pontos(cls, ponto_atributo: int) -> "Atributo":
+        """Atributo compartilhado da tabela; não altere o objeto devolvido."""
+        atributo = _ATRIBUTOS.get(ponto_atributo)
+        return atributo if atributo is not None else cls(ponto_atributo)
+
     def calcular_modificador(self) -> int:
         mod = (self.ponto_atributo - 10) // 2
         self.modificador = mod
         return mod
 
 
+# um Atributo pronto para cada pontuação possível, usados ao montar fichas vindas do banco
+_ATRIBUTOS = {pontos: Atributo(pontos) for pontos in range(0, 31)}
+
+
 class Curavel(ABC):
+    __slots__ = ()
+
     @abstractmethod
     def regenerar(self):
         pass
 
 
 class Ficha(Curavel):
+    __slots__ = (
+        "nome", "atributo", "classe", "raca",
+        "forca", "constituicao", "destreza", "inteligencia", "sabedoria", "carisma",
+        "dado", "vida", "vida_max", "ca", "iniciativa",
+    )
+
     vida_regras = {
         "Ladino":    {"dado": 8,  "min": 5},
         "Guerreiro": {"dado": 10, "min": 6},
         "Bárbaro":   {"dado": 12, "min": 7},
     }
 
+    # dados de dano por classe: qtd x dado + modificador do atributo
+    dano_regras = {
+        "Ladino":    {"dado": 6,  "qtd": 2, "atributo": "destreza"},
+        "Guerreiro": {"dado": 10, "qtd": 1, "atributo": "forca"},
+        "Bárbaro":   {"dado": 12, "qtd": 1, "atributo": "forca"},
+    }
+    dano_padrao = {"dado": 8, "qtd": 1, "atributo": "forca"}
+
     def __init__(self, nome, atributo, classe, raca,
                  forca, constituicao, destreza, inteligencia, sabedoria, carisma):
 
@@ -77,24 +161,26 @@ class Ficha(Curavel):
         self.iniciativa = 0
 
     @classmethod
-    def from_db_row(cls, row: dict) -> "Ficha":
+    def from_db_row(cls, row: dict, dados: "Dados" = None) -> "Ficha":
         """
         Monta uma Ficha a partir de uma linha vinda do banco.
+        Não passa pelo __init__: vida e CA já estão gravadas, então não rola nada,
+        e os atributos vêm da tabela compartilhada.
         """
-        ficha = cls(
-            nome=row["nome"],
-            atributo=None,  # se não estiver usando, pode deixar None
-            classe=row["classe"],
-            raca=row["raca"],
-            forca=row["forca"],
-            constituicao=row["constituicao"],
-            destreza=row["destreza"],
-            inteligencia=row["inteligencia"],
-            sabedoria=row["sabedoria"],
-            carisma=row["carisma"],
-        )
-
-        # sobrescreve com os valores gravados no banco
+        ficha = cls.__new__(cls)
+        ficha.nome = row["nome"]
+        ficha.atributo = None
+        ficha.classe = row["classe"]
+        ficha.raca = row["raca"]
+
+        ficha.forca = Atributo.de_pontos(row["forca"])
+        ficha.constituicao = Atributo.de_pontos(row["constituicao"])
+        ficha.destreza = Atributo.de_pontos(row["destreza"])
+        ficha.inteligencia = Atributo.de_pontos(row["inteligencia"])
+        ficha.sabedoria = Atributo.de_pontos(row["sabedoria"])
+        ficha.carisma = Atributo.de_pontos(row["carisma"])
+
+        ficha.dado = dados or Dados()
         ficha.vida = row["vida"]
         ficha.vida_max = row["vida"]      # se no seu sistema "vida" no banco for a vida atual, pode ter um campo separado para vida_max depois
         ficha.ca = row["ca"]
@@ -110,6 +196,20 @@ class Ficha(Curavel):
         base = max(roll, minimo)
         return max(base + self.constituicao.modificador, 1)
 
+    def regra_dano(self) -> dict:
+        return self.dano_regras.get(self.classe, self.dano_padrao)
+
+    def perfil_ataque(self, alvo: "Monstros") -> dict:
+        """Parâmetros do ataque da ficha contra o alvo, usados pelas simulações."""
+        regra = self.regra_dano()
+        return {
+            "bonus_ataque": self.forca.modificador,
+            "ca_alvo": alvo.ca,
+            "dado": regra["dado"],
+            "qtd": regra["qtd"],
+            "bonus_dano": getattr(self, regra["atributo"]).modificador,
+        }
+
     def ca_ficha(self) -> int:
         return 10 + self.destreza.modificador
 
@@ -157,18 +257,9 @@ class Ficha(Curavel):
             }
 
         # dano por classe
-        if self.classe == "Bárbaro":
-            dano_base = self.dado.rolar(12) + self.forca.modificador
-        elif self.classe == "Guerreiro":
-            dano_base = self.dado.rolar(10) + self.forca.modificador
-        elif self.classe == "Ladino":
-            dano_base = (
-                self.dado.rolar(6)
-                + self.dado.rolar(6)
-                + self.destreza.modificador
-            )
-        else:
-            dano_base = self.dado.rolar(8) + self.forca.modificador
+        regra = self.regra_dano()
+        dano_base = sum(self.dado.rolar(regra["dado"]) for _ in range(regra["qtd"]))
+        dano_base += getattr(self, regra["atributo"]).modificador
 
         dano = max(dano_base, 0)
 
@@ -233,6 +324,7 @@ class Ficha(Curavel):
 
 
 class Monstros(ABC):
+    __slots__ = ("hp", "ca")
     hp: int
 
     def __init__(self, hp, ca):
@@ -250,27 +342,67 @@ class Monstros(ABC):
             return "monstro morto!"
 
 
-class Molodoy(Monstros, Curavel):
-    bonus_ataque = 4
-    dano_faces = 8
-    bonus_dano = 0
+class ModeloMonstro(NamedTuple):
+    """
+    Status de um tipo de monstro (uma linha de monstro_tipos, ver bestiario.py).
+    Imutável e compartilhado por todos os monstros do tipo; hp e CA são de cada monstro.
+    """
+    tipo: str
+    bonus_ataque: int
+    dano_qtd: int       # dano_qtd d dano_faces + bonus_dano
+    dano_faces: int
+    bonus_dano: int
+    regen_qtd: int      # regenerar: regen_qtd d regen_faces + regen_bonus
+    regen_faces: int
+    regen_bonus: int
 
-    def __init__(self, dados=None):
-        super().__init__(hp=19, ca=11)
+
+# os números que eram fixos no Molodoy; também a linha inicial do catálogo
+MODELO_MOLODOY = ModeloMonstro("Molodoy", bonus_ataque=4, dano_qtd=1, dano_faces=8, bonus_dano=0,
+                               regen_qtd=2, regen_faces=4, regen_bonus=4)
+
+
+class Monstro(Monstros, Curavel):
+    __slots__ = ("dados", "hp_max", "modelo")
+
+    def __init__(self, modelo: ModeloMonstro, hp: int, ca: int, dados=None):
+        super().__init__(hp=hp, ca=ca)
         self.dados = dados or Dados()
-        self.hp_max = 19
+        self.hp_max = hp
+        self.modelo = modelo
 
     @classmethod
-    def from_db_row(cls, row: dict) -> "Molodoy":
-        m = cls()
+    def from_db_row(cls, row: dict, dados: Dados = None, modelo: ModeloMonstro = MODELO_MOLODOY) -> "Monstro":
+        m = cls.__new__(cls)
         m.hp = row["hp"]
         m.hp_max = row["hp"]
         m.ca = row["ca"]
+        m.dados = dados or Dados()
+        m.modelo = modelo
         return m
 
+    @property
+    def tipo(self) -> str:
+        return self.modelo.tipo
+
+    @property
+    def bonus_ataque(self) -> int:
+        return self.modelo.bonus_ataque
+
+    def perfil_ataque(self, alvo: Ficha) -> dict:
+        modelo = self.modelo
+        return {
+            "bonus_ataque": modelo.bonus_ataque,
+            "ca_alvo": alvo.ca,
+            "dado": modelo.dano_faces,
+            "qtd": modelo.dano_qtd,
+            "bonus_dano": modelo.bonus_dano,
+        }
+
     def atacar(self, j: Ficha):
+        modelo = self.modelo
         d20 = self.dados.d20()
-        total = d20 + self.bonus_ataque
+        total = d20 + modelo.bonus_ataque
 
         if d20 == 1:
             return {
@@ -292,7 +424,11 @@ class Molodoy(Monstros, Curavel):
                 "hp_alvo": j.vida,
             }
 
-        dano = self.dados.rolar(self.dano_faces) + self.bonus_dano
+        # contagem com while: o range() alocaria a cada ataque (ver benchmarks/primitivas.py)
+        dano, dados = modelo.bonus_dano, modelo.dano_qtd
+        while dados:
+            dano += self.dados.rolar(modelo.dano_faces)
+            dados -= 1
         dano = max(dano, 0)
         if crit:
             dano *= 2
@@ -308,7 +444,11 @@ class Molodoy(Monstros, Curavel):
         }
 
     def regenerar(self):
-        cura = self.dados.d4() + self.dados.d4() + 4
+        modelo = self.modelo
+        cura, dados = modelo.regen_bonus, modelo.regen_qtd
+        while dados:
+            cura += self.dados.rolar(modelo.regen_faces)
+            dados -= 1
         antes = self.hp
         self.hp = min(self.hp + cura, self.hp_max)
         efetiva = self.hp - antes
@@ -317,3 +457,11 @@ class Molodoy(Monstros, Curavel):
             "curou": efetiva,
             "hp_atual": self.hp,
         }
+
+
+class Molodoy(Monstro):
+    """O monstro padrão (19 de hp, CA 11), com o MODELO_MOLODOY."""
+    __slots__ = ()
+
+    def __init__(self, dados=None):
+        super().__init__(MODELO_MOLODOY, hp=19, ca=11, dados=dados)
@@ -0,0 +1,121 @@
+"""
+Acesso ao SQLite com o mesmo jeito de chamar do cs50.SQL: db.execute(sql, *args).
+
+O cs50 re-analisa o texto do SQL com o sqlparse, formata os parâmetros e loga a cada
+chamada, o que para as nossas consultas pequenas era a maior parte do tempo. Aqui o SQL
+vai direto para o sqlite3, com o cache de statements preparados de cada conexão.
+
+As conexões ficam num pool. Cada execute pega uma conexão e devolve no fim; depois de
+um BEGIN a conexão fica presa na thread até o COMMIT/ROLLBACK, para a transação inteira
+rodar na mesma conexão; `with db.transacao():` faz o BEGIN/COMMIT (ou ROLLBACK) em volta de um bloco.
+
+Com observador definido, cada execute é cronometrado e o observador recebe (sql, segundos);
+é por aí que o /metrics conta as consultas de cada requisição.
+"""
+import contextlib
+import queue
+import sqlite3
+import threading
+import time
+
+
+class Banco:
+    def __init__(self, caminho: str, tamanho_pool: int = 8, busy_timeout_ms: int = 5000,
+                 cached_statements: int = 256):
+        self.caminho = caminho
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cached_statements = cached_statements
+        self._pool = queue.LifoQueue(maxsize=tamanho_pool)
+        self._local = threading.local()
+        self.observador = None
+
+    def _conectar(self) -> sqlite3.Connection:
+        con = sqlite3.connect(
+            self.caminho,
+            isolation_level=None,   # autocommit, como o cs50; transações só com BEGIN explícito
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            timeout=self.busy_timeout_ms / 1000,
+        )
+        con.execute("PRAGMA journal_mode = WAL")
+        con.execute("PRAGMA synchronous = NORMAL")
+        con.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        con.execute("PRAGMA foreign_keys = ON")
+        return con
+
+    def _pegar(self) -> sqlite3.Connection:
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self._conectar()
+
+    def _devolver(self, con: sqlite3.Connection):
+        try:
+            self._pool.put_nowait(con)
+        except queue.Full:
+            con.close()
+
+    def execute(self, sql: str, *args):
+        """
+        SELECT (ou qualquer comando que devolva linhas) -> lista de dicts;
+        INSERT -> id da linha inserida; UPDATE/DELETE -> linhas afetadas; o resto -> True.
+        """
+        with self._conexao(sql) as con:
+            cur = con.execute(sql, args)
+            if cur.description is not None:
+                nomes = [d[0] for d in cur.description]
+                return [dict(zip(nomes, linha)) for linha in cur.fetchall()]
+            comando = sql.lstrip()[:6].upper()
+            if comando == "INSERT":
+                return cur.lastrowid
+            if comando in ("UPDATE", "DELETE"):
+                return cur.rowcount
+            return True
+
+    def iterar(self, sql: str, *args, lote: int = 1000):
+        """Linhas (dicts) de um SELECT grande, lidas `lote` por vez em vez de todas de uma vez."""
+        with self._conexao(sql) as con:
+            cur = con.execute(sql, args)
+            nomes = [d[0] for d in cur.description]
+            while True:
+                linhas = cur.fetchmany(lote)
+                if not linhas:
+                    return
+                for linha in linhas:
+                    yield dict(zip(nomes, linha))
+
+    def executemany(self, sql: str, linhas) -> int:
+        """O mesmo comando para cada tupla de parâmetros, num statement preparado só; devolve as linhas afetadas."""
+        with self._conexao(sql) as con:
+            return con.executemany(sql, linhas).rowcount
+
+    @contextlib.contextmanager
+    def transacao(self):
+        """BEGIN no início do bloco, COMMIT no fim, ROLLBACK (e a exceção segue) se ele levantar."""
+        self.execute("BEGIN TRANSACTION")
+        try:
+            yield self
+        except Exception:
+            self.execute("ROLLBACK")
+            raise
+        self.execute("COMMIT")
+
+    @contextlib.contextmanager
+    def _conexao(self, sql: str):
+        observador = self.observador
+        inicio = time.perf_counter() if observador else 0.0
+        con = getattr(self._local, "con", None)
+        presa = con is not None
+        if not presa:
+            con = self._pegar()
+        try:
+            yield con
+        finally:
+            if con.in_transaction:
+                self._local.con = con
+            else:
+                if presa:
+                    self._local.con = None
+                self._devolver(con)
+            if observador:
+                observador(sql, time.perf_counter() - inicio)
@@ -0,0 +1,66 @@
+"""
+Custo por consulta do cs50.SQL contra o Banco, nas consultas que as rotas mais fazem.
+
+    python benchmarks/banco.py [--n 5000]
+
+Roda num banco temporário com o schema do app.db, então não mexe nos dados.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from banco import Banco  # noqa: E402
+
+AQUI = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONSULTAS = [
+    ("usuario", "SELECT id, userName, email FROM users WHERE userName = ? OR email = ? LIMIT 1", ("bench", "bench")),
+    ("ficha", "SELECT * FROM fichas WHERE user_id = ? LIMIT 1", (1,)),
+    ("batalha", "SELECT * FROM batalhas WHERE id = ? LIMIT 1", (1,)),
+    ("turno", "UPDATE batalhas SET m_hp = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?", (19, 1)),
+]
+
+
+def medir(db, n: int) -> dict:
+    tempos = {}
+    for nome, sql, args in CONSULTAS:
+        db.execute(sql, *args)   # aquece
+        inicio = time.perf_counter()
+        for _ in range(n):
+            db.execute(sql, *args)
+        tempos[nome] = (time.perf_counter() - inicio) / n * 1e6
+    return tempos
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=5000, help="execuções por consulta")
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp()
+    try:
+        caminho = os.path.join(pasta, "bench.db")
+        shutil.copy(os.path.join(AQUI, "app.db"), caminho)
+
+        resultados = {"Banco": medir(Banco(caminho), args.n)}
+        try:
+            from cs50 import SQL
+        except ImportError:
+            print("cs50 não instalado; medindo só o Banco")
+        else:
+            resultados["cs50.SQL"] = medir(SQL(f"sqlite:///{caminho}"), args.n)
+
+        print(f"{'consulta':<10}" + "".join(f"{nome:>14}" for nome in resultados) + "   (µs por execute)")
+        for nome, _, _ in CONSULTAS:
+            print(f"{nome:<10}" + "".join(f"{r[nome]:>14.1f}" for r in resultados.values()))
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+"""
+Carga de ponta a ponta: jogadores virtuais fazendo o caminho inteiro do jogo.
+
+    python benchmarks/carga.py [--jogadores 32] [--segundos 30] [--modo threads|asgi] [--saida carga.json]
+    python benchmarks/carga.py --url http://127.0.0.1:5000 ...
+
+Cada jogador se cadastra (/cadastro), faz login, cria a ficha (/ficha/roll/vida +
+/ficha/roll/ca), lê a ficha e a lista de /monstros e depois luta batalhas inteiras
+pelas rotas /batalha/* (iniciar, iniciativa e ataques até alguém cair) até o tempo
+acabar.
+
+Sem --url, o servidor sobe num processo próprio numa cópia do app.db em pasta
+temporária (o banco original não é tocado). Com --url, a carga vai para um
+servidor já rodando; os usuários criados ficam no banco dele.
+
+Mostra requisições por segundo e p50/p95/p99 por rota, erros e quantas respostas
+foram lock do SQLite (503 "Banco de dados ocupado"). O mesmo resultado vai em JSON
+para --saida, com o commit atual, para comparar rodadas entre commits.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+AQUI = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODOS = {
+    "threads": [sys.executable, "-c", "import sys; from app import app; app.run(port=int(sys.argv[1]), threaded=True)"],
+    "asgi": [sys.executable, "-m", "uvicorn", "asgi:app", "--log-level", "warning", "--port"],
+}
+CLASSES = ["Ladino", "Guerreiro", "Bárbaro"]
+RACAS = ["Humano", "Elfo", "Anão", "Halfling", "Meio-Orc"]
+POOL = [15, 14, 13, 12, 10, 8]
+ATRIBUTOS = ["forca", "constituicao", "destreza", "inteligencia", "sabedoria", "carisma"]
+BANCO_OCUPADO = "Banco de dados ocupado"
+ACAO_DA_FASE = {"initiative": "initiative", "player": "player_attack", "monster": "monster_attack"}
+MAX_TURNOS = 500
+
+
+class Medidas:
+    """Latências e erros por rota, somados de todos os jogadores."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = {}   # rota -> [segundos]
+        self.erros = {}       # rota -> respostas 5xx ou falha de conexão
+        self.travas = {}      # rota -> 503 de lock do SQLite
+        self.batalhas = 0
+
+    def juntar(self, latencias, erros, travas, batalhas):
+        with self._lock:
+            for rota, valores in latencias.items():
+                self.latencias.setdefault(rota, []).extend(valores)
+            for rota, n in erros.items():
+                self.erros[rota] = self.erros.get(rota, 0) + n
+            for rota, n in travas.items():
+                self.travas[rota] = self.travas.get(rota, 0) + n
+            self.batalhas += batalhas
+
+
+class Jogador:
+    def __init__(self, host: str, porta: int, nome: str, fim: float):
+        self.host, self.porta, self.nome, self.fim = host, porta, nome, fim
+        self.con = http.client.HTTPConnection(host, porta, timeout=30)
+        self.latencias, self.erros, self.travas = {}, {}, {}
+        self.batalhas = 0
+
+    def pedir(self, rota: str, metodo: str, caminho: str, corpo=None):
+        """(status, json) da resposta; status 0 quando a conexão falhou."""
+        headers = {"Content-Type": "application/json"} if corpo is not None else {}
+        inicio = time.perf_counter()
+        try:
+            self.con.request(metodo, caminho, body=json.dumps(corpo) if corpo is not None else None, headers=headers)
+            resp = self.con.getresponse()
+            dados = resp.read()
+        except (OSError, http.client.HTTPException):
+            self.erros[rota] = self.erros.get(rota, 0) + 1
+            self.con.close()
+            self.con = http.client.HTTPConnection(self.host, self.porta, timeout=30)
+            return 0, {}
+        self.latencias.setdefault(rota, []).append(time.perf_counter() - inicio)
+        try:
+            resposta = json.loads(dados) if dados else {}
+        except ValueError:
+            resposta = {}
+        if resp.status == 503 and BANCO_OCUPADO in (resposta.get("message") or ""):
+            self.travas[rota] = self.travas.get(rota, 0) + 1
+        elif resp.status >= 500:
+            self.erros[rota] = self.erros.get(rota, 0) + 1
+        return resp.status, resposta
+
+    def preparar(self) -> list:
+        """Cadastro, login e ficha; devolve os ids de monstros para lutar."""
+        senha = secrets.token_hex(8)
+        self.pedir("POST /cadastro", "POST", "/cadastro",
+                   {"userName": self.nome, "email": f"{self.nome}@carga.local", "senha": senha})
+        self.pedir("POST /login", "POST", "/login", {"userName": self.nome, "senha": senha})
+
+        pontos = random.sample(POOL, len(POOL))
+        ficha = {
+            "userName": self.nome, "nome": self.nome.title(),
+            "raca": random.choice(RACAS), "classe": random.choice(CLASSES),
+            "atributos": dict(zip(ATRIBUTOS, pontos)),
+        }
+        status, resposta = self.pedir("POST /ficha/roll/vida", "POST", "/ficha/roll/vida", ficha)
+        if status == 200:
+            self.pedir("POST /ficha/roll/ca", "POST", "/ficha/roll/ca", {**ficha, "vida": resposta["vida"]})
+        self.pedir("GET /ficha", "GET", "/ficha?" + urllib.parse.urlencode({"userName": self.nome}))
+
+        _, resposta = self.pedir("GET /monstros", "GET", "/monstros")
+        return [m["id"] for m in resposta.get("monstros", [])]
+
+    def lutar(self, monstro_id: int):
+        status, resposta = self.pedir("POST /batalha/iniciar", "POST", "/batalha/iniciar",
+                                      {"userName": self.nome, "monstro_id": monstro_id})
+        if status != 201:
+            return
+        battle = resposta["battle"]
+        for _ in range(MAX_TURNOS):
+            if battle["fase"] == "ended":
+                self.batalhas += 1
+                return
+            if time.perf_counter() >= self.fim:
+                return
+            acao = ACAO_DA_FASE[battle["fase"]]
+            status, resposta = self.pedir(f"POST /batalha/roll/{acao}", "POST", f"/batalha/roll/{acao}",
+                                          {"battle_id": battle["id"]})
+            if status != 200:
+                return
+            battle = resposta["battle"]
+
+    def rodar(self, medidas: Medidas):
+        try:
+            monstros = self.preparar()
+            while monstros and time.perf_counter() < self.fim:
+                self.lutar(random.choice(monstros))
+        finally:
+            self.con.close()
+            medidas.juntar(self.latencias, self.erros, self.travas, self.batalhas)
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _esperar(porta: int, processo, limite: float = 30):
+    fim = time.time() + limite
+    while time.time() < fim:
+        if processo.poll() is not None:
+            raise RuntimeError("servidor saiu antes de responder")
+        try:
+            con = http.client.HTTPConnection("127.0.0.1", porta, timeout=1)
+            con.request("GET", "/monstros?limite=1")
+            con.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("servidor não respondeu")
+
+
+def _percentil(valores, p):
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else float("nan")
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=AQUI, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def rodar(host: str, porta: int, jogadores: int, segundos: float) -> dict:
+    medidas = Medidas()
+    prefixo = "carga" + secrets.token_hex(3)
+    inicio = time.perf_counter()
+    fim = inicio + segundos
+    threads = [threading.Thread(target=Jogador(host, porta, f"{prefixo}_{i}", fim).rodar, args=(medidas,))
+               for i in range(jogadores)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.perf_counter() - inicio
+
+    rotas = {}
+    for rota in sorted(set(medidas.latencias) | set(medidas.erros)):
+        valores = sorted(medidas.latencias.get(rota, []))
+        rotas[rota] = {
+            "requisicoes": len(valores),
+            "req_s": len(valores) / duracao,
+            "p50_ms": _percentil(valores, 0.50) * 1000,
+            "p95_ms": _percentil(valores, 0.95) * 1000,
+            "p99_ms": _percentil(valores, 0.99) * 1000,
+            "erros": medidas.erros.get(rota, 0),
+            "travas_sqlite": medidas.travas.get(rota, 0),
+        }
+    todas = sorted(v for valores in medidas.latencias.values() for v in valores)
+    return {
+        "duracao_s": duracao,
+        "batalhas": medidas.batalhas,
+        "total": {
+            "requisicoes": len(todas),
+            "req_s": len(todas) / duracao,
+            "p50_ms": _percentil(todas, 0.50) * 1000,
+            "p95_ms": _percentil(todas, 0.95) * 1000,
+            "p99_ms": _percentil(todas, 0.99) * 1000,
+            "erros": sum(medidas.erros.values()),
+            "travas_sqlite": sum(medidas.travas.values()),
+        },
+        "rotas": rotas,
+    }
+
+
+def mostrar(r: dict):
+    print(f"{'rota':<34}{'n':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'erros':>7}{'locks':>7}")
+    for rota, m in list(r["rotas"].items()) + [("total", r["total"])]:
+        print(f"{rota:<34}{m['requisicoes']:>8}{m['req_s']:>9.1f}{m['p50_ms']:>9.1f}{m['p95_ms']:>9.1f}"
+              f"{m['p99_ms']:>9.1f}{m['erros']:>7}{m['travas_sqlite']:>7}")
+    print(f"{r['batalhas']} batalhas terminadas em {r['duracao_s']:.1f}s "
+          f"({r['batalhas'] / r['duracao_s']:.1f}/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jogadores", type=int, default=32, help="jogadores virtuais ao mesmo tempo")
+    parser.add_argument("--segundos", type=float, default=30)
+    parser.add_argument("--url", help="servidor já rodando; sem isso sobe um numa cópia do app.db")
+    parser.add_argument("--modo", choices=sorted(MODOS), default="threads", help="como subir o servidor local")
+    parser.add_argument("--senha-custo", type=int, default=1000,
+                        help="SENHA_CUSTO do servidor local; o padrão de produção deixaria o cadastro dominar a carga")
+    parser.add_argument("--env", action="append", default=[], metavar="CHAVE=VALOR",
+                        help="variável de ambiente extra para o servidor local (ex.: BATALHA_STORE=1)")
+    parser.add_argument("--saida", help="arquivo JSON com o resultado")
+    args = parser.parse_args()
+
+    parametros = {"jogadores": args.jogadores, "segundos": args.segundos}
+    if args.url:
+        url = urllib.parse.urlsplit(args.url)
+        parametros["url"] = args.url
+        resultado = rodar(url.hostname, url.port or 80, args.jogadores, args.segundos)
+    else:
+        extra = dict(item.split("=", 1) for item in args.env)
+        parametros.update(modo=args.modo, senha_custo=args.senha_custo, env=extra)
+        pasta = tempfile.mkdtemp()
+        shutil.copy(os.path.join(AQUI, "app.db"), pasta)
+        porta = _porta_livre()
+        env = {**os.environ, **extra, "PYTHONPATH": AQUI, "SENHA_CUSTO": str(args.senha_custo)}
+        processo = subprocess.Popen(MODOS[args.modo] + [str(porta)], cwd=pasta, env=env,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            _esperar(porta, processo)
+            resultado = rodar("127.0.0.1", porta, args.jogadores, args.segundos)
+        finally:
+            processo.terminate()
+            processo.wait()
+            shutil.rmtree(pasta, ignore_errors=True)
+
+    mostrar(resultado)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"commit": _commit(), "quando": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "parametros": parametros, **resultado}, f, ensure_ascii=False, indent=2)
+        print(f"resultado em {args.saida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Compara o modo com threads (app.run(threaded=True)) com o modo ASGI (uvicorn asgi:app).
+
+    python benchmarks/carga_asgi.py [--concorrencia 64] [--segundos 10]
+
+Cada modo sobe num processo próprio, numa cópia do app.db em pasta temporária.
+Os clientes misturam leituras (GET /ficha, GET /monstros) e escritas
+(POST /batalha/iniciar com resolver=true) e o script mostra requisições por
+segundo, p50, p99 e erros de cada modo.
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+AQUI = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODOS = {
+    "threads": [sys.executable, "-c", "import sys; from app import app; app.run(port=int(sys.argv[1]), threaded=True)"],
+    "asgi": [sys.executable, "-m", "uvicorn", "asgi:app", "--log-level", "warning", "--port"],
+}
+ATRIBUTOS = {"forca": 15, "constituicao": 14, "destreza": 13, "inteligencia": 12, "sabedoria": 10, "carisma": 8}
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _pedir(con, metodo, caminho, corpo=None):
+    headers = {"Content-Type": "application/json"} if corpo is not None else {}
+    con.request(metodo, caminho, body=json.dumps(corpo) if corpo is not None else None, headers=headers)
+    resp = con.getresponse()
+    dados = resp.read()
+    return resp.status, dados
+
+
+def _esperar(porta: int, processo, limite: float = 30):
+    fim = time.time() + limite
+    while time.time() < fim:
+        if processo.poll() is not None:
+            raise RuntimeError("servidor saiu antes de responder")
+        try:
+            con = http.client.HTTPConnection("127.0.0.1", porta, timeout=1)
+            _pedir(con, "GET", "/monstros")
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("servidor não respondeu")
+
+
+def _preparar(porta: int):
+    con = http.client.HTTPConnection("127.0.0.1", porta)
+    _pedir(con, "POST", "/cadastro", {"userName": "carga", "email": "carga@x.com", "senha": "carga"})
+    base = {"userName": "carga", "nome": "Carga", "raca": "Humano", "classe": "Guerreiro", "atributos": ATRIBUTOS}
+    _, dados = _pedir(con, "POST", "/ficha/roll/vida", base)
+    _pedir(con, "POST", "/ficha/roll/ca", {**base, "vida": json.loads(dados)["vida"]})
+    _, dados = _pedir(con, "GET", "/monstros?limite=1")
+    return json.loads(dados)["monstros"][0]["id"]
+
+
+def _rodar_clientes(porta: int, monstro_id: int, concorrencia: int, segundos: float):
+    latencias, erros = [], [0]
+    lock = threading.Lock()
+    fim = time.perf_counter() + segundos
+    pedidos = [
+        ("GET", "/ficha?userName=carga", None),
+        ("GET", "/monstros", None),
+        ("POST", "/batalha/iniciar", {"userName": "carga", "monstro_id": monstro_id, "resolver": True}),
+    ]
+
+    def cliente(i):
+        con = http.client.HTTPConnection("127.0.0.1", porta, timeout=30)
+        minhas, meus_erros, n = [], 0, i
+        while time.perf_counter() < fim:
+            metodo, caminho, corpo = pedidos[n % len(pedidos)]
+            n += 1
+            inicio = time.perf_counter()
+            try:
+                status, _ = _pedir(con, metodo, caminho, corpo)
+                if status >= 500:
+                    meus_erros += 1
+            except (OSError, http.client.HTTPException):
+                meus_erros += 1
+                con.close()
+                con = http.client.HTTPConnection("127.0.0.1", porta, timeout=30)
+                continue
+            minhas.append(time.perf_counter() - inicio)
+        with lock:
+            latencias.extend(minhas)
+            erros[0] += meus_erros
+
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(concorrencia)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencias, erros[0], time.perf_counter() - inicio
+
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] if valores else float("nan")
+
+
+def medir(modo: str, concorrencia: int, segundos: float) -> dict:
+    pasta = tempfile.mkdtemp()
+    shutil.copy(os.path.join(AQUI, "app.db"), pasta)
+    porta = _porta_livre()
+    env = {**os.environ, "PYTHONPATH": AQUI, "SENHA_CUSTO": "1000"}
+    processo = subprocess.Popen(MODOS[modo] + [str(porta)], cwd=pasta, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _esperar(porta, processo)
+        monstro_id = _preparar(porta)
+        latencias, erros, duracao = _rodar_clientes(porta, monstro_id, concorrencia, segundos)
+    finally:
+        processo.terminate()
+        processo.wait()
+        shutil.rmtree(pasta, ignore_errors=True)
+    return {
+        "modo": modo,
+        "req_s": len(latencias) / duracao,
+        "p50_ms": _percentil(latencias, 0.50) * 1000,
+        "p99_ms": _percentil(latencias, 0.99) * 1000,
+        "erros": erros,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concorrencia", type=int, default=64)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--modos", default="threads,asgi")
+    args = parser.parse_args()
+
+    print(f"{args.concorrencia} clientes simultâneos, {args.segundos:.0f}s por modo")
+    print(f"{'modo':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'erros':>8}")
+    for modo in args.modos.split(","):
+        r = medir(modo, args.concorrencia, args.segundos)
+        print(f"{r['modo']:<8}{r['req_s']:>10.1f}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['erros']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""
+Vários processos jogando os turnos das mesmas batalhas ao mesmo tempo.
+
+    python benchmarks/concorrencia.py [--processos 8] [--batalhas 1] [--threads 2]
+
+Cada processo sobe o app (Flask test client) sobre a mesma cópia do app.db numa pasta
+temporária, como workers de um gunicorn, e todos esperam numa barreira para começar
+juntos. Cada um lê a batalha do banco, manda a ação da fase em que ela está com o turno
+que leu e repete até ela terminar; quem perde a corrida recebe 409 (ou 400, se quando
+chegou a fase já era outra) e lê de novo.
+
+No fim confere, para cada batalha, que:
+  - houve exatamente um 200 por evento gravado (nenhum turno jogado duas vezes ou perdido);
+  - os seq dos eventos são 1, 2, 3... sem buraco;
+  - cada evento é a ação da fase deixada pelo anterior, e o turno avança de um em um;
+  - repetir a batalha pela semente (combate.jogar) dá os mesmos eventos;
+e que as estatísticas do jogador (estatisticas_usuarios) contaram cada batalha uma vez.
+
+Roda com BATALHA_STORE=0: com o store ligado os turnos ficam na memória do processo
+até o flush, o que só vale com um worker.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+AQUI = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROTA_DA_FASE = {
+    "initiative": "/batalha/roll/initiative",
+    "player": "/batalha/roll/player_attack",
+    "monster": "/batalha/roll/monster_attack",
+}
+ATRIBUTOS = dict(forca=15, constituicao=14, destreza=13, inteligencia=12, sabedoria=10, carisma=8)
+
+
+def _importar_app(pasta: str):
+    os.environ["BATALHA_STORE"] = "0"
+    os.environ.setdefault("SENHA_CUSTO", "1000")
+    os.chdir(pasta)
+    sys.path.insert(0, AQUI)
+    import app
+    return app
+
+
+def preparar(app, batalhas: int) -> list:
+    """Cria um jogador com ficha e as batalhas contra o primeiro monstro; retorna os ids."""
+    c = app.app.test_client()
+    nome = f"conc{os.getpid()}"
+    c.post("/cadastro", json={"userName": nome, "email": f"{nome}@teste.com", "senha": "s3nha"})
+    ficha = {"userName": nome, "nome": nome, "raca": "Humano", "classe": "Guerreiro", "atributos": ATRIBUTOS}
+    vida = c.post("/ficha/roll/vida", json=ficha).get_json()["vida"]
+    c.post("/ficha/roll/ca", json={**ficha, "vida": vida})
+    monstro_id = c.get("/monstros").get_json()["monstros"][0]["id"]
+    return [
+        c.post("/batalha/iniciar", json={"userName": nome, "monstro_id": monstro_id}).get_json()["battle"]["id"]
+        for _ in range(batalhas)
+    ]
+
+
+def _jogar(app, battle_ids: list, contagem: dict, lock):
+    c = app.app.test_client()
+    vivas = list(battle_ids)
+    while vivas:
+        for battle_id in list(vivas):
+            b = app.get_battle(battle_id)
+            if b["fase"] == "ended":
+                vivas.remove(battle_id)
+                continue
+            r = c.post(ROTA_DA_FASE[b["fase"]], json={"battle_id": battle_id, "turno": b["turno"]})
+            with lock:
+                chave = (battle_id, r.status_code)
+                contagem[chave] = contagem.get(chave, 0) + 1
+
+
+def trabalhador(pasta: str, battle_ids: list, threads: int, barreira, fila):
+    app = _importar_app(pasta)
+    contagem, lock = {}, threading.Lock()
+    barreira.wait()
+    ts = [threading.Thread(target=_jogar, args=(app, battle_ids, contagem, lock)) for _ in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    fila.put(contagem)
+
+
+def conferir(app, battle_id: int, sucessos: int) -> list:
+    """Problemas encontrados na batalha; lista vazia se está tudo certo."""
+    from back_end import Dados, Ficha
+    from combate import jogar, proximo_turno
+    from estado_batalhas import ler_eventos
+
+    problemas = []
+    b = app.get_battle(battle_id)
+    eventos = ler_eventos(app.shards.da_batalha(battle_id), battle_id)
+    if b["fase"] != "ended":
+        problemas.append(f"não terminou (fase {b['fase']})")
+    if sucessos != len(eventos):
+        problemas.append(f"{sucessos} respostas 200 para {len(eventos)} eventos")
+    if [e["seq"] for e in eventos] != list(range(1, len(eventos) + 1)):
+        problemas.append(f"seq com buraco ou repetido: {[e['seq'] for e in eventos]}")
+
+    fase, turno = "initiative", 1
+    for e in eventos:
+        if e["acao"] != fase:
+            problemas.append(f"evento {e['seq']}: {e['acao']} na fase {fase}")
+        turno = proximo_turno(e["acao"], turno)
+        if e["turno"] != turno:
+            problemas.append(f"evento {e['seq']}: turno {e['turno']}, esperado {turno}")
+        fase = e["fase"]
+
+    ficha_row = app.shards.do_usuario(b["user_id"]).execute("SELECT * FROM fichas WHERE user_id = ?", b["user_id"])
+    ficha = Ficha.from_db_row(ficha_row[0])
+    monstro = app.bestiario.montar(app.db.execute("SELECT * FROM monstros WHERE id = ?", b["monstro_id"])[0])
+    log = jogar(ficha, monstro, Dados(seed=b["seed"]))
+    campos = ("acao", "fase", "j_vida", "m_hp", "rolagens", "turno")
+    if [tuple(e[k] for k in campos) for e in log] != [tuple(e[k] for k in campos) for e in eventos]:
+        problemas.append("eventos diferentes da batalha repetida pela semente")
+    return problemas
+
+
+def conferir_estatisticas(app, battle_ids: list) -> list:
+    """As batalhas são todas do mesmo jogador, que não tinha nenhuma antes."""
+    batalhas = [app.get_battle(battle_id) for battle_id in battle_ids]
+    user_id = batalhas[0]["user_id"]
+    esperado = {
+        "batalhas": sum(b["fase"] == "ended" for b in batalhas),
+        "vitorias": sum(b["vencedor"] == "player" for b in batalhas),
+        "derrotas": sum(b["vencedor"] == "monster" for b in batalhas),
+    }
+    rows = app.shards.do_usuario(user_id).execute("SELECT * FROM estatisticas_usuarios WHERE user_id = ?", user_id)
+    contado = {k: rows[0][k] if rows else 0 for k in esperado}
+    return [] if contado == esperado else [f"estatísticas {contado}, esperado {esperado}"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processos", type=int, default=8)
+    parser.add_argument("--threads", type=int, default=2, help="threads por processo")
+    parser.add_argument("--batalhas", type=int, default=1, help="batalhas disputadas por todos os processos")
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp()
+    shutil.copy(os.path.join(AQUI, "app.db"), pasta)
+    try:
+        app = _importar_app(pasta)
+        battle_ids = preparar(app, args.batalhas)
+
+        ctx = multiprocessing.get_context("spawn")
+        barreira = ctx.Barrier(args.processos)
+        fila = ctx.Queue()
+        processos = [
+            ctx.Process(target=trabalhador, args=(pasta, battle_ids, args.threads, barreira, fila))
+            for _ in range(args.processos)
+        ]
+        inicio = time.perf_counter()
+        for p in processos:
+            p.start()
+        contagens = [fila.get() for _ in processos]
+        for p in processos:
+            p.join()
+        duracao = time.perf_counter() - inicio
+
+        por_status = {}
+        for contagem in contagens:
+            for (battle_id, status), n in contagem.items():
+                por_status.setdefault(battle_id, {})
+                por_status[battle_id][status] = por_status[battle_id].get(status, 0) + n
+
+        print(f"{args.processos} processos x {args.threads} threads, {len(battle_ids)} batalha(s), {duracao:.2f}s")
+        falhou = False
+        for battle_id in battle_ids:
+            status = por_status.get(battle_id, {})
+            problemas = conferir(app, battle_id, status.get(200, 0))
+            resumo = ", ".join(f"{s}: {n}" for s, n in sorted(status.items()))
+            print(f"batalha {battle_id}: {resumo} -> {'ok' if not problemas else 'FALHOU'}")
+            for problema in problemas:
+                print("   ", problema)
+            falhou = falhou or bool(problemas)
+        problemas = conferir_estatisticas(app, battle_ids)
+        print(f"estatísticas do jogador -> {'ok' if not problemas else 'FALHOU'}")
+        for problema in problemas:
+            print("   ", problema)
+        falhou = falhou or bool(problemas)
+    finally:
+        os.chdir(AQUI)
+        shutil.rmtree(pasta, ignore_errors=True)
+    sys.exit(1 if falhou else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Custo de montar a Ficha e o monstro de um turno a partir das linhas do banco.
+
+    python benchmarks/fichas.py [--n 100000]
+
+"antigo" é o caminho de antes do from_db_row sem __init__: construir pelo __init__
+(seis Atributo, Dados, duas rolagens de vida, CA) e sobrescrever com a linha.
+"catalogo" é o do Bestiario: o modelo do tipo vem de um dict com 1000 tipos.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from back_end import MODELO_MOLODOY, Ficha, Molodoy, Monstro  # noqa: E402
+
+FICHA = {
+    "nome": "Bench", "classe": "Bárbaro", "raca": "Humano",
+    "forca": 15, "constituicao": 14, "destreza": 13, "inteligencia": 12, "sabedoria": 10, "carisma": 8,
+    "vida": 16, "ca": 11, "iniciativa": 0,
+}
+MONSTRO = {"id": 1, "nome": "Gorgash", "tipo": "Molodoy", "hp": 19, "ca": 11}
+MODELOS = {f"Tipo{i}": MODELO_MOLODOY._replace(tipo=f"Tipo{i}") for i in range(999)}
+MODELOS["Molodoy"] = MODELO_MOLODOY
+
+
+def antigo():
+    ficha = Ficha(
+        nome=FICHA["nome"], atributo=None, classe=FICHA["classe"], raca=FICHA["raca"],
+        forca=FICHA["forca"], constituicao=FICHA["constituicao"], destreza=FICHA["destreza"],
+        inteligencia=FICHA["inteligencia"], sabedoria=FICHA["sabedoria"], carisma=FICHA["carisma"],
+    )
+    ficha.vida = ficha.vida_max = FICHA["vida"]
+    ficha.ca = FICHA["ca"]
+    ficha.iniciativa = FICHA["iniciativa"]
+    monstro = Molodoy()
+    monstro.hp = monstro.hp_max = MONSTRO["hp"]
+    monstro.ca = MONSTRO["ca"]
+    return ficha, monstro
+
+
+def novo():
+    return Ficha.from_db_row(FICHA), Molodoy.from_db_row(MONSTRO)
+
+
+def catalogo():
+    return Ficha.from_db_row(FICHA), Monstro.from_db_row(MONSTRO, None, MODELOS[MONSTRO["tipo"]])
+
+
+def medir(funcao, n: int):
+    funcao()
+    inicio = time.perf_counter()
+    for _ in range(n):
+        funcao()
+    por_turno = (time.perf_counter() - inicio) / n * 1e6
+
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    funcao()
+    pico = tracemalloc.get_traced_memory()[1] - antes
+    tracemalloc.stop()
+    return por_turno, pico
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'caminho':<10}{'µs/turno':>10}{'bytes alocados':>16}")
+    for nome, funcao in (("antigo", antigo), ("novo", novo), ("catalogo", catalogo)):
+        por_turno, pico = medir(funcao, args.n)
+        print(f"{nome:<10}{por_turno:>10.2f}{pico:>16}")
+
+
+if __name__ == "__main__":
+    main()
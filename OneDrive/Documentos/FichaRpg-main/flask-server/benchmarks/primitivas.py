@@ -0,0 +1,189 @@
+"""
+Micro-benchmarks das primitivas do back_end que rodam em toda requisição, com
+comparação contra uma linha de base.
+
+    python benchmarks/primitivas.py                 # mede e compara com primitivas_base.json
+    python benchmarks/primitivas.py --salvar        # mede e grava a nova linha de base
+    python benchmarks/primitivas.py --limite 0.1 --so ficha.atacar,batalha
+
+Para cada primitiva mostra operações por segundo (melhor de --repeticoes rodadas)
+e bytes alocados por chamada (mediana do pico do tracemalloc). Sai com código 1 se alguma
+ficou mais lenta que a base além de --limite (fração; 0.2 = 20%) ou passou a
+alocar mais que isso, para poder rodar antes do merge.
+
+A base vale para a máquina em que foi gravada: em outra máquina, grave uma nova
+com --salvar antes de comparar.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from back_end import Atributo, Dados, Ficha, Molodoy  # noqa: E402
+from combate import jogar  # noqa: E402
+
+BASE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "primitivas_base.json")
+
+FICHA = {
+    "nome": "Bench", "classe": "Bárbaro", "raca": "Humano",
+    "forca": 15, "constituicao": 14, "destreza": 13, "inteligencia": 12, "sabedoria": 10, "carisma": 8,
+    "vida": 16, "ca": 11, "iniciativa": 0,
+}
+MONSTRO = {"id": 1, "nome": "Gorgash", "tipo": "Molodoy", "hp": 19, "ca": 11}
+VIDA_INFINITA = 10 ** 9   # o alvo nunca cai, então todo ataque passa pelo mesmo caminho
+
+
+def primitivas() -> dict:
+    """nome -> função sem argumentos que executa a primitiva uma vez."""
+    dados = Dados(seed=1)
+    atributo = Atributo(15)
+    ficha = Ficha.from_db_row(FICHA, dados)
+    monstro = Molodoy.from_db_row(MONSTRO, dados)
+
+    alvo_ficha = Ficha.from_db_row(FICHA, dados)
+    alvo_ficha.vida = VIDA_INFINITA
+    alvo_monstro = Molodoy.from_db_row(MONSTRO, dados)
+    alvo_monstro.hp = VIDA_INFINITA
+
+    curando_ficha = Ficha.from_db_row(FICHA, dados)
+    curando_ficha.vida_max = VIDA_INFINITA
+    curando_monstro = Molodoy.from_db_row(MONSTRO, dados)
+    curando_monstro.hp_max = VIDA_INFINITA
+
+    def nova_ficha():
+        return Ficha("Bench", None, "Bárbaro", "Humano", 15, 14, 13, 12, 10, 8)
+
+    def batalha():
+        ficha.vida = FICHA["vida"]
+        monstro.hp = MONSTRO["hp"]
+        return jogar(ficha, monstro, dados)
+
+    return {
+        "dados.rolar": lambda: dados.rolar(20),
+        "dados.rolar_lote": lambda: dados.rolar_lote(6, 8),
+        "atributo.calcular_modificador": atributo.calcular_modificador,
+        "ficha.__init__": nova_ficha,
+        "ficha.calculo_vida": ficha.calculo_vida,
+        "ficha.from_db_row": lambda: Ficha.from_db_row(FICHA, dados),
+        "ficha.atacar": lambda: ficha.atacar(alvo_monstro),
+        "ficha.regenerar": curando_ficha.regenerar,
+        "molodoy.atacar": lambda: monstro.atacar(alvo_ficha),
+        "molodoy.regenerar": curando_monstro.regenerar,
+        "batalha": batalha,
+    }
+
+
+def _rodar(funcao, n: int) -> float:
+    inicio = time.perf_counter()
+    for _ in itertools.repeat(None, n):
+        funcao()
+    return time.perf_counter() - inicio
+
+
+def ops_por_segundo(funcao, repeticoes: int, alvo_s: float = 0.2) -> float:
+    # calibra n para cada rodada levar ~alvo_s e fica com a melhor (a menos atrapalhada pelo sistema)
+    n = 1
+    while (tempo := _rodar(funcao, n)) < alvo_s / 10:
+        n *= 10
+    n = max(1, int(n * alvo_s / tempo))
+    return max(n / _rodar(funcao, n) for _ in range(repeticoes))
+
+
+def bytes_alocados(funcao, chamadas: int = 201) -> int:
+    # mediana do pico de várias chamadas: ataques que erram alocam menos que os que acertam,
+    # e de tempos em tempos o fluxo de dados gera um bloco novo
+    funcao()
+    picos = []
+    tracemalloc.start()
+    for _ in range(chamadas):
+        antes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        funcao()
+        picos.append(tracemalloc.get_traced_memory()[1] - antes)
+    tracemalloc.stop()
+    return statistics.median_low(picos)
+
+
+def medir(nomes, repeticoes: int) -> dict:
+    casos = primitivas()
+    return {
+        nome: {"ops_s": ops_por_segundo(casos[nome], repeticoes), "bytes": bytes_alocados(casos[nome])}
+        for nome in nomes
+    }
+
+
+def comparar(atual: dict, base: dict, limite: float) -> list:
+    """Nomes das primitivas que regrediram além do limite."""
+    regrediram = []
+    for nome, m in atual.items():
+        b = base.get(nome)
+        if b is None:
+            continue
+        # alguns bytes de folga: o pico do tracemalloc varia um pouco entre versões do Python
+        if m["ops_s"] < b["ops_s"] * (1 - limite) or m["bytes"] > b["bytes"] * (1 + limite) + 64:
+            regrediram.append(nome)
+    return regrediram
+
+
+def _maquina() -> dict:
+    return {"python": platform.python_version(), "plataforma": platform.platform(), "cpu": platform.processor()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--salvar", action="store_true", help="grava o resultado como nova linha de base")
+    parser.add_argument("--base", default=BASE)
+    parser.add_argument("--limite", type=float, default=0.2, help="regressão tolerada, em fração da base")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--so", help="só estas primitivas, separadas por vírgula")
+    args = parser.parse_args()
+
+    nomes = args.so.split(",") if args.so else list(primitivas())
+    desconhecidas = set(nomes) - set(primitivas())
+    if desconhecidas:
+        parser.error(f"primitivas desconhecidas: {', '.join(sorted(desconhecidas))}")
+
+    atual = medir(nomes, args.repeticoes)
+
+    base = {}
+    if not args.salvar and os.path.exists(args.base):
+        with open(args.base, encoding="utf-8") as f:
+            gravada = json.load(f)
+        base = gravada["primitivas"]
+        if gravada.get("maquina") != _maquina():
+            print(f"aviso: a base foi gravada em outra máquina ({gravada.get('maquina')}); compare com cuidado")
+
+    regrediram = comparar(atual, base, args.limite)
+    print(f"{'primitiva':<32}{'ops/s':>14}{'base':>14}{'Δ':>8}{'bytes':>8}{'base':>8}")
+    for nome, m in atual.items():
+        b = base.get(nome)
+        linha = f"{nome:<32}{m['ops_s']:>14,.0f}"
+        if b:
+            linha += f"{b['ops_s']:>14,.0f}{m['ops_s'] / b['ops_s'] - 1:>+8.1%}{m['bytes']:>8}{b['bytes']:>8}"
+        else:
+            linha += f"{'-':>14}{'-':>8}{m['bytes']:>8}{'-':>8}"
+        print(linha + ("  <- regrediu" if nome in regrediram else ""))
+
+    if args.salvar:
+        if os.path.exists(args.base):
+            with open(args.base, encoding="utf-8") as f:
+                # --so regrava só as medidas pedidas, as outras continuam as da base anterior
+                atual = {**json.load(f)["primitivas"], **atual}
+        with open(args.base, "w", encoding="utf-8") as f:
+            json.dump({"maquina": _maquina(), "primitivas": atual}, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"linha de base gravada em {args.base}")
+    elif regrediram:
+        print(f"{len(regrediram)} primitiva(s) regrediram mais de {args.limite:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
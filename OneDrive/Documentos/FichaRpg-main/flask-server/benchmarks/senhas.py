@@ -0,0 +1,66 @@
+"""
+Logins por segundo em cada custo de hash, para dimensionar o deploy.
+
+    python benchmarks/senhas.py [--custos 100000,310000,600000] [--segundos 3]
+
+"por núcleo" é uma thread conferindo senhas sem parar; "pool" é o PoolSenhas com
+um worker por núcleo recebendo pedidos de várias threads, como os workers do Flask.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from senhas import PoolSenhas, conferir, gerar_hash  # noqa: E402
+
+
+def por_nucleo(armazenado: str, segundos: float) -> float:
+    n = 0
+    fim = time.perf_counter() + segundos
+    while time.perf_counter() < fim:
+        conferir("senha-de-teste", armazenado)
+        n += 1
+    return n / segundos
+
+
+def pelo_pool(custo: int, armazenado: str, segundos: float, clientes: int) -> float:
+    pool = PoolSenhas(custo=custo, timeout=60, max_fila=clientes)
+    total = [0] * clientes
+    fim = time.perf_counter() + segundos
+
+    def cliente(i):
+        while time.perf_counter() < fim:
+            pool.conferir("senha-de-teste", armazenado)
+            total[i] += 1
+
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(total) / (time.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--custos", default="100000,310000,600000")
+    parser.add_argument("--segundos", type=float, default=3.0)
+    parser.add_argument("--clientes", type=int, default=16, help="threads pedindo login ao mesmo tempo")
+    args = parser.parse_args()
+
+    nucleos = os.cpu_count() or 1
+    print(f"{nucleos} núcleo(s)")
+    print(f"{'custo':>10}{'ms/login':>10}{'por núcleo/s':>14}{'pool/s':>10}")
+    for custo in (int(c) for c in args.custos.split(",")):
+        armazenado = gerar_hash("senha-de-teste", custo)
+        taxa = por_nucleo(armazenado, args.segundos)
+        taxa_pool = pelo_pool(custo, armazenado, args.segundos, args.clientes)
+        print(f"{custo:>10}{1000 / taxa:>10.1f}{taxa:>14.1f}{taxa_pool:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Vazão de escrita das batalhas com o app.db sozinho e com 1, 2, 4... shards.
+
+    python benchmarks/shards.py [--shards 0,1,2,4,8] [--processos 8] [--segundos 10]
+
+Para cada número de shards, copia o app.db para uma pasta temporária, distribui com
+shards.redistribuir() e cria --usuarios jogadores com ficha. Depois --processos
+processos (como workers de um gunicorn) jogam batalhas inteiras ao mesmo tempo pelo
+mesmo caminho das rotas, sem o Flask: Shards.inserir_batalha, e a cada fase
+BatalhaStore.carregar + combate + BatalhaStore.salvar (store desligado, um evento
+gravado por fase). Cada processo joga com os seus usuários, espalhados pelos shards.
+
+Mostra escritas por segundo (INSERT da batalha + eventos + retrato final), batalhas
+por segundo e o ganho sobre a primeira configuração da lista. O ganho vem de os
+processos não esperarem pela trava de escrita uns dos outros, então aparece com mais
+de um núcleo ou com disco lento; numa máquina de um núcleo só a CPU já é o limite.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from banco import Banco  # noqa: E402
+from bestiario import Bestiario  # noqa: E402
+from combate import ataque_jogador, ataque_monstro, rolar_iniciativa  # noqa: E402
+from estado_batalhas import BatalhaStore  # noqa: E402
+from schema import migrar  # noqa: E402
+from shards import Shards, redistribuir  # noqa: E402
+
+AQUI = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FICHA = dict(nome="Bench", raca="Humano", classe="Guerreiro", forca=15, constituicao=14, destreza=13,
+             inteligencia=12, sabedoria=10, carisma=8, vida=12, ca=11)
+
+
+def preparar(pasta: str, n: int, usuarios: int) -> tuple:
+    """Banco com os usuários e fichas já nos shards; retorna (user_ids, monstro)."""
+    db = Banco(os.path.join(pasta, "app.db"))
+    migrar(db)
+    if n:
+        redistribuir(db, os.path.join(pasta, "shards"), n)
+    shards = Shards(db, n, os.path.join(pasta, "shards"))
+    user_ids = []
+    for i in range(usuarios):
+        user_ids.append(db.execute("INSERT INTO users (userName, email, password_hash) VALUES (?, ?, 'x')",
+                                   f"bench{i}", f"bench{i}@teste.com"))
+        shards.do_usuario(user_ids[-1]).execute(
+            f"INSERT INTO fichas (user_id, {', '.join(FICHA)}) VALUES (?{', ?' * len(FICHA)})",
+            user_ids[-1], *FICHA.values(),
+        )
+    monstro = db.execute("SELECT * FROM monstros ORDER BY id LIMIT 1")[0]
+    return user_ids, monstro
+
+
+def trabalhador(pasta: str, n: int, user_ids: list, monstro: dict, segundos: float, barreira, fila):
+    db = Banco(os.path.join(pasta, "app.db"))
+    shards = Shards(db, n, os.path.join(pasta, "shards"))
+    store = BatalhaStore(shards, Bestiario(db))
+    escritas = batalhas = 0
+    barreira.wait()
+    fim = time.perf_counter() + segundos
+    while time.perf_counter() < fim:
+        user_id = user_ids[batalhas % len(user_ids)]
+        battle_id = shards.inserir_batalha(user_id, monstro["id"], FICHA["vida"], monstro["hp"], batalhas)
+        escritas += 1
+        while True:
+            estado = store.carregar(battle_id)
+            b = estado.batalha
+            if b["fase"] == "ended":
+                break
+            ficha, monstro_obj = estado.ficha, estado.monstro
+            ficha.vida, monstro_obj.hp = b["j_vida"], b["m_hp"]
+            if b["fase"] == "initiative":
+                resposta, mudancas = rolar_iniciativa(ficha, estado.dados)
+            elif b["fase"] == "player":
+                resposta, mudancas = ataque_jogador(ficha, monstro_obj)
+            else:
+                resposta, mudancas = ataque_monstro(ficha, monstro_obj)
+            store.salvar(estado, b["fase"], resposta, **mudancas)
+            escritas += 1
+        escritas += 1   # o retrato regravado quando a batalha termina
+        batalhas += 1
+    fila.put((escritas, batalhas))
+
+
+def rodar(n: int, processos: int, usuarios: int, segundos: float) -> dict:
+    pasta = tempfile.mkdtemp()
+    try:
+        shutil.copy(os.path.join(AQUI, "app.db"), pasta)
+        user_ids, monstro = preparar(pasta, n, usuarios)
+
+        ctx = multiprocessing.get_context("spawn")
+        barreira = ctx.Barrier(processos)
+        fila = ctx.Queue()
+        filhos = [
+            ctx.Process(target=trabalhador, args=(pasta, n, user_ids[i::processos], monstro, segundos, barreira, fila))
+            for i in range(processos)
+        ]
+        for p in filhos:
+            p.start()
+        resultados = [fila.get() for _ in filhos]
+        for p in filhos:
+            p.join()
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+    return {
+        "escritas_s": sum(e for e, _ in resultados) / segundos,
+        "batalhas_s": sum(b for _, b in resultados) / segundos,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", default="0,1,2,4,8", help="configurações a medir; 0 = só o app.db")
+    parser.add_argument("--processos", type=int, default=8)
+    parser.add_argument("--usuarios", type=int, default=256)
+    parser.add_argument("--segundos", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} núcleo(s), {args.processos} processos, {args.segundos:.0f}s por configuração")
+    print(f"{'shards':>8}{'escritas/s':>14}{'batalhas/s':>14}{'ganho':>8}")
+    primeira = None
+    for n in (int(x) for x in args.shards.split(",")):
+        r = rodar(n, args.processos, args.usuarios, args.segundos)
+        primeira = primeira or r["escritas_s"]
+        print(f"{n or 'app.db':>8}{r['escritas_s']:>14,.0f}{r['batalhas_s']:>14,.1f}{r['escritas_s'] / primeira:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
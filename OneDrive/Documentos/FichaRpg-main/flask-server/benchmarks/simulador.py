@@ -0,0 +1,94 @@
+"""
+Confere o simulador vetorizado contra o combate escalar.
+
+    python benchmarks/simulador.py [--batalhas 4000] [--simulacoes 200000] [--sigmas 4]
+
+Para cada classe joga --batalhas batalhas pelo combate.jogar (a mesma Ficha/Molodoy
+das rotas, com Dados de semente seed, seed + 1, ...) e roda o simulador.simular no
+mesmo confronto. Compara a taxa de vitória do jogador e a média de turnos (ataques) dos
+dois: a diferença tem que ficar dentro de --sigmas desvios-padrão da diferença entre
+as duas amostras. Sai com código 1 se alguma ficou fora, para poder rodar antes do merge.
+"""
+import argparse
+import math
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from back_end import Dados, Ficha, Molodoy  # noqa: E402
+from combate import jogar  # noqa: E402
+from simulador import simular  # noqa: E402
+
+FICHA = {
+    "nome": "Bench", "raca": "Humano",
+    "forca": 15, "constituicao": 14, "destreza": 13, "inteligencia": 12, "sabedoria": 10, "carisma": 8,
+    "vida": 16, "ca": 11, "iniciativa": 0,
+}
+MONSTRO = {"id": 1, "nome": "Gorgash", "tipo": "Molodoy", "hp": 19, "ca": 11}
+CLASSES = ("Bárbaro", "Guerreiro", "Ladino", "Mago")
+
+
+def jogar_batalhas(classe: str, n: int, seed: int):
+    """Vitórias do jogador e turnos de cada uma das n batalhas jogadas pelo combate escalar."""
+    vitorias, turnos = 0, []
+    for i in range(n):
+        ficha = Ficha.from_db_row({**FICHA, "classe": classe})
+        monstro = Molodoy.from_db_row(MONSTRO)
+        fim = jogar(ficha, monstro, Dados(seed + i))[-1]
+        vitorias += fim["vencedor"] == "player"
+        turnos.append(fim["turno"] - 1)   # o turno começa em 1 e cada ataque soma um
+    return vitorias, turnos
+
+
+def comparar(classe: str, batalhas: int, simulacoes: int, seed: int, sigmas: float) -> bool:
+    inicio = time.perf_counter()
+    vitorias, turnos = jogar_batalhas(classe, batalhas, seed)
+    escalar_s = time.perf_counter() - inicio
+    inicio = time.perf_counter()
+    sim = simular(Ficha.from_db_row({**FICHA, "classe": classe}), Molodoy.from_db_row(MONSTRO), simulacoes, seed)
+    sim_s = time.perf_counter() - inicio
+
+    # as duas amostras são da mesma distribuição se o simulador segue as regras,
+    # então a variância de cada lado vem da amostra escalar
+    p = vitorias / batalhas
+    erro_p = math.sqrt(p * (1 - p) * (1 / batalhas + 1 / simulacoes)) or 1 / batalhas
+    media = statistics.fmean(turnos)
+    erro_t = math.sqrt(statistics.variance(turnos) * (1 / batalhas + 1 / simulacoes))
+
+    ok = True
+    print(f"{classe} ({batalhas} escalares em {escalar_s:.2f}s, {simulacoes} simuladas em {sim_s:.2f}s)")
+    for nome, escalar, simulado, erro in (
+        ("vitória do jogador", p, sim["vitoria_jogador"], erro_p),
+        ("turnos médios", media, sim["turnos_medios"], erro_t),
+    ):
+        z = (simulado - escalar) / erro
+        dentro = abs(z) <= sigmas
+        ok &= dentro
+        print(f"  {nome:<20} escalar {escalar:8.4f}  simulador {simulado:8.4f}  "
+              f"{z:+6.2f} sigma  {'ok' if dentro else 'FORA'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulador vetorizado contra o combate escalar")
+    parser.add_argument("--batalhas", type=int, default=4000, help="batalhas pelo combate.jogar, por classe")
+    parser.add_argument("--simulacoes", type=int, default=200_000, help="batalhas do simular, por classe")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--sigmas", type=float, default=4.0, help="tolerância, em desvios-padrão")
+    parser.add_argument("--classes", default=",".join(CLASSES))
+    args = parser.parse_args()
+
+    falhas = [
+        classe for classe in args.classes.split(",")
+        if not comparar(classe, args.batalhas, args.simulacoes, args.seed, args.sigmas)
+    ]
+    if falhas:
+        print("fora da tolerância:", ", ".join(falhas))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Catálogo dos tipos de monstro, compilado em memória.
+
+O bônus de ataque, o dado de dano e a regeneração eram fixos na classe Molodoy, e
+todo monstro virava Molodoy, qualquer que fosse o tipo. Agora cada tipo é uma linha
+de monstro_tipos no app.db:
+
+    tipo          TEXT PRIMARY KEY     o monstros.tipo
+    bonus_ataque  INTEGER              d20 + bonus_ataque contra a CA
+    dano_qtd, dano_faces, bonus_dano   dano = dano_qtd d dano_faces + bonus_dano
+    regen_qtd, regen_faces, regen_bonus
+
+O Bestiario lê a tabela uma vez e guarda um back_end.ModeloMonstro (imutável) por
+tipo; montar um monstro para o turno é uma consulta a um dict, sem ir ao banco. A
+tabela é relida numa thread a cada `intervalo` segundos (BESTIARIO_INTERVALO no app)
+e, se mudou, o dict inteiro é trocado de uma vez; um tipo que ainda não está no dict
+também força uma releitura. Os monstros já montados ficam com o modelo que tinham.
+
+Para incluir ou alterar tipos, com o servidor no ar:
+
+    python bestiario.py --csv tipos.csv [--banco app.db]   # colunas como as da tabela
+    python bestiario.py --listar
+"""
+import argparse
+import csv
+import logging
+import threading
+import time
+
+from back_end import MODELO_MOLODOY, ModeloMonstro, Monstro
+from banco import Banco
+
+logger = logging.getLogger(__name__)
+COLUNAS = ModeloMonstro._fields
+
+
+class TipoDesconhecido(LookupError):
+    def __init__(self, tipo: str):
+        super().__init__(f"tipo de monstro sem linha em monstro_tipos: {tipo}")
+        self.tipo = tipo
+
+
+def criar_tabela(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS monstro_tipos (
+          tipo          TEXT PRIMARY KEY,
+          bonus_ataque  INTEGER NOT NULL,
+          dano_qtd      INTEGER NOT NULL DEFAULT 1 CHECK (dano_qtd >= 1),
+          dano_faces    INTEGER NOT NULL CHECK (dano_faces >= 1),
+          bonus_dano    INTEGER NOT NULL DEFAULT 0,
+          regen_qtd     INTEGER NOT NULL DEFAULT 0 CHECK (regen_qtd >= 0),
+          regen_faces   INTEGER NOT NULL DEFAULT 4 CHECK (regen_faces >= 1),
+          regen_bonus   INTEGER NOT NULL DEFAULT 0,
+          updated_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # o tipo padrão de monstros.tipo, com os números que eram fixos no código
+    db.execute(
+        f"INSERT OR IGNORE INTO monstro_tipos ({', '.join(COLUNAS)}) VALUES ({', '.join('?' * len(COLUNAS))})",
+        *MODELO_MOLODOY,
+    )
+
+
+def gravar_tipos(db, linhas: list) -> int:
+    """INSERT OR REPLACE dos tipos (dicts com as COLUNAS) numa transação; retorna quantos."""
+    with db.transacao():
+        db.executemany(
+            f"INSERT OR REPLACE INTO monstro_tipos ({', '.join(COLUNAS)}, updated_at) "
+            f"VALUES ({', '.join('?' * len(COLUNAS))}, CURRENT_TIMESTAMP)",
+            [tuple(linha[c] for c in COLUNAS) for linha in linhas],
+        )
+    return len(linhas)
+
+
+class Bestiario:
+    def __init__(self, db):
+        self.db = db
+        self.recargas = 0
+        self._modelos = {}
+        self._lock = threading.Lock()   # uma releitura por vez
+        self._thread = None
+        criar_tabela(db)
+        self.recarregar()
+
+    def recarregar(self) -> bool:
+        """Relê monstro_tipos; retorna True se algum tipo mudou."""
+        with self._lock:
+            rows = self.db.execute(f"SELECT {', '.join(COLUNAS)} FROM monstro_tipos")
+            modelos = {r["tipo"]: ModeloMonstro(**r) for r in rows}
+            if modelos == self._modelos:
+                return False
+            # troca o dict inteiro: quem está lendo vê o antigo ou o novo, nunca metade
+            self._modelos = modelos
+            self.recargas += 1
+            return True
+
+    def modelo(self, tipo: str) -> ModeloMonstro:
+        modelo = self._modelos.get(tipo)
+        if modelo is None:
+            # tipo incluído depois da última releitura da thread
+            self.recarregar()
+            modelo = self._modelos.get(tipo)
+            if modelo is None:
+                raise TipoDesconhecido(tipo)
+        return modelo
+
+    def montar(self, row: dict, dados=None) -> Monstro:
+        """Monstro da linha de monstros, com o modelo do tipo dela."""
+        return Monstro.from_db_row(row, dados, self.modelo(row["tipo"]))
+
+    def tipos(self) -> dict:
+        return dict(self._modelos)
+
+    def iniciar(self, intervalo: float = 5):
+        """Relê o catálogo numa thread a cada `intervalo` segundos."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, args=(intervalo,), name="bestiario", daemon=True)
+        self._thread.start()
+
+    def _loop(self, intervalo: float):
+        while True:
+            time.sleep(intervalo)
+            try:
+                self.recarregar()
+            except Exception:
+                logger.exception("falha ao reler o catálogo de monstros")
+
+
+def _ler_csv(caminho: str) -> list:
+    with open(caminho, newline="", encoding="utf-8") as f:
+        return [
+            {c: (registro[c].strip() if c == "tipo" else int(registro[c])) for c in COLUNAS}
+            for registro in csv.DictReader(f)
+        ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inclui ou altera tipos de monstro (monstro_tipos)")
+    parser.add_argument("--banco", default="app.db")
+    parser.add_argument("--csv", help=f"colunas {','.join(COLUNAS)}")
+    parser.add_argument("--listar", action="store_true")
+    args = parser.parse_args()
+
+    db = Banco(args.banco)
+    criar_tabela(db)
+    if args.csv:
+        print(f"{gravar_tipos(db, _ler_csv(args.csv))} tipos gravados; os servidores releem sozinhos")
+    if args.listar or not args.csv:
+        for modelo in Bestiario(db).tipos().values():
+            print(", ".join(f"{c}={v}" for c, v in modelo._asdict().items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Cache LRU em memória, com validade opcional, usado pelas respostas das rotas.
+Cada processo tem o seu; quem escreve no banco chama invalidar()/limpar().
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, max_itens: int = 1024, ttl: float = None):
+        self.max_itens = max_itens
+        self.ttl = ttl          # segundos; None = não expira, só sai por LRU ou invalidação
+        self.hits = 0
+        self.misses = 0
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave, padrao=None):
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None or (self.ttl is not None and item[1] < time.monotonic()):
+                if item is not None:
+                    del self._itens[chave]
+                self.misses += 1
+                return padrao
+            self._itens.move_to_end(chave)
+            self.hits += 1
+            return item[0]
+
+    def set(self, chave, valor):
+        expira = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._itens[chave] = (valor, expira)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+
+    def invalidar(self, *chaves):
+        with self._lock:
+            for chave in chaves:
+                self._itens.pop(chave, None)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {"itens": len(self._itens), "hits": self.hits, "misses": self.misses}
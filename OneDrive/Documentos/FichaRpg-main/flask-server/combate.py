@@ -0,0 +1,109 @@
+"""
+Regras de cada fase da batalha (iniciativa, ataque do jogador, ataque do monstro),
+usadas pelas rotas /batalha/*, pelo replay e pela resolução automática.
+
+Cada ataque devolve dois dicts: o que vai na resposta para o cliente e as mudanças
+que devem ser gravadas na batalha (vida/hp, fase e vencedor).
+"""
+from back_end import Dados, Ficha, Monstros
+
+
+def rolar_iniciativa(ficha: Ficha, dados: Dados):
+    """Quem tirar mais começa; d20 + mod. de destreza do jogador contra o d20 do monstro, empate para o jogador."""
+    dex_mod = ficha.destreza.modificador
+    d20_player = dados.d20()
+    d20_monstro = dados.d20()
+    fase = "player" if d20_player + dex_mod >= d20_monstro else "monster"
+    return {"d20_player": d20_player, "dexMod": dex_mod, "d20_monstro": d20_monstro}, {"fase": fase}
+
+
+def proximo_turno(acao: str, turno: int) -> int:
+    """Cada ataque, do jogador ou do monstro, fecha um turno; a iniciativa não conta."""
+    return turno if acao == "initiative" else turno + 1
+
+
+def _interpretar(resultado: dict):
+    if resultado["tipo"] in ("errou", "falha"):
+        return False, False, 0
+    return True, resultado["critico"], resultado["dano"]
+
+
+def ataque_jogador(ficha: Ficha, monstro: Monstros):
+    resultado = ficha.atacar(monstro)
+    d20 = resultado["d20"]
+    hit, critico, dano = _interpretar(resultado)
+
+    new_m_hp = resultado["hp_alvo"]
+    vencedor = None
+    fase = "monster"
+    if new_m_hp <= 0:
+        new_m_hp = 0
+        fase = "ended"
+        vencedor = "player"
+
+    resposta = {
+        "d20": d20,
+        "ataque": d20 + ficha.forca.modificador,
+        "dano": dano,
+        "hit": hit,
+        "critico": critico,
+        "ca_monstro": monstro.ca,
+    }
+    return resposta, {"m_hp": new_m_hp, "fase": fase, "vencedor": vencedor}
+
+
+def ataque_monstro(ficha: Ficha, monstro: Monstros):
+    resultado = monstro.atacar(ficha)
+    d20 = resultado["d20"]
+    hit, critico, dano = _interpretar(resultado)
+
+    new_j_vida = resultado["hp_alvo"]
+    vencedor = None
+    fase = "player"
+    if new_j_vida <= 0:
+        new_j_vida = 0
+        fase = "ended"
+        vencedor = "monster"
+
+    resposta = {
+        "d20": d20,
+        "ataque": d20 + monstro.bonus_ataque,
+        "dano": dano,
+        "hit": hit,
+        "critico": critico,
+        "ca_jogador": ficha.ca,
+    }
+    return resposta, {"j_vida": new_j_vida, "fase": fase, "vencedor": vencedor}
+
+
+def jogar(ficha: Ficha, monstro: Monstros, dados: Dados, fase: str = "initiative",
+          ate_rolagem: int = None, max_turnos: int = 1000, turno: int = 1) -> list:
+    """
+    Joga a batalha a partir da fase dada, com a vida/hp atuais da ficha e do monstro,
+    até ela terminar (ou até o fluxo de dados chegar em ate_rolagem, usado no replay).
+    Devolve o log com cada fase jogada ("acao"), o resultado dela e o estado depois dela.
+    """
+    ficha.dado = monstro.dados = dados
+    log = []
+    while fase != "ended" and len(log) < max_turnos:
+        if ate_rolagem is not None and dados.rolagens >= ate_rolagem:
+            break
+        if fase == "initiative":
+            resposta, mudancas = rolar_iniciativa(ficha, dados)
+        elif fase == "player":
+            resposta, mudancas = ataque_jogador(ficha, monstro)
+        else:
+            resposta, mudancas = ataque_monstro(ficha, monstro)
+        turno = proximo_turno(fase, turno)
+        log.append({
+            "acao": fase,
+            **resposta,
+            "fase": mudancas["fase"],
+            "vencedor": mudancas.get("vencedor"),
+            "j_vida": ficha.vida,
+            "m_hp": monstro.hp,
+            "rolagens": dados.rolagens,
+            "turno": turno,
+        })
+        fase = mudancas["fase"]
+    return log
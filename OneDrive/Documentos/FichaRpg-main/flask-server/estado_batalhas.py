@@ -0,0 +1,509 @@
+"""
+Estado das batalhas em andamento mantido em memória.
+
+Cada turno das rotas /batalha/* buscava a batalha, a ficha e o monstro no banco,
+gravava o resultado e relia a batalha. Com o store ativo, a batalha e os objetos
+Ficha/Monstro já montados ficam em memória e as mudanças de j_vida, m_hp, fase e
+vencedor vão para a tabela batalhas em lote (write-behind): quando a janela de
+durabilidade vence, quando há pendências demais ou quando a batalha termina.
+
+Com o store desligado o comportamento é o de sempre: lê do banco a cada turno e
+grava na hora. O store ativo exige um único processo servindo as batalhas (um worker
+só no gunicorn): cada processo teria a sua própria cópia do estado, e quando dois
+gravam a mesma batalha o flush de um deles conflita e descarta turnos que já
+responderam 200 (logados como erro e contados em turnos_descartados, no /metrics).
+
+Cada fase jogada é gravada como um evento em batalha_eventos (só INSERT, com o d20,
+dano e crítico que foram para o cliente). A linha de batalhas é um retrato até o
+evento evento_seq, atualizado quando a batalha termina; o estado atual é o do último
+evento depois do retrato (ler_batalhas), e reconstruir() refaz a batalha evento a evento.
+
+O seq do evento é a versão da batalha: o INSERT do evento seq+1 só passa para quem
+carregou a batalha na versão seq (UNIQUE(batalha_id, seq)), então entre vários
+processos só uma requisição ganha cada turno e as outras recebem Conflito. Dentro do
+processo, com o store ativo, o lock do EstadoBatalha serializa os turnos da mesma batalha;
+o flush pega esse lock sem esperar, e a batalha com um turno em andamento em outra
+thread fica pendente para o próximo flush.
+
+Com shards (shards.py), cada batalha é lida e gravada no shard do dono, e um lote de
+batalhas vira uma transação por shard.
+
+O evento que termina a batalha soma a vitória ou a derrota em estatisticas_usuarios
+na mesma transação, então cada batalha conta uma vez só; depois do COMMIT as linhas
+novas vão para ao_terminar (o ranking.Ranking do app).
+"""
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from back_end import Dados, Ficha, ModeloMonstro, Monstro
+from combate import proximo_turno
+
+# colunas próprias do evento; o resto do que a fase devolveu vai em detalhes (JSON)
+COLUNAS_EVENTO = ("seq", "acao", "fase", "vencedor", "j_vida", "m_hp", "rolagens", "turno")
+
+_SELECT_BATALHAS = """
+    SELECT b.*, e.seq AS ev_seq, e.fase AS ev_fase, e.vencedor AS ev_vencedor,
+           e.j_vida AS ev_j_vida, e.m_hp AS ev_m_hp, e.rolagens AS ev_rolagens, e.turno AS ev_turno
+    FROM batalhas b
+    LEFT JOIN batalha_eventos e
+      ON e.batalha_id = b.id
+     AND e.seq = (SELECT MAX(seq) FROM batalha_eventos WHERE batalha_id = b.id)
+     AND e.seq > b.evento_seq
+    WHERE b.id IN ({marcas})
+"""
+
+_INSERT_EVENTO = """
+    INSERT INTO batalha_eventos (batalha_id, seq, acao, fase, vencedor, j_vida, m_hp, rolagens, turno, detalhes)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_UPDATE_RETRATO = """
+    UPDATE batalhas
+    SET j_vida = ?, m_hp = ?, fase = ?, vencedor = COALESCE(vencedor, ?), rolagens = ?, turno = ?, evento_seq = ?,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = ?
+"""
+
+_SOMAR_ESTATISTICA = """
+    INSERT INTO estatisticas_usuarios (user_id, vitorias, derrotas, batalhas, turnos, ultima_batalha)
+    VALUES (?, ?, ?, 1, ?, ?)
+    ON CONFLICT (user_id) DO UPDATE SET
+      vitorias = vitorias + excluded.vitorias,
+      derrotas = derrotas + excluded.derrotas,
+      batalhas = batalhas + 1,
+      turnos = turnos + excluded.turnos,
+      ultima_batalha = MAX(COALESCE(ultima_batalha, 0), excluded.ultima_batalha),
+      updated_at = CURRENT_TIMESTAMP
+    RETURNING *
+"""
+
+
+class Conflito(Exception):
+    """Outra requisição gravou um turno da batalha depois que ela foi carregada."""
+
+    def __init__(self, battle_id: int = None):
+        super().__init__(f"batalha {battle_id} mudou enquanto o turno era jogado")
+        self.battle_id = battle_id
+
+
+def _eh_conflito(e: Exception) -> bool:
+    return isinstance(e, sqlite3.IntegrityError) and "batalha_eventos" in str(e)
+
+
+def ler_batalhas(db, battle_ids) -> dict:
+    """battle_id -> batalha no estado atual: o retrato da tabela batalhas mais o último evento depois dele."""
+    battle_ids = list(battle_ids)
+    if not battle_ids:
+        return {}
+    linhas = db.execute(_SELECT_BATALHAS.format(marcas=",".join("?" * len(battle_ids))), *battle_ids)
+    batalhas = {}
+    for b in linhas:
+        evento = {chave[3:]: b.pop(chave) for chave in [c for c in b if c.startswith("ev_")]}
+        b["seq"] = b["evento_seq"]
+        if evento["seq"] is not None:
+            _aplicar_evento(b, evento)
+        batalhas[b["id"]] = b
+    return batalhas
+
+
+def ler_eventos(db, battle_id: int) -> list:
+    """Eventos da batalha em ordem, no mesmo formato do log de combate.jogar (mais o seq)."""
+    return ler_eventos_varios(db, [battle_id]).get(battle_id, [])
+
+
+def ler_eventos_varios(db, battle_ids) -> dict:
+    """battle_id -> eventos em ordem, para as batalhas que têm algum."""
+    battle_ids = list(battle_ids)
+    if not battle_ids:
+        return {}
+    eventos = {}
+    for linha in db.execute(
+        "SELECT batalha_id, seq, acao, fase, vencedor, j_vida, m_hp, rolagens, turno, detalhes FROM batalha_eventos "
+        f"WHERE batalha_id IN ({','.join('?' * len(battle_ids))}) ORDER BY batalha_id, seq",
+        *battle_ids,
+    ):
+        battle_id = linha.pop("batalha_id")
+        detalhes = json.loads(linha.pop("detalhes"))
+        # eventos antigos têm fase/vencedor só dentro de detalhes
+        eventos.setdefault(battle_id, []).append(
+            {**detalhes, **{k: v for k, v in linha.items() if v is not None or k not in detalhes}}
+        )
+    return eventos
+
+
+def reconstruir(batalha: dict, eventos: list) -> dict:
+    """Cópia da batalha com os eventos aplicados em ordem, a partir de um retrato anterior a eles."""
+    b = dict(batalha)
+    for evento in eventos:
+        _aplicar_evento(b, evento)
+    return b
+
+
+def _aplicar_evento(b: dict, evento: dict):
+    b["seq"] = evento["seq"]
+    b["fase"] = evento["fase"]
+    b["vencedor"] = evento["vencedor"]
+    b["j_vida"] = evento["j_vida"]
+    b["m_hp"] = evento["m_hp"]
+    if evento.get("rolagens") is not None:
+        b["rolagens"] = evento["rolagens"]
+    if evento.get("turno") is not None:
+        b["turno"] = evento["turno"]
+
+
+class EstadoBatalha:
+    """Linha de batalhas mais a Ficha, o Monstro e o fluxo de dados já montados para ela."""
+
+    def __init__(self, batalha: dict, ficha_row: dict, monstro_row: dict, modelo: ModeloMonstro):
+        self.batalha = batalha
+        # os dois lados rolam do fluxo da batalha, que continua de onde parou
+        self.dados = Dados(seed=batalha.get("seed"), rolagens=batalha.get("rolagens") or 0)
+        self.ficha = Ficha.from_db_row(ficha_row, self.dados)
+        self.monstro = Monstro.from_db_row(monstro_row, self.dados, modelo)
+        self.eventos = []   # fases jogadas que ainda não foram gravadas
+        # um turno por vez nesta batalha (store ativo: o estado é compartilhado); RLock porque o
+        # salvar chama o flush, que pega o lock de cada batalha, com o desta já na mão
+        self.lock = threading.RLock()
+
+
+class BatalhaStore:
+    def __init__(self, shards, bestiario, ativo: bool = False, janela: float = 2.0,
+                 max_pendentes: int = 100, max_estados: int = 10000, logger=None):
+        self.shards = shards
+        self.bestiario = bestiario          # modelo do tipo de cada monstro, sem ir ao banco
+        self.ativo = ativo
+        self.janela = janela                # segundos que uma mudança pode ficar só em memória
+        self.max_pendentes = max_pendentes  # batalhas sujas que disparam um flush
+        self.max_estados = max_estados      # batalhas mantidas em memória
+        self._estados = {}
+        self._pendentes = {}                # battle_id -> instante da primeira mudança não gravada
+        self._lock = threading.RLock()
+        self._thread = None
+        self.ao_terminar = None             # recebe as linhas de estatisticas_usuarios que mudaram
+        self.logger = logger or logging.getLogger(__name__)
+        self.turnos_descartados = 0         # fases que responderam 200 mas perderam no flush (Conflito)
+
+    # ---------------------- leitura ----------------------
+    def carregar(self, battle_id: int):
+        """Retorna o EstadoBatalha da batalha, buscando no banco se não estiver em memória."""
+        if self.ativo:
+            with self._lock:
+                estado = self._estados.get(battle_id)
+            if estado is not None:
+                return estado
+
+        estado = self._ler_do_banco(battle_id)
+        # batalha terminada não joga mais turnos: não ocupa lugar das que estão em andamento
+        if estado is None or not self.ativo or estado.batalha["fase"] == "ended":
+            return estado
+
+        with self._lock:
+            estado = self._estados.setdefault(battle_id, estado)
+            self._limitar_estados()
+        return estado
+
+    def carregar_varios(self, battle_ids) -> dict:
+        """
+        Como carregar(), para várias batalhas: as que não estão em memória vêm do banco
+        com uma consulta por tabela (IN (...)); as terminadas não ficam em memória.
+        Retorna battle_id -> EstadoBatalha.
+        """
+        estados = {}
+        if self.ativo:
+            with self._lock:
+                for battle_id in battle_ids:
+                    if battle_id in self._estados:
+                        estados[battle_id] = self._estados[battle_id]
+
+        faltam = [battle_id for battle_id in set(battle_ids) if battle_id not in estados]
+        if faltam:
+            lidos = self._ler_varios_do_banco(faltam)
+            if self.ativo:
+                with self._lock:
+                    lidos = {
+                        battle_id: estado if estado.batalha["fase"] == "ended"
+                        else self._estados.setdefault(battle_id, estado)
+                        for battle_id, estado in lidos.items()
+                    }
+                    self._limitar_estados()
+            estados.update(lidos)
+        return estados
+
+    def _ler_varios_do_banco(self, battle_ids) -> dict:
+        estados = {}
+        for db, ids in self.shards.agrupar(battle_ids):
+            batalhas = list(ler_batalhas(db, ids).values())
+            if not batalhas:
+                continue
+            user_ids = list({b["user_id"] for b in batalhas})
+            fichas = {r["user_id"]: r for r in db.execute(
+                f"SELECT * FROM fichas WHERE user_id IN ({','.join('?' * len(user_ids))})", *user_ids)}
+            monstros = self.shards.monstros(db, [b["monstro_id"] for b in batalhas])
+            estados.update(
+                (b["id"], self._estado(b, fichas[b["user_id"]], monstros[b["monstro_id"]]))
+                for b in batalhas
+                if b["user_id"] in fichas and b["monstro_id"] in monstros
+            )
+        return estados
+
+    def _ler_do_banco(self, battle_id: int):
+        db = self.shards.da_batalha(battle_id)
+        b = ler_batalhas(db, [battle_id]).get(battle_id)
+        if b is None:
+            return None
+        ficha_row = db.execute("SELECT * FROM fichas WHERE user_id = ? LIMIT 1", b["user_id"])[0]
+        monstro_row = self.shards.monstros(db, [b["monstro_id"]])[b["monstro_id"]]
+        return self._estado(b, ficha_row, monstro_row)
+
+    def _estado(self, b: dict, ficha_row: dict, monstro_row: dict) -> EstadoBatalha:
+        return EstadoBatalha(b, ficha_row, monstro_row, self.bestiario.modelo(monstro_row["tipo"]))
+
+    def _limitar_estados(self):
+        # descarta as batalhas mais antigas que não têm nada pendente de gravação nem um
+        # turno em andamento (lock ocupado)
+        excesso = len(self._estados) - self.max_estados
+        if excesso <= 0:
+            return
+        for battle_id, estado in list(self._estados.items()):
+            if excesso <= 0:
+                break
+            if battle_id in self._pendentes or not estado.lock.acquire(blocking=False):
+                continue
+            try:
+                del self._estados[battle_id]
+            finally:
+                estado.lock.release()
+            excesso -= 1
+
+    # ---------------------- escrita ----------------------
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {"estados": len(self._estados), "pendentes": len(self._pendentes),
+                    "turnos_descartados": self.turnos_descartados}
+
+    def salvar(self, estado: EstadoBatalha, acao: str = None, resposta: dict = None, **campos):
+        """
+        Aplica as mudanças (j_vida, m_hp, fase, vencedor) na batalha, junto com a
+        posição do fluxo de dados, e registra a fase jogada (acao) como evento com a
+        resposta dela. O vencedor, uma vez definido, não é sobrescrito.
+        """
+        self.aplicar(estado, acao, resposta, **campos)
+        if self.salvar_lote([estado]):
+            raise Conflito(estado.batalha["id"])
+
+    def salvar_lote(self, estados: list) -> set:
+        """
+        Grava batalhas já alteradas com aplicar(), numa transação por shard. Com o store
+        ativo elas ficam pendentes como no salvar(). Retorna os ids das batalhas que não
+        foram gravadas porque outra requisição jogou o turno antes (Conflito).
+        """
+        estados = list({e.batalha["id"]: e for e in estados}.values())
+        if not estados:
+            return set()
+        if not self.ativo:
+            return self._gravar_separando([self._tirar_pendencias(e) for e in estados])
+        batalhas = [e.batalha for e in estados]
+
+        agora = time.monotonic()
+        with self._lock:
+            for estado in estados:
+                # quem carregou a batalha antes de ela sair da memória ainda grava por aqui
+                self._estados[estado.batalha["id"]] = estado
+                self._pendentes.setdefault(estado.batalha["id"], agora)
+            mais_antiga = min(self._pendentes.values())
+            precisa_flush = (
+                any(b["fase"] == "ended" for b in batalhas)
+                or len(self._pendentes) >= self.max_pendentes
+                or agora - mais_antiga >= self.janela
+            )
+        self._iniciar_thread()
+
+        if precisa_flush:
+            self.flush()
+        with self._lock:
+            for b in batalhas:
+                if b["fase"] == "ended" and b["id"] not in self._pendentes:
+                    self._estados.pop(b["id"], None)
+        return set()
+
+    def salvar_com_log(self, estado: EstadoBatalha, log: list, **campos):
+        """
+        Aplica as mudanças e grava na hora, numa única transação, a batalha e o log
+        de fases (combate.jogar) como eventos. Usado quando a batalha inteira é resolvida de uma vez.
+        """
+        b = self.aplicar(estado, **campos)
+        for evento in log:
+            b["seq"] += 1
+            estado.eventos.append({**evento, "seq": b["seq"]})
+        with self._lock:
+            self._pendentes.pop(b["id"], None)
+            if b["fase"] == "ended":
+                self._estados.pop(b["id"], None)
+            lote = self._tirar_pendencias(estado)
+        self._gravar(self.shards.da_batalha(b["id"]), [lote])
+
+    def aplicar(self, estado: EstadoBatalha, acao: str = None, resposta: dict = None, **campos) -> dict:
+        """Só aplica as mudanças na batalha em memória (e guarda o evento da fase), sem gravar."""
+        b = estado.batalha
+        vencedor = campos.pop("vencedor", None)
+        b.update(campos)
+        b["rolagens"] = estado.dados.rolagens
+        b["vencedor"] = b.get("vencedor") or vencedor
+        if acao is not None:
+            b["seq"] += 1
+            b["turno"] = proximo_turno(acao, b["turno"])
+            estado.eventos.append({
+                **(resposta or {}), "seq": b["seq"], "acao": acao, "fase": b["fase"], "vencedor": b["vencedor"],
+                "j_vida": b["j_vida"], "m_hp": b["m_hp"], "rolagens": b["rolagens"], "turno": b["turno"],
+            })
+        return b
+
+    @staticmethod
+    def _tirar_pendencias(estado: EstadoBatalha):
+        """(cópia da batalha, eventos ainda não gravados), esvaziando os eventos do estado."""
+        eventos, estado.eventos = estado.eventos, []
+        return dict(estado.batalha), eventos
+
+    def flush(self) -> int:
+        """Grava todas as batalhas com mudanças pendentes, numa transação por shard."""
+        with self._lock:
+            if not self._pendentes:
+                return 0
+            pendentes = self._pendentes
+            self._pendentes = {}
+            estados, lotes = [], []
+            for battle_id, desde in pendentes.items():
+                estado = self._estados.get(battle_id)
+                if estado is None:
+                    # não deveria acontecer (o salvar_lote recoloca o estado): o turno se perdeu
+                    self.logger.error("batalha %s pendente sem estado em memória; turnos descartados", battle_id)
+                    self.turnos_descartados += 1
+                    continue
+                # sem esperar: quem está no meio de um turno pode estar esperando o self._lock
+                if not estado.lock.acquire(blocking=False):
+                    self._pendentes[battle_id] = desde
+                    continue
+                try:
+                    lotes.append(self._tirar_pendencias(estado))
+                finally:
+                    estado.lock.release()
+                estados.append(estado)
+
+        por_id = {lote[0]["id"]: (estado, lote) for estado, lote in zip(estados, lotes)}
+        conflitos, falha = set(), None
+        for db, ids in self.shards.agrupar(por_id):
+            try:
+                conflitos |= self._gravar_no_shard(db, [por_id[battle_id][1] for battle_id in ids])
+            except Exception as e:
+                # o que não foi gravado neste shard volta a ficar pendente
+                falha = falha or e
+                with self._lock:
+                    for battle_id in ids:
+                        estado, (_, eventos) = por_id[battle_id]
+                        self._pendentes.setdefault(battle_id, pendentes[battle_id])
+                        estado.eventos[:0] = eventos
+        if conflitos:
+            # outro processo gravou essas batalhas (store ativo com mais de um worker): o que
+            # está em memória perdeu, então sai do store e a próxima leitura vem do banco
+            descartados = sum(len(por_id[battle_id][1][1]) for battle_id in conflitos)
+            self.logger.error("%d turnos já respondidos descartados: as batalhas %s foram gravadas por outro "
+                              "processo (store ativo com mais de um worker?)", descartados, sorted(conflitos))
+            with self._lock:
+                self.turnos_descartados += descartados
+                for battle_id in conflitos:
+                    self._estados.pop(battle_id, None)
+        if falha is not None:
+            raise falha
+        return len(lotes) - len(conflitos)
+
+    def _gravar_separando(self, lotes) -> set:
+        """_gravar_no_shard() de cada shard; retorna as batalhas que conflitaram."""
+        por_id = {lote[0]["id"]: lote for lote in lotes}
+        conflitos = set()
+        for db, ids in self.shards.agrupar(por_id):
+            conflitos |= self._gravar_no_shard(db, [por_id[battle_id] for battle_id in ids])
+        return conflitos
+
+    def _gravar_no_shard(self, db, lotes) -> set:
+        """_gravar() numa transação só; se houver conflito, grava batalha por batalha e retorna as que conflitaram."""
+        try:
+            self._gravar(db, lotes)
+            return set()
+        except Conflito:
+            if len(lotes) == 1:
+                return {lotes[0][0]["id"]}
+        conflitos = set()
+        for lote in lotes:
+            try:
+                self._gravar(db, [lote])
+            except Conflito:
+                conflitos.add(lote[0]["id"])
+        return conflitos
+
+    def _gravar(self, db, lotes):
+        """
+        lotes: (batalha, eventos). Os eventos são só INSERT; o retrato em batalhas só é
+        regravado quando a batalha terminou (ou mudou sem evento).
+        """
+        eventos = [
+            (b["id"], e["seq"], e["acao"], e["fase"], e["vencedor"], e["j_vida"], e["m_hp"], e.get("rolagens"),
+             e.get("turno"), json.dumps({k: v for k, v in e.items() if k not in COLUNAS_EVENTO}, separators=(",", ":")))
+            for b, evs in lotes for e in evs
+        ]
+        retratos = [
+            (b["j_vida"], b["m_hp"], b["fase"], b["vencedor"], b["rolagens"], b["turno"], b["seq"], b["id"])
+            for b, evs in lotes if b["fase"] == "ended" or not evs
+        ]
+        # só quem grava o evento final soma: ele é INSERT, então entra uma vez só; o turno
+        # começa em 1 e cada ataque soma um, então os turnos jogados são turno - 1
+        terminadas = [
+            (b["user_id"], int(b["vencedor"] == "player"), int(b["vencedor"] == "monster"), b["turno"] - 1, b["id"])
+            for b, evs in lotes if any(e["fase"] == "ended" for e in evs)
+        ]
+        um_id = lotes[0][0]["id"] if len(lotes) == 1 else None
+        if len(eventos) + len(retratos) <= 1:
+            try:
+                if eventos:
+                    db.execute(_INSERT_EVENTO, *eventos[0])
+                elif retratos:
+                    db.execute(_UPDATE_RETRATO, *retratos[0])
+            except sqlite3.IntegrityError as e:
+                if _eh_conflito(e):
+                    raise Conflito(um_id) from e
+                raise
+            return
+
+        try:
+            with db.transacao():
+                if eventos:
+                    db.executemany(_INSERT_EVENTO, eventos)
+                if retratos:
+                    db.executemany(_UPDATE_RETRATO, retratos)
+                estatisticas = [db.execute(_SOMAR_ESTATISTICA, *t)[0] for t in terminadas]
+        except sqlite3.IntegrityError as e:
+            if _eh_conflito(e):
+                raise Conflito(um_id) from e
+            raise
+        if estatisticas and self.ao_terminar is not None:
+            self.ao_terminar(estatisticas)
+
+    # ---------------------- flush periódico ----------------------
+    def _iniciar_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop_flush, name="batalha-store-flush", daemon=True)
+            self._thread.start()
+
+    def _loop_flush(self):
+        while True:
+            time.sleep(self.janela)
+            try:
+                self.flush()
+            except Exception:
+                self.logger.exception("falha ao gravar batalhas pendentes")
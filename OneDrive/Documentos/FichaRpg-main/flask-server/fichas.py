@@ -0,0 +1,136 @@
+"""
+Criação de fichas: a vida rolada pela classe, a CA e o INSERT, de uma ficha ou em lote.
+
+O POST /ficha faz numa chamada o que /ficha/roll/vida + /ficha/roll/ca fazem em duas
+(cada uma validando tudo e procurando a ficha de novo). O INSERT ... ON CONFLICT
+(user_id) DO NOTHING RETURNING * grava e devolve a linha no mesmo statement; se não
+volta linha, o usuário já tinha ficha.
+
+Em lote (POST /ficha/lote e este CLI) as fichas entram em transações de até `lote`
+fichas, uma por shard. O CLI cria também os usuários de teste:
+
+    python fichas.py --usuarios 10000 [--prefixo teste] [--lote 500] [--banco app.db] [--shards N]
+"""
+import argparse
+import random
+import time
+
+from back_end import Atributo, Dados, Ficha
+from banco import Banco
+from schema import migrar
+from senhas import gerar_hash
+from shards import Shards
+
+ATRIBUTOS = ("forca", "constituicao", "destreza", "inteligencia", "sabedoria", "carisma")
+RACAS = ("Humano", "Elfo", "Anão", "Halfling", "Meio-Orc")
+COLUNAS = ("user_id", "nome", "raca", "classe", *ATRIBUTOS, "vida", "ca")
+
+_INSERT_FICHA = f"""
+    INSERT INTO fichas ({', '.join(COLUNAS)}, iniciativa)
+    VALUES ({', '.join('?' * len(COLUNAS))}, 0)
+    ON CONFLICT (user_id) DO NOTHING
+    RETURNING *
+"""
+
+
+def rolar_vida(classe: str, constituicao: int, dados: Dados) -> dict:
+    """Um dado da classe (no mínimo o da regra) mais o modificador de constituição, como o /ficha/roll/vida."""
+    regra = Ficha.vida_regras[classe]
+    faces = int(regra["dado"])
+    r1 = max(dados.rolar(faces), int(regra["min"]))
+    con_mod = Atributo.de_pontos(constituicao).modificador
+    return {"r1": r1, "conMod": con_mod, "vida": max(r1 + con_mod, 1), "dado": faces}
+
+
+def calcular_ca(destreza: int) -> dict:
+    dex_mod = Atributo.de_pontos(destreza).modificador
+    return {"ca": 10 + dex_mod, "dexMod": dex_mod}
+
+
+def nova_ficha(user_id: int, nome: str, raca: str, classe: str, atributos: dict, dados: Dados):
+    """(valores das COLUNAS para o INSERT, rolagens para a resposta) de uma ficha nova."""
+    pontos = {k: int(atributos[k]) for k in ATRIBUTOS}
+    rolagens = {**rolar_vida(classe, pontos["constituicao"], dados), **calcular_ca(pontos["destreza"])}
+    valores = (user_id, nome, raca, classe, *(pontos[k] for k in ATRIBUTOS), rolagens["vida"], rolagens["ca"])
+    return valores, rolagens
+
+
+def inserir(db, valores: tuple):
+    """Grava a ficha e devolve a linha, ou None se o usuário já tem ficha."""
+    rows = db.execute(_INSERT_FICHA, *valores)
+    return rows[0] if rows else None
+
+
+def inserir_lote(db, fichas: list, lote: int = 500) -> dict:
+    """
+    Grava as fichas (valores das COLUNAS) em transações de até `lote`; retorna
+    user_id -> linha gravada. Quem já tinha ficha fica de fora.
+    """
+    criadas = {}
+    for inicio in range(0, len(fichas), lote):
+        with db.transacao():
+            for valores in fichas[inicio:inicio + lote]:
+                rows = db.execute(_INSERT_FICHA, *valores)
+                if rows:
+                    criadas[rows[0]["user_id"]] = rows[0]
+    return criadas
+
+
+def _criar_usuarios(db, nomes: list, password_hash: str, lote: int) -> dict:
+    """userName -> id dos usuários de teste (os que já existiam também)."""
+    for inicio in range(0, len(nomes), lote):
+        with db.transacao():
+            db.executemany(
+                "INSERT OR IGNORE INTO users (userName, email, password_hash) VALUES (?, ?, ?)",
+                [(nome, f"{nome}@teste.com", password_hash) for nome in nomes[inicio:inicio + lote]],
+            )
+    ids = {}
+    for inicio in range(0, len(nomes), lote):
+        parte = nomes[inicio:inicio + lote]
+        ids.update((r["userName"], r["id"]) for r in db.execute(
+            f"SELECT id, userName FROM users WHERE userName IN ({','.join('?' * len(parte))})", *parte))
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cria usuários de teste com ficha, em lote")
+    parser.add_argument("--usuarios", type=int, default=1000)
+    parser.add_argument("--prefixo", default="teste", help="userName = <prefixo><n>; a senha é o próprio userName")
+    parser.add_argument("--lote", type=int, default=500, help="linhas por transação")
+    parser.add_argument("--banco", default="app.db")
+    parser.add_argument("--shards", type=int, default=0, help="o SHARDS do servidor")
+    parser.add_argument("--pasta-shards", default="shards")
+    parser.add_argument("--seed", type=int, help="semente das classes, raças, atributos e vidas")
+    args = parser.parse_args()
+
+    db = Banco(args.banco)
+    migrar(db)
+    shards = Shards(db, args.shards, args.pasta_shards)
+    aleatorio = random.Random(args.seed)
+    dados = Dados(seed=args.seed)
+    nomes = [f"{args.prefixo}{i}" for i in range(args.usuarios)]
+
+    inicio = time.perf_counter()
+    # o mesmo hash para todos: com o custo de produção, um por usuário levaria mais que o resto todo
+    user_ids = _criar_usuarios(db, nomes, gerar_hash(args.prefixo), args.lote)
+    meio = time.perf_counter()
+
+    pontos = [15, 14, 13, 12, 10, 8]
+    classes = tuple(Ficha.vida_regras)
+    por_shard = {}
+    for nome in nomes:
+        user_id = user_ids[nome]
+        aleatorio.shuffle(pontos)
+        valores, _ = nova_ficha(user_id, nome, aleatorio.choice(RACAS), aleatorio.choice(classes),
+                                dict(zip(ATRIBUTOS, pontos)), dados)
+        por_shard.setdefault(shards.do_usuario(user_id), []).append(valores)
+    criadas = sum(len(inserir_lote(banco, fichas, args.lote)) for banco, fichas in por_shard.items())
+    fim = time.perf_counter()
+
+    print(f"{len(nomes)} usuários em {meio - inicio:.2f}s ({len(nomes) / (meio - inicio):,.0f}/s)")
+    print(f"{criadas} fichas em {fim - meio:.2f}s ({criadas / (fim - meio):,.0f} fichas/s)"
+          + (f"; {len(nomes) - criadas} usuários já tinham ficha" if criadas < len(nomes) else ""))
+
+
+if __name__ == "__main__":
+    main()
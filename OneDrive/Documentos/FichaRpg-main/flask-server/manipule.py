@@ -1,15 +1,112 @@
-from cs50 import SQL
+"""
+Carga de monstros no app.db.
+
+    python manipule.py                         # 10 monstros com nomes gerados
+    python manipule.py --gerar 1000000         # 1M monstros com nomes gerados
+    python manipule.py --csv monstros.csv      # colunas nome,tipo,hp,ca (tipo, hp e ca opcionais)
+    python manipule.py --ndjson monstros.ndjson
+
+As linhas entram com executemany em transações de --lote linhas, direto no sqlite3
+(o cs50 faz um commit por INSERT, o que deixava a carga de um bestiário grande em minutos).
+"""
+import argparse
+import csv
+import itertools
+import json
 import random
-db = SQL("sqlite:///app.db")
-
-def seed(count=10):
-  prefix = ["Gor", "Mor", "Zul", "Vor", "Krag", "Tor", "Az", "Bal", "Ur", "Rok"]
-  suffix = ["gash", "mok", "thar", "grom", "nak", "zul", "rak", "dor", "grim", "mog"]
-  for _ in range(count):
-      nome = random.choice(prefix) + random.choice(suffix)
-      hp, ca = 19, 11
-      db.execute("INSERT INTO monstros (nome, tipo, hp, ca) VALUES (?, 'Molodoy', ?, ?)", nome, hp, ca)
-  print(f"Criados {count} monstros.")
-
-seed()
-print("Banco inicializado ✅")
\ No newline at end of file
+import sqlite3
+import time
+
+PREFIX = ["Gor", "Mor", "Zul", "Vor", "Krag", "Tor", "Az", "Bal", "Ur", "Rok"]
+SUFFIX = ["gash", "mok", "thar", "grom", "nak", "zul", "rak", "dor", "grim", "mog"]
+PADRAO = {"tipo": "Molodoy", "hp": 19, "ca": 11}
+SQL_INSERT = "INSERT INTO monstros (nome, tipo, hp, ca) VALUES (?, ?, ?, ?)"
+
+
+def gerar_monstros(count: int):
+    """Nomes montados com um prefixo e um sufixo, com os status padrão do Molodoy."""
+    for _ in range(count):
+        yield (random.choice(PREFIX) + random.choice(SUFFIX), PADRAO["tipo"], PADRAO["hp"], PADRAO["ca"])
+
+
+def _linha(registro: dict):
+    return (
+        registro["nome"],
+        registro.get("tipo") or PADRAO["tipo"],
+        int(registro.get("hp") or PADRAO["hp"]),
+        int(registro.get("ca") or PADRAO["ca"]),
+    )
+
+
+def ler_csv(caminho: str):
+    with open(caminho, newline="", encoding="utf-8") as f:
+        for registro in csv.DictReader(f):
+            yield _linha(registro)
+
+
+def ler_ndjson(caminho: str):
+    with open(caminho, encoding="utf-8") as f:
+        for texto in f:
+            if texto.strip():
+                yield _linha(json.loads(texto))
+
+
+def carregar(linhas, banco: str = "app.db", lote: int = 50000):
+    """Insere as linhas (nome, tipo, hp, ca) em lotes; retorna (quantidade, segundos)."""
+    con = sqlite3.connect(banco, isolation_level=None)
+    # durante a carga não espera o fsync de cada commit e dá mais cache para os índices
+    con.execute("PRAGMA synchronous = OFF")
+    con.execute("PRAGMA temp_store = MEMORY")
+    con.execute("PRAGMA cache_size = -262144")
+
+    total = 0
+    inicio = time.perf_counter()
+    linhas = iter(linhas)
+    try:
+        while True:
+            bloco = list(itertools.islice(linhas, lote))
+            if not bloco:
+                break
+            con.execute("BEGIN")
+            try:
+                con.executemany(SQL_INSERT, bloco)
+            except Exception:
+                con.execute("ROLLBACK")
+                raise
+            con.execute("COMMIT")
+            total += len(bloco)
+    finally:
+        con.close()
+    return total, time.perf_counter() - inicio
+
+
+def seed(count=10, banco: str = "app.db"):
+    total, segundos = carregar(gerar_monstros(count), banco)
+    print(f"Criados {total} monstros.")
+    return total, segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga de monstros no banco")
+    origem = parser.add_mutually_exclusive_group()
+    origem.add_argument("--gerar", type=int, metavar="N", help="gera N monstros com o gerador de nomes")
+    origem.add_argument("--csv", metavar="ARQUIVO")
+    origem.add_argument("--ndjson", metavar="ARQUIVO")
+    parser.add_argument("--banco", default="app.db")
+    parser.add_argument("--lote", type=int, default=50000, help="linhas por transação")
+    args = parser.parse_args()
+
+    if args.csv:
+        linhas = ler_csv(args.csv)
+    elif args.ndjson:
+        linhas = ler_ndjson(args.ndjson)
+    else:
+        linhas = gerar_monstros(args.gerar or 10)
+
+    total, segundos = carregar(linhas, args.banco, args.lote)
+    print(f"Criados {total} monstros em {segundos:.2f}s ({total / max(segundos, 1e-9):,.0f} linhas/s).")
+    print("Banco inicializado ✅")
+
+
+if __name__ == "__main__":
+    main()
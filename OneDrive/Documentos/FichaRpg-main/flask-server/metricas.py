@@ -0,0 +1,177 @@
+"""
+Métricas das rotas e das consultas ao banco, no formato texto do Prometheus (/metrics).
+
+Por requisição: latência por rota (histograma), status, requisições em andamento e,
+das consultas feitas durante ela, quantas foram e quanto tempo levaram. O Banco chama
+consulta() a cada execute; as consultas são somadas na requisição da thread.
+
+Com lento_ms, requisições que passarem disso vão para o log com a lista das consultas
+e quanto do tempo foi banco e quanto foi o resto (montar Ficha, JSON, etc.).
+
+Cada processo tem as suas métricas, como os caches.
+"""
+import bisect
+import threading
+import time
+
+LIMITES_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+LIMITES_CONSULTAS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+MAX_CONSULTAS_LOG = 50   # consultas guardadas por requisição para o log de lentas
+
+
+class Histograma:
+    __slots__ = ("limites", "contagens", "soma", "total")
+
+    def __init__(self, limites):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)   # a última é o +Inf
+        self.soma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        self.contagens[bisect.bisect_left(self.limites, valor)] += 1
+        self.soma += valor
+        self.total += 1
+
+    def linhas(self, nome: str, rotulos: str):
+        acumulado = 0
+        for limite, n in zip(self.limites, self.contagens):
+            acumulado += n
+            yield f'{nome}_bucket{{{rotulos},le="{limite}"}} {acumulado}'
+        yield f'{nome}_bucket{{{rotulos},le="+Inf"}} {self.total}'
+        yield f"{nome}_sum{{{rotulos}}} {self.soma}"
+        yield f"{nome}_count{{{rotulos}}} {self.total}"
+
+
+class _Requisicao:
+    __slots__ = ("inicio", "consultas", "tempo_banco", "detalhes")
+
+    def __init__(self, detalhar: bool):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tempo_banco = 0.0
+        self.detalhes = [] if detalhar else None
+
+
+class Metricas:
+    def __init__(self, lento_ms: float = None, logger=None):
+        self.lento_ms = lento_ms
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._em_andamento = 0
+        self._requisicoes = {}   # (rota, método, status) -> n
+        self._latencia = {}      # (rota, método) -> Histograma
+        self._consultas = {}     # rota -> Histograma de consultas por requisição
+        self._tempo_banco = {}   # rota -> Histograma do tempo de banco por requisição
+        self._fora = [0, 0.0]    # consultas feitas fora de requisição (store, atexit): n, segundos
+        self._extras = []        # funções que devolvem mais linhas para o /metrics
+
+    def inicio(self):
+        self._local.req = _Requisicao(self.lento_ms is not None)
+        with self._lock:
+            self._em_andamento += 1
+
+    def consulta(self, sql: str, duracao: float):
+        req = getattr(self._local, "req", None)
+        if req is None:
+            with self._lock:
+                self._fora[0] += 1
+                self._fora[1] += duracao
+            return
+        req.consultas += 1
+        req.tempo_banco += duracao
+        if req.detalhes is not None and len(req.detalhes) < MAX_CONSULTAS_LOG:
+            req.detalhes.append((" ".join(sql.split())[:120], duracao))
+
+    def fim(self, rota: str, metodo: str, status: int):
+        req = getattr(self._local, "req", None)
+        if req is None:
+            return
+        self._local.req = None
+        duracao = time.perf_counter() - req.inicio
+        with self._lock:
+            self._em_andamento -= 1
+            chave = (rota, metodo, status)
+            self._requisicoes[chave] = self._requisicoes.get(chave, 0) + 1
+            latencia = self._latencia.get((rota, metodo))
+            if latencia is None:
+                latencia = self._latencia[(rota, metodo)] = Histograma(LIMITES_SEGUNDOS)
+                self._consultas[rota] = self._consultas.get(rota) or Histograma(LIMITES_CONSULTAS)
+                self._tempo_banco[rota] = self._tempo_banco.get(rota) or Histograma(LIMITES_SEGUNDOS)
+            latencia.observar(duracao)
+            self._consultas[rota].observar(req.consultas)
+            self._tempo_banco[rota].observar(req.tempo_banco)
+
+        if self.lento_ms is not None and duracao * 1000 >= self.lento_ms and self.logger:
+            consultas = "".join(f"\n  {ms * 1000:8.2f} ms  {sql}" for sql, ms in req.detalhes)
+            self.logger.warning(
+                "requisição lenta: %s %s -> %s em %.1f ms (banco %.1f ms em %d consultas, resto %.1f ms)%s",
+                metodo, rota, status, duracao * 1000, req.tempo_banco * 1000, req.consultas,
+                (duracao - req.tempo_banco) * 1000, consultas,
+            )
+
+    def registrar(self, funcao):
+        """funcao() devolve linhas extras (já no formato do Prometheus) para o /metrics."""
+        self._extras.append(funcao)
+        return funcao
+
+    def exportar(self) -> str:
+        with self._lock:
+            linhas = [
+                "# HELP ficharpg_requisicoes_em_andamento Requisições sendo atendidas agora.",
+                "# TYPE ficharpg_requisicoes_em_andamento gauge",
+                f"ficharpg_requisicoes_em_andamento {self._em_andamento}",
+                "# HELP ficharpg_requisicoes_total Requisições atendidas, por rota, método e status.",
+                "# TYPE ficharpg_requisicoes_total counter",
+            ]
+            for (rota, metodo, status), n in sorted(self._requisicoes.items()):
+                linhas.append(f'ficharpg_requisicoes_total{{rota="{rota}",metodo="{metodo}",status="{status}"}} {n}')
+
+            linhas += [
+                "# HELP ficharpg_requisicao_segundos Latência das requisições, por rota.",
+                "# TYPE ficharpg_requisicao_segundos histogram",
+            ]
+            for (rota, metodo), h in sorted(self._latencia.items()):
+                linhas.extend(h.linhas("ficharpg_requisicao_segundos", f'rota="{rota}",metodo="{metodo}"'))
+
+            linhas += [
+                "# HELP ficharpg_db_consultas_por_requisicao Chamadas a db.execute em cada requisição, por rota.",
+                "# TYPE ficharpg_db_consultas_por_requisicao histogram",
+            ]
+            for rota, h in sorted(self._consultas.items()):
+                linhas.extend(h.linhas("ficharpg_db_consultas_por_requisicao", f'rota="{rota}"'))
+
+            linhas += [
+                "# HELP ficharpg_db_segundos_por_requisicao Tempo somado em db.execute em cada requisição, por rota.",
+                "# TYPE ficharpg_db_segundos_por_requisicao histogram",
+            ]
+            for rota, h in sorted(self._tempo_banco.items()):
+                linhas.extend(h.linhas("ficharpg_db_segundos_por_requisicao", f'rota="{rota}"'))
+
+            linhas += [
+                "# HELP ficharpg_db_consultas_fora_total Consultas feitas fora de requisições (gravação em lote, etc.).",
+                "# TYPE ficharpg_db_consultas_fora_total counter",
+                f"ficharpg_db_consultas_fora_total {self._fora[0]}",
+                "# HELP ficharpg_db_segundos_fora_total Tempo das consultas feitas fora de requisições.",
+                "# TYPE ficharpg_db_segundos_fora_total counter",
+                f"ficharpg_db_segundos_fora_total {self._fora[1]}",
+            ]
+        for funcao in self._extras:
+            linhas.extend(funcao())
+        return "\n".join(linhas) + "\n"
+
+
+def linhas_caches(caches: dict) -> list:
+    """Hits, misses e tamanho de cada LRUCache, pelo nome."""
+    linhas = []
+    for nome, tipo, ajuda in (
+        ("hits", "counter", "Leituras encontradas no cache."),
+        ("misses", "counter", "Leituras que não estavam no cache."),
+        ("itens", "gauge", "Itens guardados no cache."),
+    ):
+        metrica = f"ficharpg_cache_{nome}" + ("_total" if tipo == "counter" else "")
+        linhas += [f"# HELP {metrica} {ajuda}", f"# TYPE {metrica} {tipo}"]
+        for cache, lru in caches.items():
+            linhas.append(f'{metrica}{{cache="{cache}"}} {lru.estatisticas()[nome]}')
+    return linhas
@@ -0,0 +1,215 @@
+"""
+Chance exata de vitória de uma Ficha contra um monstro.
+
+As regras de combate são pequenas e discretas, então em vez de sortear batalhas
+(como o simulador) dá para resolver a cadeia de Markov sobre os estados
+(vida do jogador, hp do monstro, de quem é a vez). Cada ataque vira uma
+distribuição de dano (índice = dano, valor = probabilidade, dano 0 = errou) e a
+tabela resolvida fica em cache para as próximas consultas do mesmo confronto. A
+tabela é montada com NumPy, uma vida do jogador por vez (ver _resolver), e o app a
+prepara numa thread quando a ficha é criada e quando a batalha começa (preparar), então
+o /batalha/chance normalmente só lê a tabela pronta.
+"""
+import logging
+import queue
+import threading
+
+import numpy as np
+
+from back_end import Ficha, Monstros
+
+logger = logging.getLogger(__name__)
+MAX_TABELAS = 256
+
+
+def _soma_dados(faces: int, qtd: int) -> list:
+    """Distribuição da soma de qtd dados de faces lados (índice = soma)."""
+    dist = [1.0]
+    for _ in range(qtd):
+        nova = [0.0] * (len(dist) + faces)
+        for soma, p in enumerate(dist):
+            for face in range(1, faces + 1):
+                nova[soma + face] += p / faces
+        dist = nova
+    return dist
+
+
+def distribuicao_dano(perfil: dict) -> list:
+    """
+    Distribuição do dano de um ataque com as regras de Ficha.atacar/Monstro.atacar:
+    1 natural erra, 20 natural acerta e dobra o dano, o resto acerta se d20 + bônus >= CA.
+    """
+    somas = _soma_dados(perfil["dado"], perfil["qtd"])
+    normal = {}
+    for soma, p in enumerate(somas):
+        if p:
+            dano = max(soma + perfil["bonus_dano"], 0)
+            normal[dano] = normal.get(dano, 0.0) + p
+
+    acertos = sum(1 for d20 in range(2, 20) if d20 + perfil["bonus_ataque"] >= perfil["ca_alvo"])
+    p_acerto, p_crit = acertos / 20, 1 / 20
+
+    dist = [0.0] * (2 * max(normal) + 1)
+    dist[0] = 1 - p_acerto - p_crit
+    for dano, p in normal.items():
+        dist[dano] += p * p_acerto
+        dist[2 * dano] += p * p_crit
+    return dist
+
+
+def chance_iniciativa(dex_mod: int) -> float:
+    """Probabilidade de o jogador começar: d20 + mod. de destreza >= d20 do monstro."""
+    return sum(1 for a in range(1, 21) for b in range(1, 21) if a + dex_mod >= b) / 400
+
+
+def _serie_inversa(c: float, dist: list, n: int) -> np.ndarray:
+    """
+    Coeficientes g de 1 / (1 - c * sum(dist[d] * z**d, d >= 1)), até z**(n-1), pela
+    iteração de Newton g <- g * (2 - f * g), que dobra os termos certos a cada passo.
+    """
+    f = np.zeros(n)
+    f[0] = 1.0
+    k = min(len(dist), n)
+    f[1:k] = -c * np.asarray(dist[1:k], dtype=float)
+    g = np.ones(1)
+    while len(g) < n:
+        tam = min(2 * len(g), n)
+        h = -np.convolve(f[:tam], g)[:tam]
+        h[0] += 2.0
+        g = np.convolve(g, h)[:tam]
+    return g
+
+
+def _resolver(dist_jogador, dist_monstro, max_vida, max_hp):
+    """
+    Monta as tabelas vitoria[vez, j, m] e turnos[vez, j, m] (vez 0 = jogador, 1 = monstro).
+    Errar não muda o estado, então cada par (j, m) fecha um sistema 2x2 entre as duas vezes,
+    e todo dano > 0 leva a um estado menor.
+
+    Resolve uma vida j do jogador por vez, com todos os hp m do monstro de uma vez: o
+    ataque do monstro leva a vidas menores, já resolvidas; o do jogador leva a hp menores
+    da mesma linha, o que dá um sistema triangular de Toeplitz em m,
+        y[m] - c * sum_d dist_jogador[d] * y[m - d] = r[m],   com y = (tabela da vez 1)[j],
+    cuja inversa é a série g (a mesma para todas as linhas): y = g * r (convolução).
+    """
+    q_j, q_m = dist_jogador[0], dist_monstro[0]
+    fixo = 1 - q_j * q_m
+    c = q_m / fixo
+    n = max_hp + 1
+    vitoria = np.zeros((2, max_vida + 1, n))
+    turnos = np.zeros((2, max_vida + 1, n))
+    vitoria[:, :, 0] = 1.0
+    if max_hp == 0:
+        return vitoria, turnos
+
+    g = _serie_inversa(c, dist_jogador, max_hp)
+    # os termos de g são >= 0 e caem em progressão geométrica; o rabo desprezível só encarece a convolução
+    g = g[:np.flatnonzero(g > 1e-18)[-1] + 1]
+    # convolução direta para tabelas pequenas; nas grandes, pela FFT com a transformada de g pronta
+    tam_fft = 1 << (len(g) + max_hp - 1).bit_length()
+    G = np.fft.rfft(g, tam_fft) if len(g) * max_hp > 8192 else None
+    # parte da soma do ataque do jogador que cai em m - d <= 0 (monstro morto: vitória certa)
+    cauda = np.zeros(n)
+    caudas = np.cumsum(np.asarray(dist_jogador[:0:-1], dtype=float))[::-1]   # caudas[d - 1] = sum(dist[d:])
+    cauda[1:min(n, len(caudas) + 1)] = caudas[:n - 1]
+    p_monstro = np.asarray(dist_monstro[1:], dtype=float)
+    danos = np.arange(1, len(dist_monstro))
+
+    for j in range(1, max_vida + 1):
+        # ataque do monstro: vidas j - d, já resolvidas (0 = jogador morto)
+        anteriores = np.maximum(j - danos, 0)
+        v_m = p_monstro @ vitoria[0, anteriores]
+        t_m = p_monstro @ turnos[0, anteriores]
+
+        # V1 = q_m * V0 + v_m  e  V0 = (soma do jogador sobre V1 + q_j * v_m) / fixo
+        r = c * cauda + v_m * (1 + q_j * c)
+        # T1 = 1 + q_m * T0 + t_m  e  T0 = (1 + soma do jogador sobre T1 + q_j * (1 + t_m)) / fixo
+        r_t = 1 + t_m + c * (1 + q_j * (1 + t_m))
+        if G is None:
+            v1 = np.convolve(g, r[1:])[:max_hp]
+            t1 = np.convolve(g, r_t[1:])[:max_hp]
+        else:
+            v1, t1 = np.fft.irfft(np.fft.rfft(np.stack((r[1:], r_t[1:])), tam_fft) * G, tam_fft)[:, :max_hp]
+
+        vitoria[1, j, 1:] = v1
+        vitoria[0, j, 1:] = (v1 - v_m[1:]) / q_m
+        turnos[1, j, 1:] = t1
+        turnos[0, j, 1:] = (t1 - 1 - t_m[1:]) / q_m
+    return vitoria, turnos
+
+
+class Probabilidades:
+    """Cache das tabelas resolvidas, por confronto (perfis de ataque dos dois lados)."""
+
+    def __init__(self, max_tabelas: int = MAX_TABELAS):
+        self.max_tabelas = max_tabelas
+        self._tabelas = {}
+        self._lock = threading.Lock()
+        self._fila = queue.Queue()
+        self._thread = None
+
+    def _tabela(self, perfil_jogador: dict, perfil_monstro: dict, vida: int, hp: int):
+        chave = (tuple(sorted(perfil_jogador.items())), tuple(sorted(perfil_monstro.items())))
+        with self._lock:
+            tabela = self._tabelas.get(chave)
+        if tabela is not None and tabela[0] >= vida and tabela[1] >= hp:
+            return tabela
+
+        # resolve para o maior tamanho já pedido, assim a tabela serve para consultas menores
+        vida = max(vida, tabela[0] if tabela else 0)
+        hp = max(hp, tabela[1] if tabela else 0)
+        vitoria, turnos = _resolver(distribuicao_dano(perfil_jogador), distribuicao_dano(perfil_monstro), vida, hp)
+        tabela = (vida, hp, vitoria, turnos)
+
+        with self._lock:
+            self._tabelas.pop(chave, None)
+            self._tabelas[chave] = tabela
+            while len(self._tabelas) > self.max_tabelas:
+                del self._tabelas[next(iter(self._tabelas))]
+        return tabela
+
+    def preparar(self, ficha: Ficha, monstros: list):
+        """Resolve numa thread as tabelas da ficha contra cada monstro, para o calcular achá-las prontas."""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name="probabilidades", daemon=True)
+                    self._thread.start()
+        for monstro in monstros:
+            self._fila.put((ficha.perfil_ataque(monstro), monstro.perfil_ataque(ficha),
+                            max(ficha.vida, 0), max(monstro.hp, 0)))
+
+    def _loop(self):
+        while True:
+            perfil_jogador, perfil_monstro, vida, hp = self._fila.get()
+            try:
+                self._tabela(perfil_jogador, perfil_monstro, vida, hp)
+            except Exception:
+                logger.exception("falha ao preparar a tabela de vitória")
+
+    def calcular(self, ficha: Ficha, monstro: Monstros, vez: str = None, vida: int = None, hp: int = None) -> dict:
+        """
+        Chance de vitória e número esperado de turnos a partir de vida/hp (sem eles, os
+        atuais da ficha e do monstro, que não são alterados).
+        vez = "player" ou "monster" quando a iniciativa já foi rolada; sem vez, a
+        iniciativa entra no cálculo.
+        """
+        vida = max(ficha.vida if vida is None else vida, 0)
+        hp = max(monstro.hp if hp is None else hp, 0)
+        _, _, vitoria, turnos = self._tabela(ficha.perfil_ataque(monstro), monstro.perfil_ataque(ficha), vida, hp)
+
+        if vez == "player":
+            p_comeca = 1.0
+        elif vez == "monster":
+            p_comeca = 0.0
+        else:
+            p_comeca = chance_iniciativa(ficha.destreza.modificador)
+
+        v = p_comeca * vitoria[0, vida, hp] + (1 - p_comeca) * vitoria[1, vida, hp]
+        t = p_comeca * turnos[0, vida, hp] + (1 - p_comeca) * turnos[1, vida, hp]
+        return {
+            "vitoria_jogador": float(v),
+            "vitoria_monstro": float(1 - v),
+            "turnos_esperados": float(t),
+            "chance_iniciativa": p_comeca,
+        }
@@ -0,0 +1,189 @@
+"""
+Ranking dos jogadores e estatísticas de batalha por usuário.
+
+Vitórias e derrotas saíam de um GROUP BY vencedor em batalhas, que cresce com o
+histórico (e não via as batalhas já arquivadas). Agora cada shard (ou o app.db) tem
+estatisticas_usuarios, uma linha por usuário, somada na mesma transação do evento que
+termina a batalha (estado_batalhas.BatalhaStore._gravar).
+
+O Ranking guarda essas linhas em memória com uma lista ordenada por
+(-vitorias, derrotas, user_id), então o top K é uma fatia e a posição de um usuário
+é uma busca binária. As batalhas terminadas neste processo entram na hora (ao_terminar
+do store); as dos outros workers, quando a tabela é relida a cada `intervalo` segundos
+(RANKING_INTERVALO no app).
+
+Para refazer a tabela a partir do histórico (batalhas terminadas dos shards e do
+arquivo frio), numa passada só, com o servidor parado:
+
+    python ranking.py --reconstruir [--banco app.db] [--shards N] [--arquivo arquivo.db]
+    python ranking.py [--top 10]
+"""
+import argparse
+import bisect
+import logging
+import os
+import threading
+import time
+
+from banco import Banco
+from schema import migrar
+from shards import Shards
+
+logger = logging.getLogger(__name__)
+COLUNAS = ("user_id", "vitorias", "derrotas", "batalhas", "turnos", "ultima_batalha")
+
+
+def _chave(linha: dict) -> tuple:
+    return -linha["vitorias"], linha["derrotas"], linha["user_id"]
+
+
+def resumo(linha: dict) -> dict:
+    """A linha de estatisticas_usuarios com as taxas calculadas."""
+    batalhas = linha["batalhas"]
+    return {
+        **{c: linha[c] for c in COLUNAS},
+        "taxa_vitoria": round(linha["vitorias"] / batalhas, 4) if batalhas else None,
+        "turnos_medios": round(linha["turnos"] / batalhas, 2) if batalhas else None,
+    }
+
+
+class Ranking:
+    def __init__(self, bancos):
+        self.bancos = list(bancos)    # onde estão as estatísticas: o app.db ou os shards
+        self._linhas = {}             # user_id -> linha de estatisticas_usuarios
+        self._ordem = []              # _chave() de cada linha, em ordem
+        self._lock = threading.Lock()
+        self._thread = None
+        self.recarregar()
+
+    def recarregar(self):
+        """Relê as tabelas; fica a linha com mais batalhas quando a da memória é mais nova."""
+        lidas = {}
+        for db in self.bancos:
+            lidas.update((r["user_id"], r) for r in db.execute(
+                f"SELECT {', '.join(COLUNAS)} FROM estatisticas_usuarios"))
+        with self._lock:
+            for user_id, linha in self._linhas.items():
+                if user_id in lidas and linha["batalhas"] > lidas[user_id]["batalhas"]:
+                    lidas[user_id] = linha
+            self._linhas = lidas
+            self._ordem = sorted(_chave(linha) for linha in lidas.values())
+
+    def atualizar(self, linhas: list):
+        """Linhas de estatisticas_usuarios que acabaram de ser gravadas."""
+        with self._lock:
+            for linha in linhas:
+                antiga = self._linhas.get(linha["user_id"])
+                if antiga is not None:
+                    if antiga["batalhas"] > linha["batalhas"]:
+                        continue
+                    del self._ordem[bisect.bisect_left(self._ordem, _chave(antiga))]
+                linha = {c: linha[c] for c in COLUNAS}
+                self._linhas[linha["user_id"]] = linha
+                bisect.insort(self._ordem, _chave(linha))
+
+    def top(self, k: int) -> list:
+        """As k primeiras linhas, com a posição (1 = primeiro)."""
+        with self._lock:
+            return [
+                {"posicao": i, **self._linhas[user_id]}
+                for i, (_, _, user_id) in enumerate(self._ordem[:k], 1)
+            ]
+
+    def posicao(self, user_id: int):
+        """Posição do usuário no ranking, ou None se ele ainda não terminou nenhuma batalha."""
+        with self._lock:
+            linha = self._linhas.get(user_id)
+            if linha is None:
+                return None
+            return bisect.bisect_left(self._ordem, _chave(linha)) + 1
+
+    def __len__(self):
+        return len(self._ordem)
+
+    def iniciar(self, intervalo: float = 30):
+        """Relê as tabelas numa thread a cada `intervalo` segundos."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, args=(intervalo,), name="ranking", daemon=True)
+        self._thread.start()
+
+    def _loop(self, intervalo: float):
+        while True:
+            time.sleep(intervalo)
+            try:
+                self.recarregar()
+            except Exception:
+                logger.exception("falha ao reler as estatísticas")
+
+
+def _somar(totais: dict, batalha: dict):
+    t = totais.get(batalha["user_id"])
+    if t is None:
+        t = totais[batalha["user_id"]] = dict.fromkeys(COLUNAS, 0)
+        t["user_id"] = batalha["user_id"]
+    t["vitorias"] += batalha["vencedor"] == "player"
+    t["derrotas"] += batalha["vencedor"] == "monster"
+    t["batalhas"] += 1
+    t["turnos"] += batalha["turno"] - 1   # ataques: o turno começa em 1
+    t["ultima_batalha"] = max(t["ultima_batalha"], batalha["id"])
+
+
+def reconstruir(shards: Shards, caminho_arquivo: str = None) -> dict:
+    """
+    Recalcula estatisticas_usuarios de todos os shards numa passada pelas batalhas
+    terminadas (as quentes e as do arquivo frio, se houver); retorna user_id -> totais.
+    """
+    sql = "SELECT id, user_id, vencedor, turno FROM {} WHERE fase = 'ended'"
+    totais, quentes = {}, set()
+    for db in shards.bancos:
+        for batalha in db.iterar(sql.format("batalhas")):
+            _somar(totais, batalha)
+            quentes.add(batalha["id"])
+    if caminho_arquivo and os.path.exists(caminho_arquivo):
+        frio = Banco(caminho_arquivo, tamanho_pool=1)
+        for batalha in frio.iterar(sql.format("batalhas_arquivadas")):
+            # se o arquivamento caiu entre gravar no arquivo e apagar do quente, ela está nos dois
+            if batalha["id"] not in quentes:
+                _somar(totais, batalha)
+
+    por_banco = {db: [] for db in shards.bancos}
+    for t in totais.values():
+        por_banco[shards.do_usuario(t["user_id"])].append(tuple(t[c] for c in COLUNAS))
+    for db in shards.bancos:
+        with db.transacao():
+            db.execute("DELETE FROM estatisticas_usuarios")
+            db.executemany(
+                f"INSERT INTO estatisticas_usuarios ({', '.join(COLUNAS)}) VALUES ({', '.join('?' * len(COLUNAS))})",
+                por_banco[db],
+            )
+    return totais
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ranking dos jogadores; --reconstruir refaz as estatísticas")
+    parser.add_argument("--banco", default="app.db")
+    parser.add_argument("--shards", type=int, default=0, help="o SHARDS do servidor")
+    parser.add_argument("--pasta-shards", default="shards")
+    parser.add_argument("--arquivo", default="arquivo.db", help="arquivo frio das batalhas (arquivo.py)")
+    parser.add_argument("--reconstruir", action="store_true")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    db = Banco(args.banco)
+    migrar(db)
+    shards = Shards(db, args.shards, args.pasta_shards)
+    if args.reconstruir:
+        inicio = time.perf_counter()
+        totais = reconstruir(shards, args.arquivo)
+        print(f"{sum(t['batalhas'] for t in totais.values())} batalhas de {len(totais)} usuários "
+              f"em {time.perf_counter() - inicio:.2f}s")
+
+    ranking = Ranking(shards.bancos)
+    for linha in ranking.top(args.top):
+        print(f"{linha['posicao']:>4}. usuário {linha['user_id']}: {linha['vitorias']} vitórias, "
+              f"{linha['derrotas']} derrotas em {linha['batalhas']} batalhas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Ajustes no schema do app.db aplicados na subida do servidor.
+Cada passo verifica se já foi aplicado, então pode rodar toda vez.
+"""
+
+
+def _colunas(db, tabela: str) -> set:
+    return {c["name"] for c in db.execute("SELECT name FROM pragma_table_info(?)", tabela)}
+
+
+def migrar(db):
+    # filtros de /monstros; o id no fim do índice serve à paginação por cursor
+    db.execute("CREATE INDEX IF NOT EXISTS idx_monstros_tipo ON monstros (tipo, id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_monstros_hp ON monstros (hp, id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_monstros_ca ON monstros (ca, id)")
+
+    colunas = _colunas(db, "batalhas")
+    # semente e posição do fluxo de dados da batalha, para continuar e repetir as rolagens
+    if "seed" not in colunas:
+        db.execute("ALTER TABLE batalhas ADD COLUMN seed INTEGER")
+    if "rolagens" not in colunas:
+        db.execute("ALTER TABLE batalhas ADD COLUMN rolagens INTEGER NOT NULL DEFAULT 0")
+
+    # log de cada fase jogada, gravado junto com a batalha
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS batalha_eventos (
+          id          INTEGER PRIMARY KEY AUTOINCREMENT,
+          batalha_id  INTEGER NOT NULL,
+          seq         INTEGER NOT NULL,
+          acao        TEXT NOT NULL,
+          j_vida      INTEGER NOT NULL,
+          m_hp        INTEGER NOT NULL,
+          detalhes    TEXT NOT NULL,
+          created_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          UNIQUE (batalha_id, seq),
+          FOREIGN KEY (batalha_id) REFERENCES batalhas(id) ON DELETE CASCADE
+        )
+    """)
+
+    # cada fase jogada vira um evento; a linha de batalhas é só o retrato até evento_seq,
+    # e o estado atual é o do último evento depois dele (estado_batalhas.ler_batalhas)
+    colunas = _colunas(db, "batalha_eventos")
+    if "fase" not in colunas:
+        db.execute("ALTER TABLE batalha_eventos ADD COLUMN fase TEXT")
+    if "vencedor" not in colunas:
+        db.execute("ALTER TABLE batalha_eventos ADD COLUMN vencedor TEXT")
+    if "rolagens" not in colunas:
+        db.execute("ALTER TABLE batalha_eventos ADD COLUMN rolagens INTEGER")
+    if "turno" not in colunas:
+        db.execute("ALTER TABLE batalha_eventos ADD COLUMN turno INTEGER")
+    if "evento_seq" not in _colunas(db, "batalhas"):
+        db.execute("ALTER TABLE batalhas ADD COLUMN evento_seq INTEGER NOT NULL DEFAULT 0")
+        # os eventos que já existiam foram gravados junto com a batalha, então ela já os inclui
+        db.execute("""
+            UPDATE batalhas
+            SET evento_seq = (SELECT MAX(seq) FROM batalha_eventos WHERE batalha_id = batalhas.id)
+            WHERE id IN (SELECT batalha_id FROM batalha_eventos)
+        """)
+
+    # batalhas terminadas, na ordem em que ficam velhas para o arquivo.Arquivo; parcial,
+    # então só é mexido quando uma batalha termina
+    db.execute("CREATE INDEX IF NOT EXISTS idx_batalhas_terminadas ON batalhas (updated_at) WHERE fase = 'ended'")
+    # histórico do usuário (/batalhas/historico), do mais novo para o mais antigo
+    db.execute("CREATE INDEX IF NOT EXISTS idx_batalhas_usuario ON batalhas (user_id, id)")
+
+    # vitórias e derrotas por usuário (ranking.py), somadas quando uma batalha termina;
+    # na criação, vêm das batalhas terminadas que já existem. turnos soma os ataques
+    # (turno - 1, já que o turno começa em 1)
+    if not db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'estatisticas_usuarios'"):
+        db.execute("""
+            CREATE TABLE estatisticas_usuarios (
+              user_id         INTEGER PRIMARY KEY,
+              vitorias        INTEGER NOT NULL DEFAULT 0,
+              derrotas        INTEGER NOT NULL DEFAULT 0,
+              batalhas        INTEGER NOT NULL DEFAULT 0,
+              turnos          INTEGER NOT NULL DEFAULT 0,
+              ultima_batalha  INTEGER,
+              updated_at      TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        db.execute("""
+            INSERT INTO estatisticas_usuarios (user_id, vitorias, derrotas, batalhas, turnos, ultima_batalha)
+            SELECT user_id, SUM(vencedor = 'player'), SUM(vencedor = 'monster'), COUNT(*), SUM(turno - 1), MAX(id)
+            FROM batalhas WHERE fase = 'ended' GROUP BY user_id
+        """)
+
+
+def criar_shard(db):
+    """
+    Tabelas de um shard (shards.py): fichas e batalhas dos usuários dele e a réplica dos
+    monstros. Iguais às do app.db, sem as FOREIGN KEY para users e monstros, que ficam no
+    catálogo; depois o migrar() deixa o shard com as mesmas colunas e índices.
+    """
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS fichas (
+          id            INTEGER PRIMARY KEY AUTOINCREMENT,
+          user_id       INTEGER NOT NULL UNIQUE,
+          nome          TEXT NOT NULL,
+          raca          TEXT NOT NULL,
+          classe        TEXT NOT NULL,
+          forca         INTEGER NOT NULL,
+          constituicao  INTEGER NOT NULL,
+          destreza      INTEGER NOT NULL,
+          inteligencia  INTEGER NOT NULL,
+          sabedoria     INTEGER NOT NULL,
+          carisma       INTEGER NOT NULL,
+          vida          INTEGER NOT NULL,
+          ca            INTEGER NOT NULL,
+          iniciativa    INTEGER DEFAULT 0,
+          created_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          updated_at    TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS monstros (
+          id          INTEGER PRIMARY KEY AUTOINCREMENT,
+          nome        TEXT NOT NULL,
+          tipo        TEXT NOT NULL DEFAULT 'Molodoy',
+          hp          INTEGER NOT NULL,
+          ca          INTEGER NOT NULL,
+          created_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS batalhas (
+          id          INTEGER PRIMARY KEY AUTOINCREMENT,
+          user_id     INTEGER NOT NULL,
+          monstro_id  INTEGER NOT NULL,
+          j_vida      INTEGER NOT NULL,
+          m_hp        INTEGER NOT NULL,
+          fase        TEXT NOT NULL DEFAULT 'initiative',
+          turno       INTEGER NOT NULL DEFAULT 1,
+          vencedor    TEXT,
+          created_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          updated_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    migrar(db)
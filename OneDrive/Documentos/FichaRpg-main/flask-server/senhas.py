@@ -0,0 +1,79 @@
+"""
+Hash de senhas com PBKDF2-SHA256 (hashlib), rodando num pool de threads limitado.
+
+O hashlib solta o GIL durante o PBKDF2, então as threads do pool usam os outros
+núcleos enquanto os workers do Flask continuam atendendo. O pool tem um limite de
+pedidos pendentes e cada pedido um tempo máximo: numa rajada de logins quem não
+couber recebe SenhasOcupadas em vez de travar um worker.
+
+Formato gravado em password_hash: pbkdf2_sha256$<iterações>$<salt b64>$<hash b64>.
+Linhas antigas com a senha em texto puro continuam valendo e são trocadas pelo hash
+no próximo login (precisa_rehash).
+"""
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+ALGORITMO = "pbkdf2_sha256"
+CUSTO_PADRAO = 600_000     # iterações; recomendação atual do OWASP para PBKDF2-SHA256
+
+
+class SenhasOcupadas(Exception):
+    """Fila do pool cheia ou o hash não terminou dentro do tempo máximo."""
+
+
+def gerar_hash(senha: str, custo: int = CUSTO_PADRAO) -> str:
+    salt = os.urandom(16)
+    dk = hashlib.pbkdf2_hmac("sha256", senha.encode(), salt, custo)
+    return f"{ALGORITMO}${custo}${base64.b64encode(salt).decode()}${base64.b64encode(dk).decode()}"
+
+
+def conferir(senha: str, armazenado: str) -> bool:
+    if not armazenado.startswith(ALGORITMO + "$"):
+        # linha antiga, senha em texto puro
+        return hmac.compare_digest(senha.encode(), armazenado.encode())
+    _, custo, salt, esperado = armazenado.split("$")
+    dk = hashlib.pbkdf2_hmac("sha256", senha.encode(), base64.b64decode(salt), int(custo))
+    return hmac.compare_digest(dk, base64.b64decode(esperado))
+
+
+def precisa_rehash(armazenado: str, custo: int = CUSTO_PADRAO) -> bool:
+    """Texto puro ou hash com menos iterações que o custo atual."""
+    if not armazenado.startswith(ALGORITMO + "$"):
+        return True
+    return int(armazenado.split("$")[1]) < custo
+
+
+class PoolSenhas:
+    def __init__(self, workers: int = None, custo: int = CUSTO_PADRAO, timeout: float = 5.0, max_fila: int = 64):
+        self.custo = custo
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1, thread_name_prefix="senhas")
+        self._vagas = threading.BoundedSemaphore(max_fila)
+
+    def _rodar(self, funcao, *args):
+        if not self._vagas.acquire(blocking=False):
+            raise SenhasOcupadas("fila de hash cheia")
+        try:
+            futuro = self._executor.submit(funcao, *args)
+        except Exception:
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        try:
+            return futuro.result(timeout=self.timeout)
+        except TimeoutError:
+            futuro.cancel()
+            raise SenhasOcupadas("hash demorou demais")
+
+    def gerar_hash(self, senha: str) -> str:
+        return self._rodar(gerar_hash, senha, self.custo)
+
+    def conferir(self, senha: str, armazenado: str) -> bool:
+        return self._rodar(conferir, senha, armazenado)
+
+    def precisa_rehash(self, armazenado: str) -> bool:
+        return precisa_rehash(armazenado, self.custo)
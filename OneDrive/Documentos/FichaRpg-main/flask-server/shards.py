@@ -0,0 +1,332 @@
+"""
+Fichas e batalhas divididas por usuário em vários arquivos SQLite (SHARDS=N).
+
+Com um arquivo só, todo INSERT em batalhas e todo evento de turno esperam pela mesma
+trava de escrita do SQLite. Com shards, users e monstros continuam no app.db (o
+catálogo) e o que é de cada usuário (fichas, batalhas, batalha_eventos,
+estatisticas_usuarios) vai para
+shards/shard<i>.db:
+
+    balde = user_id % BALDES        ids sequenciais, então o módulo já espalha por igual
+    shard = shard_baldes[balde]     tabela no catálogo; começa com balde % N
+
+O id de uma batalha cai no balde do dono (id % BALDES == user_id % BALDES), então as
+rotas que só recebem battle_id acham o shard sem consultar nada. Cada shard dá ids no
+bloco de BALDES seguinte ao maior id que ele já usou (sqlite_sequence).
+
+Cada shard tem uma réplica só de leitura dos monstros, preenchida na primeira vez que
+uma batalha do shard usa o monstro, para a batalha carregar sem ir ao catálogo. users
+não é replicado: nada no shard lê usuário.
+
+Sem SHARDS (ou com SHARDS=0) tudo fica no app.db, como antes, e Shards devolve o
+catálogo para qualquer usuário ou batalha.
+
+Passar para shards ou mudar o número deles é feito com o servidor parado:
+
+    python shards.py --shards 4 [--banco app.db] [--pasta shards] [--arquivo arquivo.db]
+    python shards.py --replicas          # relê do catálogo os monstros das réplicas
+
+Na primeira vez as fichas e batalhas do app.db vão para os shards e as batalhas são
+renumeradas (id * BALDES + balde, também no arquivo frio). Depois, só os baldes que
+mudaram de shard são copiados. Cada balde é copiado e marcado no catálogo, e só no fim
+as linhas que ficaram no shard errado são apagadas; se cair no meio, é só rodar de novo.
+"""
+import argparse
+import os
+import time
+
+from banco import Banco
+from schema import criar_shard, migrar
+
+BALDES = 256
+
+_INSERT_BATALHA = """
+    INSERT INTO batalhas (id, user_id, monstro_id, j_vida, m_hp, fase, turno, seed, rolagens)
+    VALUES ({id}, ?, ?, ?, ?, 'initiative', 1, ?, 0)
+"""
+# no shard: o próximo bloco de BALDES acima do maior id que o shard já deu, no balde do dono
+_PROXIMO_ID = f"(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'batalhas'), 0) / {BALDES} + 1) * {BALDES} + ?"
+
+
+def caminho_shard(pasta: str, i: int) -> str:
+    return os.path.join(pasta, f"shard{i}.db")
+
+
+def ler_mapa(catalogo) -> list:
+    """Shard de cada balde (índice = balde); vazio quando os dados ainda estão só no catálogo."""
+    catalogo.execute("CREATE TABLE IF NOT EXISTS shard_baldes (balde INTEGER PRIMARY KEY, shard INTEGER NOT NULL)")
+    return [linha["shard"] for linha in catalogo.execute("SELECT shard FROM shard_baldes ORDER BY balde")]
+
+
+def _gravar_mapa(catalogo, mapa: list):
+    with catalogo.transacao():
+        catalogo.executemany("INSERT OR REPLACE INTO shard_baldes (balde, shard) VALUES (?, ?)", enumerate(mapa))
+
+
+def _tem_dados_de_usuario(db) -> bool:
+    return bool(db.execute("SELECT EXISTS (SELECT 1 FROM fichas) OR EXISTS (SELECT 1 FROM batalhas) AS tem")[0]["tem"])
+
+
+class Shards:
+    def __init__(self, catalogo, n: int = 0, pasta: str = "shards"):
+        self.catalogo = catalogo
+        mapa = ler_mapa(catalogo)
+        em_uso = max(mapa) + 1 if mapa else 0
+        if not n:
+            if em_uso:
+                raise RuntimeError(f"as fichas e batalhas estão em {em_uso} shards; defina SHARDS={em_uso}")
+            self.bancos = [catalogo]
+            self._mapa = [0] * BALDES
+            return
+
+        if not mapa:
+            if _tem_dados_de_usuario(catalogo):
+                raise RuntimeError(f"há fichas e batalhas no app.db; rode python shards.py --shards {n} para movê-las")
+            mapa = [balde % n for balde in range(BALDES)]
+            _gravar_mapa(catalogo, mapa)
+        elif em_uso != n:
+            raise RuntimeError(f"os baldes estão em {em_uso} shards; rode python shards.py --shards {n} "
+                               f"ou defina SHARDS={em_uso}")
+        os.makedirs(pasta, exist_ok=True)
+        self.bancos = [Banco(caminho_shard(pasta, i)) for i in range(n)]
+        for db in self.bancos:
+            criar_shard(db)
+        self._mapa = mapa
+
+    @property
+    def ativo(self) -> bool:
+        return self.bancos[0] is not self.catalogo
+
+    def todos(self) -> list:
+        """Catálogo e shards, cada Banco uma vez."""
+        return [self.catalogo] + [db for db in self.bancos if db is not self.catalogo]
+
+    def do_usuario(self, user_id: int):
+        return self.bancos[self._mapa[user_id % BALDES]]
+
+    def da_batalha(self, battle_id: int):
+        return self.bancos[self._mapa[battle_id % BALDES]]
+
+    def agrupar(self, battle_ids) -> list:
+        """[(banco, [battle_id, ...])], uma entrada por shard com batalhas na lista."""
+        grupos = {}
+        for battle_id in battle_ids:
+            grupos.setdefault(self._mapa[battle_id % BALDES], []).append(battle_id)
+        return [(self.bancos[i], ids) for i, ids in grupos.items()]
+
+    def inserir_batalha(self, user_id: int, monstro_id: int, j_vida: int, m_hp: int, seed: int) -> int:
+        """Cria a batalha no shard do usuário e devolve o id."""
+        db = self.do_usuario(user_id)
+        if not self.ativo:
+            return db.execute(_INSERT_BATALHA.format(id="NULL"), user_id, monstro_id, j_vida, m_hp, seed)
+        return db.execute(_INSERT_BATALHA.format(id=_PROXIMO_ID), user_id % BALDES, user_id, monstro_id,
+                          j_vida, m_hp, seed)
+
+    def monstros(self, db, monstro_ids) -> dict:
+        """id -> linha do monstro, pela réplica do shard; os que faltam vêm do catálogo e entram nela."""
+        monstro_ids = list(set(monstro_ids))
+        if not monstro_ids:
+            return {}
+        sql = f"SELECT * FROM monstros WHERE id IN ({','.join('?' * len(monstro_ids))})"
+        achados = {r["id"]: r for r in db.execute(sql, *monstro_ids)}
+        faltam = [i for i in monstro_ids if i not in achados]
+        if faltam and db is not self.catalogo:
+            linhas = self.catalogo.execute(f"SELECT * FROM monstros WHERE id IN ({','.join('?' * len(faltam))})",
+                                           *faltam)
+            if linhas:
+                _copiar(db, "monstros", linhas)
+                achados.update((r["id"], r) for r in linhas)
+        return achados
+
+
+def _copiar(db, tabela: str, linhas: list, sem: tuple = ()):
+    """INSERT OR REPLACE das linhas (dicts) na tabela, sem as colunas em `sem`."""
+    if not linhas:
+        return
+    colunas = [c for c in linhas[0] if c not in sem]
+    db.executemany(
+        f"INSERT OR REPLACE INTO {tabela} ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})",
+        [tuple(linha[c] for c in colunas) for linha in linhas],
+    )
+
+
+# ---------------------- migração e redistribuição ----------------------
+def _mover_do_catalogo(catalogo, bancos: list, mapa: list) -> int:
+    """Copia fichas e batalhas do catálogo para os shards, com as batalhas renumeradas; retorna quantas batalhas."""
+    fichas = catalogo.execute("SELECT * FROM fichas")
+    batalhas = catalogo.execute("SELECT * FROM batalhas")
+    dono = {b["id"]: b["user_id"] for b in batalhas}
+    eventos = catalogo.execute("SELECT * FROM batalha_eventos")
+    estatisticas = catalogo.execute("SELECT * FROM estatisticas_usuarios")
+    for b in batalhas:
+        b["id"] = b["id"] * BALDES + b["user_id"] % BALDES
+    for e in eventos:
+        e["batalha_id"] = e["batalha_id"] * BALDES + dono[e["batalha_id"]] % BALDES
+    for t in estatisticas:
+        if t["ultima_batalha"] is not None:
+            t["ultima_batalha"] = t["ultima_batalha"] * BALDES + t["user_id"] % BALDES
+
+    for i, db in enumerate(bancos):
+        with db.transacao():
+            _copiar(db, "fichas", [f for f in fichas if mapa[f["user_id"] % BALDES] == i], sem=("id",))
+            _copiar(db, "batalhas", [b for b in batalhas if mapa[b["id"] % BALDES] == i])
+            _copiar(db, "batalha_eventos", [e for e in eventos if mapa[e["batalha_id"] % BALDES] == i], sem=("id",))
+            _copiar(db, "estatisticas_usuarios", [t for t in estatisticas if mapa[t["user_id"] % BALDES] == i])
+    return len(batalhas)
+
+
+def _renumerar_arquivo(caminho: str) -> int:
+    """Renumera as batalhas do arquivo frio como as do catálogo (uma vez só); retorna quantas."""
+    frio = Banco(caminho, tamanho_pool=1)
+    tabelas = {r["name"] for r in frio.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    if "batalhas_arquivadas" not in tabelas:
+        return 0
+    frio.execute("CREATE TABLE IF NOT EXISTS shard_renumeracao (baldes INTEGER NOT NULL)")
+    if frio.execute("SELECT baldes FROM shard_renumeracao"):
+        return 0
+    total = frio.execute("SELECT COUNT(*) AS n FROM batalhas_arquivadas")[0]["n"]
+
+    # negativos primeiro, para um id novo não bater num antigo ainda não renumerado
+    with frio.transacao():
+        frio.execute(f"""
+            UPDATE eventos_arquivados SET batalha_id = -(batalha_id * {BALDES} + (
+              SELECT a.user_id % {BALDES} FROM batalhas_arquivadas a WHERE a.id = eventos_arquivados.batalha_id))
+        """)
+        frio.execute(f"UPDATE batalhas_arquivadas SET id = -(id * {BALDES} + user_id % {BALDES})")
+        frio.execute("UPDATE eventos_arquivados SET batalha_id = -batalha_id")
+        frio.execute("UPDATE batalhas_arquivadas SET id = -id")
+        frio.execute("INSERT INTO shard_renumeracao (baldes) VALUES (?)", BALDES)
+    return total
+
+
+def _mover_balde(origem, destino, balde: int) -> int:
+    """Copia as linhas do balde para o destino (a origem é limpa depois); retorna quantas batalhas."""
+    fichas = origem.execute(f"SELECT * FROM fichas WHERE user_id % {BALDES} = ?", balde)
+    batalhas = origem.execute(f"SELECT * FROM batalhas WHERE id % {BALDES} = ?", balde)
+    eventos = origem.execute(f"SELECT * FROM batalha_eventos WHERE batalha_id % {BALDES} = ?", balde)
+    estatisticas = origem.execute(f"SELECT * FROM estatisticas_usuarios WHERE user_id % {BALDES} = ?", balde)
+    # ids de fichas e eventos são de cada arquivo: o destino dá outros
+    with destino.transacao():
+        _copiar(destino, "fichas", fichas, sem=("id",))
+        _copiar(destino, "batalhas", batalhas)
+        _copiar(destino, "batalha_eventos", eventos, sem=("id",))
+        _copiar(destino, "estatisticas_usuarios", estatisticas)
+    return len(batalhas)
+
+
+def _limpar(db, baldes: list):
+    """Apaga do shard as linhas dos baldes que não são mais dele."""
+    if not baldes:
+        return
+    marcas = ",".join("?" * len(baldes))
+    with db.transacao():
+        db.execute(f"DELETE FROM batalha_eventos WHERE batalha_id % {BALDES} IN ({marcas})", *baldes)
+        db.execute(f"DELETE FROM batalhas WHERE id % {BALDES} IN ({marcas})", *baldes)
+        db.execute(f"DELETE FROM fichas WHERE user_id % {BALDES} IN ({marcas})", *baldes)
+        db.execute(f"DELETE FROM estatisticas_usuarios WHERE user_id % {BALDES} IN ({marcas})", *baldes)
+
+
+def _sequencia(db) -> int:
+    rows = db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'batalhas'")
+    return rows[0]["seq"] if rows else 0
+
+
+def _igualar_sequencias(catalogo, bancos: list):
+    """
+    Todo shard passa a dar ids acima do maior id já usado em qualquer um (e das batalhas
+    renumeradas do catálogo), para um balde que mudou de shard não repetir o id de uma
+    batalha dele que já foi para o arquivo frio.
+    """
+    topo = max([_sequencia(db) for db in bancos] + [_sequencia(catalogo) * BALDES + BALDES - 1])
+    for db in bancos:
+        if not db.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'batalhas'", topo):
+            db.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('batalhas', ?)", topo)
+
+
+def redistribuir(catalogo, pasta: str, n: int, caminho_arquivo: str = None) -> dict:
+    """Deixa as fichas e batalhas em n shards, de onde estiverem; retorna o que foi movido."""
+    migrar(catalogo)
+    mapa = ler_mapa(catalogo)
+    antes = max(mapa) + 1 if mapa else 0
+    novo = [balde % n for balde in range(BALDES)]
+    os.makedirs(pasta, exist_ok=True)
+    bancos = [Banco(caminho_shard(pasta, i)) for i in range(max(n, antes))]
+    for db in bancos:
+        criar_shard(db)
+
+    resultado = {"antes": antes, "depois": n, "baldes": 0, "batalhas": 0, "arquivadas": 0}
+    if not mapa:
+        if caminho_arquivo and os.path.exists(caminho_arquivo):
+            resultado["arquivadas"] = _renumerar_arquivo(caminho_arquivo)
+        resultado["batalhas"] = _mover_do_catalogo(catalogo, bancos, novo)
+        resultado["baldes"] = BALDES
+        _gravar_mapa(catalogo, novo)
+    else:
+        for balde, (de, para) in enumerate(zip(mapa, novo)):
+            if de == para:
+                continue
+            resultado["batalhas"] += _mover_balde(bancos[de], bancos[para], balde)
+            catalogo.execute("UPDATE shard_baldes SET shard = ? WHERE balde = ?", para, balde)
+            resultado["baldes"] += 1
+
+    # o catálogo só guarda users e monstros
+    with catalogo.transacao():
+        catalogo.execute("DELETE FROM batalha_eventos")
+        catalogo.execute("DELETE FROM batalhas")
+        catalogo.execute("DELETE FROM fichas")
+        catalogo.execute("DELETE FROM estatisticas_usuarios")
+    for i, db in enumerate(bancos):
+        _limpar(db, [balde for balde in range(BALDES) if novo[balde] != i])
+    _igualar_sequencias(catalogo, bancos)
+    return resultado
+
+
+def atualizar_replicas(catalogo, pasta: str) -> int:
+    """Relê do catálogo os monstros de cada réplica (os apagados saem); retorna quantos shards."""
+    mapa = ler_mapa(catalogo)
+    n = max(mapa) + 1 if mapa else 0
+    for i in range(n):
+        db = Banco(caminho_shard(pasta, i))
+        ids = [r["id"] for r in db.execute("SELECT id FROM monstros")]
+        linhas = []
+        for inicio in range(0, len(ids), 500):
+            parte = ids[inicio:inicio + 500]
+            linhas += catalogo.execute(f"SELECT * FROM monstros WHERE id IN ({','.join('?' * len(parte))})", *parte)
+        with db.transacao():
+            db.execute("DELETE FROM monstros")
+            _copiar(db, "monstros", linhas)
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move fichas e batalhas entre o app.db e os shards")
+    parser.add_argument("--shards", type=int, help="número de shards desejado (1 ou mais)")
+    parser.add_argument("--replicas", action="store_true", help="atualiza as réplicas de monstros dos shards")
+    parser.add_argument("--banco", default="app.db")
+    parser.add_argument("--pasta", default="shards")
+    parser.add_argument("--arquivo", default="arquivo.db", help="arquivo frio, renumerado na primeira migração")
+    args = parser.parse_args()
+    if not args.replicas and (args.shards is None or args.shards < 1):
+        parser.error("informe --shards N (N >= 1) ou --replicas")
+
+    catalogo = Banco(args.banco)
+    if args.replicas:
+        print(f"réplicas de {atualizar_replicas(catalogo, args.pasta)} shards atualizadas")
+        return
+
+    inicio = time.perf_counter()
+    r = redistribuir(catalogo, args.pasta, args.shards, args.arquivo)
+    print(f"{r['antes'] or 'app.db'} -> {r['depois']} shards: {r['baldes']} baldes, {r['batalhas']} batalhas movidas"
+          + (f", {r['arquivadas']} arquivadas renumeradas" if r["arquivadas"] else "")
+          + f" em {time.perf_counter() - inicio:.2f}s")
+    for i in range(r["depois"]):
+        db = Banco(caminho_shard(args.pasta, i), tamanho_pool=1)
+        fichas = db.execute("SELECT COUNT(*) AS n FROM fichas")[0]["n"]
+        batalhas = db.execute("SELECT COUNT(*) AS n FROM batalhas")[0]["n"]
+        print(f"  {caminho_shard(args.pasta, i)}: {fichas} fichas, {batalhas} batalhas")
+    for i in range(r["depois"], r["antes"]):
+        print(f"  {caminho_shard(args.pasta, i)} ficou vazio e pode ser apagado")
+
+
+if __name__ == "__main__":
+    main()
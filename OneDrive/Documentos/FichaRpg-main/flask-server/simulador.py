@@ -0,0 +1,73 @@
+"""
+Simulação Monte Carlo de batalhas Ficha x Monstro.
+
+Segue as mesmas regras das rotas /batalha/*: iniciativa (d20 + mod. de destreza
+do jogador >= d20 do monstro, empate para o jogador), d20 contra a CA, 1 natural
+erra, 20 natural acerta e dobra o dano, e a vida não passa de zero. Em vez de rolar
+dado a dado com Dados.rolar, cada turno rola de uma vez para todas as batalhas
+ainda em andamento usando arrays do NumPy.
+"""
+import numpy as np
+
+from back_end import Ficha, Monstros
+
+MAX_SIMULACOES = 200_000
+MAX_TURNOS = 1000   # trava de segurança; na prática as lutas acabam bem antes
+
+
+def _ataques(rng, qtd_ataques, perfil):
+    """Rola qtd_ataques ataques de uma vez e devolve o dano de cada um (0 quando erra)."""
+    d20 = rng.integers(1, 21, qtd_ataques)
+    crit = d20 == 20
+    acertou = (d20 != 1) & (crit | (d20 + perfil["bonus_ataque"] >= perfil["ca_alvo"]))
+
+    dano = rng.integers(1, perfil["dado"] + 1, (qtd_ataques, perfil["qtd"])).sum(axis=1) + perfil["bonus_dano"]
+    dano = np.maximum(dano, 0)
+    dano[crit] *= 2
+    return np.where(acertou, dano, 0)
+
+
+def simular(ficha: Ficha, monstro: Monstros, n: int = 10000, seed=None) -> dict:
+    """
+    Simula n batalhas completas entre a ficha e o monstro, partindo da vida/hp atuais.
+    Retorna a chance de vitória, a média de turnos e rodadas e a distribuição da
+    vida que sobra para cada lado (índice = vida restante, valor = probabilidade).
+    """
+    rng = np.random.default_rng(seed)
+    jogador = ficha.perfil_ataque(monstro)
+    inimigo = monstro.perfil_ataque(ficha)
+
+    j_vida = np.full(n, ficha.vida, dtype=np.int64)
+    m_hp = np.full(n, monstro.hp, dtype=np.int64)
+    turnos = np.zeros(n, dtype=np.int64)
+
+    # iniciativa, igual a batalha_roll_initiative
+    vez_jogador = rng.integers(1, 21, n) + ficha.destreza.modificador >= rng.integers(1, 21, n)
+
+    ativas = np.flatnonzero((j_vida > 0) & (m_hp > 0))
+    for _ in range(MAX_TURNOS):
+        if ativas.size == 0:
+            break
+        atacam = vez_jogador[ativas]
+        jog = ativas[atacam]
+        mon = ativas[~atacam]
+
+        m_hp[jog] = np.maximum(m_hp[jog] - _ataques(rng, jog.size, jogador), 0)
+        j_vida[mon] = np.maximum(j_vida[mon] - _ataques(rng, mon.size, inimigo), 0)
+
+        turnos[ativas] += 1
+        vez_jogador[ativas] = ~atacam
+        ativas = ativas[(j_vida[ativas] > 0) & (m_hp[ativas] > 0)]
+
+    vitorias = m_hp == 0
+    derrotas = j_vida == 0
+    return {
+        "simulacoes": n,
+        "vitoria_jogador": float(vitorias.mean()),
+        "vitoria_monstro": float(derrotas.mean()),
+        "inconclusivas": int(n - vitorias.sum() - derrotas.sum()),
+        "turnos_medios": float(turnos.mean()),
+        "rodadas_medias": float(((turnos + 1) // 2).mean()),
+        "vida_restante_jogador": (np.bincount(j_vida, minlength=ficha.vida + 1) / n).tolist(),
+        "hp_restante_monstro": (np.bincount(m_hp, minlength=monstro.hp + 1) / n).tolist(),
+    }
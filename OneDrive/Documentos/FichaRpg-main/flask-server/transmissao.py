@@ -0,0 +1,109 @@
+"""
+Pub/sub em memória das mudanças de cada batalha, para o /batalha/<id>/stream (SSE).
+
+As rotas de turno publicam cada fase jogada; cada mensagem é formatada como evento
+SSE uma vez só e entregue a todos os assinantes daquela batalha. Há dois tipos de
+assinatura: com fila de thread (rota do Flask, uma thread por conexão) e com fila
+do asyncio (modo ASGI, onde milhares de conexões paradas custam só uma corrotina).
+
+Assinante lento não segura a publicação: quando a fila dele enche, as mensagens
+novas são descartadas para ele. A final (batalha terminou) sempre entra, no lugar da
+mais antiga, para o stream fechar.
+"""
+import asyncio
+import json
+import queue
+import threading
+
+MAX_FILA = 256
+
+
+def formatar(tipo: str, dados: dict) -> bytes:
+    return f"event: {tipo}\ndata: {json.dumps(dados, separators=(',', ':'))}\n\n".encode()
+
+
+class AssinaturaThread:
+    def __init__(self, battle_id: int):
+        self.battle_id = battle_id
+        self._fila = queue.Queue(maxsize=MAX_FILA)
+
+    def entregar(self, mensagem):
+        while True:
+            try:
+                self._fila.put_nowait(mensagem)
+                return
+            except queue.Full:
+                if not mensagem[1]:
+                    return
+            # a final não pode se perder: abre espaço descartando a mais antiga
+            try:
+                self._fila.get_nowait()
+            except queue.Empty:
+                pass
+
+    def proxima(self, timeout: float):
+        """(bytes, final) da próxima mensagem, ou None se nada chegou dentro do timeout."""
+        try:
+            return self._fila.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AssinaturaAsync:
+    def __init__(self, battle_id: int, loop: asyncio.AbstractEventLoop):
+        self.battle_id = battle_id
+        self._loop = loop
+        self._fila = asyncio.Queue(maxsize=MAX_FILA)
+
+    def entregar(self, mensagem):
+        # publicado pelas threads das rotas; a fila do asyncio só pode ser mexida no loop dela
+        self._loop.call_soon_threadsafe(self._colocar, mensagem)
+
+    def _colocar(self, mensagem):
+        if self._fila.full():
+            if not mensagem[1]:
+                return
+            # só o loop mexe nesta fila, então a vaga aberta aqui é da final
+            self._fila.get_nowait()
+        self._fila.put_nowait(mensagem)
+
+    async def proxima(self, timeout: float):
+        try:
+            return await asyncio.wait_for(self._fila.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class Hub:
+    def __init__(self):
+        self._assinantes = {}   # battle_id -> set de assinaturas
+        self._lock = threading.Lock()
+
+    def assinar(self, battle_id: int, loop: asyncio.AbstractEventLoop = None):
+        assinatura = AssinaturaAsync(battle_id, loop) if loop else AssinaturaThread(battle_id)
+        with self._lock:
+            self._assinantes.setdefault(battle_id, set()).add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self._lock:
+            assinantes = self._assinantes.get(assinatura.battle_id)
+            if assinantes is not None:
+                assinantes.discard(assinatura)
+                if not assinantes:
+                    del self._assinantes[assinatura.battle_id]
+
+    def publicar(self, battle_id: int, tipo: str, dados: dict, final: bool = False) -> int:
+        """Entrega o evento a quem assina a batalha; final=True avisa que a batalha acabou."""
+        with self._lock:
+            assinantes = list(self._assinantes.get(battle_id, ()))
+        if not assinantes:
+            return 0
+        mensagem = (formatar(tipo, dados), final)
+        for assinatura in assinantes:
+            assinatura.entregar(mensagem)
+        return len(assinantes)
+
+    def total_assinantes(self) -> int:
+        with self._lock:
+            return sum(len(a) for a in self._assinantes.values())